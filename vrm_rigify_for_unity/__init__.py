@@ -16,14 +16,21 @@ bl_info = {
     "category": "Rigging",
 }
 
+import os
+import tempfile
+
 import bpy
 from bpy.types import Operator, Panel
-from bpy.props import BoolProperty, StringProperty, FloatProperty
+from bpy.props import BoolProperty, EnumProperty, StringProperty, FloatProperty, IntProperty
 
-# Import functions from vrm_rigify module
-from . import vrm_rigify
+# Import addon modules
 from . import bone_constraint_utils
 from . import constraint_driver_utils
+from . import conversion_diagnostics
+from . import conversion_logger
+from . import conversion_pipeline
+from . import conversion_profiler
+from . import rig_cache
 
 
 #################################################
@@ -60,6 +67,110 @@ class VRM_OT_ToRigify(Operator):
         default=True
     )
     
+    constraint_influence_mode: EnumProperty(
+        name="Influence Control",
+        description="How the influence of the DEF bones constraints is controlled",
+        items=[
+            ('DRIVER', "Drivers", "Add a driver to every DEF constraint (can be animated)"),
+            ('PROPERTY', "Property", "Write the influence from a single property update, "
+                                     "so no drivers are evaluated during playback"),
+        ],
+        default='DRIVER'
+    )
+    
+    mesh_mode: EnumProperty(
+        name="Meshes",
+        description="How the meshes of the VRM model are attached to the Rigify rig",
+        items=[
+            ('COPY', "Copy", "Parent copies of the meshes to the rig and keep the original model intact"),
+            ('MOVE', "Move", "Re-parent the original meshes to the rig without copying them, "
+                             "so the scene and the .blend file do not grow"),
+        ],
+        default='COPY'
+    )
+    
+    merge_orphan_weights: BoolProperty(
+        name="Merge Orphan Weights",
+        description="Merge the weights of vertex groups whose bone is not in the rig "
+                    "into the nearest deforming parent bone",
+        default=False
+    )
+    
+    max_bone_influences: IntProperty(
+        name="Max Bone Influences",
+        description="Keep at most this many bone weights per vertex, like Unity's skin weights setting "
+                    "(4 for the default quality, 2 for mobile). 0 keeps all weights",
+        default=0,
+        min=0,
+        max=8
+    )
+    
+    min_bone_weight: FloatProperty(
+        name="Min Bone Weight",
+        description="Remove bone weights below this value (the strongest weight of each vertex is kept)",
+        default=0.0,
+        min=0.0,
+        max=1.0
+    )
+    
+    remove_empty_vertex_groups: BoolProperty(
+        name="Remove Empty Vertex Groups",
+        description="Remove the bone vertex groups that have no weight on their mesh",
+        default=False
+    )
+    
+    disable_unweighted_bones: BoolProperty(
+        name="Disable Unweighted Bones",
+        description="Turn off Deform on leaf deform bones that have no weight on any mesh, "
+                    "so they are not counted as skinned mesh bones in Unity",
+        default=False
+    )
+    
+    max_bones_per_mesh: IntProperty(
+        name="Max Bones Per Mesh",
+        description="Split meshes that reference more bones than this into parts within the budget. "
+                    "0 keeps the meshes as they are",
+        default=0,
+        min=0
+    )
+    
+    use_metarig_cache: BoolProperty(
+        name="Use Metarig Cache",
+        description="Clone a cached metarig with humanoid bones already assigned instead of creating a new one",
+        default=True
+    )
+    
+    use_rig_cache: BoolProperty(
+        name="Use Rig Cache",
+        description="Reuse a cached Rigify rig generated from an identical metarig instead of regenerating it",
+        default=True
+    )
+    
+    strip_face_before_generate: BoolProperty(
+        name="Strip Face Before Generate",
+        description="Remove the face bones except the eyes from the metarig before generating, "
+                    "so Rigify skips the face rig that is removed afterwards",
+        default=False
+    )
+    
+    profile_conversion: BoolProperty(
+        name="Profile Conversion",
+        description="Print per-stage timing to the console and save it as a JSON report",
+        default=False
+    )
+    
+    save_conversion_log: BoolProperty(
+        name="Save Conversion Log",
+        description="Write the full conversion log, including per-bone messages, to a .log file",
+        default=False
+    )
+    
+    save_diagnostics: BoolProperty(
+        name="Save Diagnostics",
+        description="Build a bone mapping diagnostics report and save it as a .diagnostics.json file",
+        default=False
+    )
+    
     @classmethod
     def poll(cls, context):
         # アクティブオブジェクトがアーマチュアかどうかをチェック
@@ -68,95 +179,53 @@ class VRM_OT_ToRigify(Operator):
     def execute(self, context):
         # 現在のアクティブオブジェクト（VRMモデル）を取得
         vrm_object = context.active_object
+        profiler = conversion_profiler.StageProfiler(vrm_object.name)
+        
+        # レポートの出力先（保存済みの.blendと同じフォルダ、未保存なら一時フォルダ）
+        output_dir = bpy.path.abspath("//") if bpy.data.filepath else tempfile.gettempdir()
+        output_base = os.path.join(output_dir, bpy.path.clean_name(vrm_object.name))
+        log_path = f"{output_base}.log" if self.save_conversion_log else None
+        diagnostics = (conversion_diagnostics.ConversionDiagnostics(vrm_object.name)
+                       if self.save_diagnostics else None)
         
         try:
-            # オリジナルのボーン名を保存
-            original_bone_names = vrm_rigify.store_original_bone_names(vrm_object)
-            
-            # メインの変換プロセスを実行
-            vrm_rigify.rename_vrm_model_bones_name(vrm_object)
-            
-            # 標準化後のボーン名とオリジナルボーン名のマッピングを更新
-            bone_name_mapping = vrm_rigify.update_bone_name_mapping_after_rename(
-                vrm_object, original_bone_names)
-            
-            # debug
-            vrm_rigify.debug_bone_name_mapping(original_bone_names, bone_name_mapping, vrm_object)
-            
-            # メタリグを生成
-            metarig_name = f"{vrm_object.name}.metarig"
-            metarig = vrm_rigify.generate_template_metarig(metarig_name)
-            
-            # ボーンのマッピングと位置合わせ
-            bone_mapping = vrm_rigify.mapping_metarig_and_vrm_model_bones(metarig, vrm_object)
-            vrm_rigify.remove_or_log_unmapped_metarig_bones(metarig, bone_mapping)
-            vrm_rigify.position_metarig_bones_to_vrm_model(metarig, vrm_object, bone_mapping)
-            
-            # メタリグの調整
-            vrm_rigify.adjust_position_of_metarig_spine_bones(metarig)
-            vrm_rigify.Modify_metarig_limb_rotation_axes(metarig)
-            vrm_rigify.modify_metarig_arm_hand_finger_rotation(metarig)
-            vrm_rigify.modify_metarig_limb_segments(metarig)
-            
-            # Rigifyリグを生成
-            rig_object = vrm_rigify.generate_rigify_rig(metarig)
-            
-            # リグの処理と調整
-            vrm_rigify.removed_rigify_rig_facial_bones(rig_object)
-            vrm_rigify.rename_rig_bones_to_match_vrm_model_vertex_groups(rig_object, bone_mapping, bone_name_mapping)
-
-            # debug
-            vrm_rigify.debug_attach_unmapped_bones(rig_object, vrm_object, bone_name_mapping)
-
-            vrm_rigify.attach_unmapped_vrm_model_bones_to_rig(rig_object, vrm_object, bone_name_mapping)
-            vrm_rigify.copy_shape_key_controls_from_vrm_armature(rig_object, vrm_object)
+            # 変換パイプラインを実行（ログファイルは変換終了時にまとめて書き出す）
+            with conversion_logger.capture_log(log_path):
+                conversion_pipeline.convert_vrm_to_rigify(
+                    context,
+                    vrm_object,
+                    hide_original=self.hide_original,
+                    hide_metarig=self.hide_metarig,
+                    copy_vrm_settings=self.copy_vrm_settings,
+                    setup_constraint_drivers=self.setup_constraint_drivers,
+                    constraint_influence_mode=self.constraint_influence_mode,
+                    use_metarig_cache=self.use_metarig_cache,
+                    use_rig_cache=self.use_rig_cache,
+                    strip_face_before_generate=self.strip_face_before_generate,
+                    mesh_mode=self.mesh_mode,
+                    merge_orphan_weights=self.merge_orphan_weights,
+                    max_bone_influences=self.max_bone_influences,
+                    min_bone_weight=self.min_bone_weight,
+                    remove_empty_vertex_groups=self.remove_empty_vertex_groups,
+                    disable_unweighted_bones=self.disable_unweighted_bones,
+                    max_bones_per_mesh=self.max_bones_per_mesh,
+                    profiler=profiler,
+                    diagnostics=diagnostics,
+                )
             
-            # リグのボーン調整
-            vrm_rigify.modify_rigify_rig_eyes_control_bones(rig_object)
-            vrm_rigify.disable_ik_stretching(rig_object)
-            vrm_rigify.show_ik_toggle_pole(rig_object)
+            # 生成済みリグのキャッシュを既定の上限まで削減
+            if self.use_rig_cache:
+                rig_cache.evict_rig_cache()
             
-            # メッシュのコピーと設定
-            vrm_rigify.copy_meshes_between_armatures(vrm_object, rig_object, bone_name_mapping)
-            vrm_rigify.change_meshes_modifier_object(rig_object)
-
-            # 親子関係など最終調整
-            vrm_rigify.adjust_bone_hierarchy_and_constraints_for_Unity(rig_object)
-
-            # 元のArmatureのボーン名を元に戻す
-            vrm_rigify.restore_original_bone_names(vrm_object, original_bone_names)
-
-            # コンストレイントドライバーのセットアップ
-            if self.setup_constraint_drivers:
-                vrm_rigify.setup_rig_constraint_drivers(rig_object)
-
-            # VRM拡張情報をコピーするかどうかのチェック
-            if self.copy_vrm_settings:
-                # VRM拡張情報のコピー（新機能）
-                from . import vrm_extension_utils
-                vrm_extension_utils.copy_vrm_extension_from_armature(vrm_object, rig_object)
-    
-            
-            # オブジェクトの表示設定（リクエストに応じて非表示）
-            if self.hide_metarig:
-                metarig.hide_set(True)
-                metarig.hide_render = True
-                
-            if self.hide_original:
-                for vrm_child in vrm_object.children:
-                    if vrm_child.type == 'MESH':
-                        vrm_child.hide_set(True)
-                        vrm_child.hide_render = True
-                vrm_object.hide_set(True)
-                vrm_object.hide_render = True
+            if log_path:
+                self.report({'INFO'}, f"Conversion log saved to {log_path}")
             
-            # 最終設定
-            rig_object.show_in_front = True
-            
-            # 新しいリグを選択し、アクティブに設定
-            bpy.ops.object.select_all(action='DESELECT')
-            rig_object.select_set(True)
-            context.view_layer.objects.active = rig_object
+            # プロファイル結果の出力
+            if self.profile_conversion:
+                profiler.print_table()
+                report_path = f"{output_base}.profile.json"
+                profiler.write_json(report_path)
+                self.report({'INFO'}, f"Conversion profile saved to {report_path}")
             
             self.report({'INFO'}, "VRM to Rigify conversion complete")
             return {'FINISHED'}
@@ -164,6 +233,13 @@ class VRM_OT_ToRigify(Operator):
         except Exception as e:
             self.report({'ERROR'}, f"Error: {str(e)}")
             return {'CANCELLED'}
+        
+        finally:
+            # 診断レポートは変換に失敗した場合も保存する
+            if diagnostics is not None:
+                diagnostics_path = f"{output_base}.diagnostics.json"
+                diagnostics.write_json(diagnostics_path)
+                self.report({'INFO'}, f"Diagnostics saved to {diagnostics_path}")
 
 
 #################################################
@@ -190,11 +266,17 @@ class VRM_OT_ToggleConstraintDrivers(Operator):
         armature = context.active_object
         
         if self.mode == "ADD":
-            result = constraint_driver_utils.add_constraint_influence_drivers(armature)
-            if result:
-                self.report({'INFO'}, "Constraint drivers added successfully")
-            else:
+            # 既存のドライバーを確認し、不足・不整合なものだけを変更する
+            stats = constraint_driver_utils.reconcile_constraint_influence_drivers(armature)
+            if stats is None:
                 self.report({'WARNING'}, "No constraint drivers were added")
+            elif stats["created"] or stats["repaired"] or stats["duplicates_removed"]:
+                self.report({'INFO'}, f"Constraint drivers: {stats['created']} created, "
+                                      f"{stats['repaired']} repaired, "
+                                      f"{stats['duplicates_removed']} duplicates removed, "
+                                      f"{stats['unchanged']} unchanged")
+            else:
+                self.report({'INFO'}, f"Constraint drivers are up to date ({stats['unchanged']} unchanged)")
         else:  # REMOVE
             result = constraint_driver_utils.remove_constraint_influence_drivers(armature)
             if result:
@@ -243,6 +325,18 @@ class VRM_PT_ToRigifyPanel(Panel):
                 col.prop(op, "hide_metarig")
                 col.prop(op, "copy_vrm_settings")
                 col.prop(op, "setup_constraint_drivers")
+                col.prop(op, "constraint_influence_mode")
+                col.prop(op, "strip_face_before_generate")
+                col.prop(op, "mesh_mode")
+                col.prop(op, "merge_orphan_weights")
+                col.prop(op, "max_bone_influences")
+                col.prop(op, "min_bone_weight")
+                col.prop(op, "remove_empty_vertex_groups")
+                col.prop(op, "disable_unweighted_bones")
+                col.prop(op, "max_bones_per_mesh")
+                col.prop(op, "profile_conversion")
+                col.prop(op, "save_conversion_log")
+                col.prop(op, "save_diagnostics")
                 
                 # Rigifyリグ操作エリア
                 box = layout.box()
@@ -254,9 +348,11 @@ class VRM_PT_ToRigifyPanel(Panel):
                 # コンストレイント影響度のスライダー
                 if has_constraint_influence:
                     box.prop(obj, '["constraint_influence"]', slider=True, text="Constraint Influence")
+                elif bone_constraint_utils.CONSTRAINT_INFLUENCE_PROPERTY in obj:
+                    box.prop(obj, bone_constraint_utils.CONSTRAINT_INFLUENCE_PROPERTY, slider=True)
                 
-                # ON/OFF切り替え機能
-                box.prop(context.scene, "vrm_rigify_disable_control_rig", toggle=True)
+                # ON/OFF切り替え機能（リグごとの状態）
+                box.prop(obj, "vrm_rigify_disable_control_rig", toggle=True)
                 
                 # ドライバの追加/削除ボタン
                 row = box.row(align=True)
@@ -272,20 +368,38 @@ class VRM_PT_ToRigifyPanel(Panel):
 # アドオン登録
 #################################################
 
-# シーンプロパティの登録
+def update_constraint_influence(self, context):
+    # ドライバーを使わない影響度制御：値の変更時にだけDEFボーンのコンストレイントへ書き込む
+    if self.type == 'ARMATURE':
+        bone_constraint_utils.set_def_constraint_influence(
+            self, getattr(self, bone_constraint_utils.CONSTRAINT_INFLUENCE_PROPERTY))
+
+def update_disable_control_rig(self, context):
+    # 切り替えたアーマチュア自身のDEFボーンのコンストレイントだけを更新する
+    if self.type == 'ARMATURE':
+        bone_constraint_utils.toggle_def_bone_constraints(self, self.vrm_rigify_disable_control_rig)
+
+# オブジェクトプロパティの登録
 def register_properties():
-    bpy.types.Scene.vrm_rigify_disable_control_rig = BoolProperty(
+    bpy.types.Object.vrm_rigify_disable_control_rig = BoolProperty(
         name="Disable Control Rig",
         description="DEFボーンのコンストレイントを無効化し、直接ボーンを動かせるようにします",
         default=False,
-        update=lambda self, context: bone_constraint_utils.toggle_def_bone_constraints(
-            context.active_object, 
-            self.vrm_rigify_disable_control_rig
-        ) if context.active_object and context.active_object.type == 'ARMATURE' else None
+        update=update_disable_control_rig
     )
+    setattr(bpy.types.Object, bone_constraint_utils.CONSTRAINT_INFLUENCE_PROPERTY, FloatProperty(
+        name="Constraint Influence",
+        description="Influence of the DEF bones constraints, written without drivers",
+        default=1.0,
+        min=0.0,
+        max=1.0,
+        subtype='FACTOR',
+        update=update_constraint_influence
+    ))
 
 def unregister_properties():
-    del bpy.types.Scene.vrm_rigify_disable_control_rig
+    del bpy.types.Object.vrm_rigify_disable_control_rig
+    delattr(bpy.types.Object, bone_constraint_utils.CONSTRAINT_INFLUENCE_PROPERTY)
 
 classes = (
     VRM_OT_ToRigify,
@@ -0,0 +1,353 @@
+"""
+Batch Conversion Module for VrmRigify Addon
+
+This module converts a directory of .vrm files in a single headless Blender
+process, so Blender, Rigify and the VRM add-on are only started once per batch.
+
+Usage:
+    blender -b --python-expr "from vrm_rigify_for_unity import batch_convert; batch_convert.main()" -- INPUT_DIR OUTPUT_DIR [options]
+    blender -b --python path/to/vrm_rigify_for_unity/batch_convert.py -- INPUT_DIR OUTPUT_DIR [options]
+
+Run with --help after "--" to list the options.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+from typing import Dict, List, Optional
+
+import addon_utils
+import bpy
+
+if __package__:
+    from . import conversion_diagnostics
+    from . import conversion_logger
+    from . import conversion_pipeline
+    from . import conversion_profiler
+    from . import rig_cache
+else:
+    # --python で直接実行された場合はインストール済みのアドオンから読み込む
+    from vrm_rigify_for_unity import conversion_diagnostics
+    from vrm_rigify_for_unity import conversion_logger
+    from vrm_rigify_for_unity import conversion_pipeline
+    from vrm_rigify_for_unity import conversion_profiler
+    from vrm_rigify_for_unity import rig_cache
+
+
+SUMMARY_FILE_NAME = "summary.json"
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """
+    Parse the batch conversion arguments given after "--" on the Blender command line.
+
+    Args:
+        argv (List[str], optional): Argument list. Defaults to the arguments after "--" in sys.argv.
+
+    Returns:
+        argparse.Namespace: Parsed arguments.
+    """
+    if argv is None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+
+    parser = argparse.ArgumentParser(
+        prog="blender -b --python-expr ... --",
+        description="Convert a directory of VRM files to Rigify rigs for Unity.")
+    parser.add_argument("input_dir", help="Directory containing .vrm files")
+    parser.add_argument("output_dir", help="Directory to write converted files and the summary to")
+    parser.add_argument("--recursive", action="store_true",
+                        help="Search the input directory recursively")
+    parser.add_argument("--no-blend", dest="save_blend", action="store_false",
+                        help="Do not save a .blend file per model")
+    parser.add_argument("--fbx", dest="export_fbx", action="store_true",
+                        help="Export an FBX file per model")
+    parser.add_argument("--no-copy-vrm-settings", dest="copy_vrm_settings", action="store_false",
+                        help="Do not copy VRM extension data to the rig")
+    parser.add_argument("--no-constraint-drivers", dest="setup_constraint_drivers", action="store_false",
+                        help="Do not add influence drivers to DEF bone constraints")
+    parser.add_argument("--influence-mode", dest="constraint_influence_mode", default="DRIVER",
+                        type=str.upper, choices=["DRIVER", "PROPERTY"],
+                        help="Control DEF constraint influence with drivers or with a driverless property")
+    parser.add_argument("--no-metarig-cache", dest="use_metarig_cache", action="store_false",
+                        help="Create the metarig with the Rigify operator instead of the cached template")
+    parser.add_argument("--no-rig-cache", dest="use_rig_cache", action="store_false",
+                        help="Always run rigify_generate instead of reusing cached rigs")
+    parser.add_argument("--rig-cache-max-size", type=float, default=rig_cache.DEFAULT_RIG_CACHE_MAX_SIZE_MB,
+                        help="Maximum size of the generated rig cache in MB")
+    parser.add_argument("--rig-cache-max-age", type=float, default=rig_cache.DEFAULT_RIG_CACHE_MAX_AGE_DAYS,
+                        help="Maximum age of generated rig cache entries in days")
+    parser.add_argument("--strip-face", dest="strip_face_before_generate", action="store_true",
+                        help="Remove the face bones except the eyes from the metarig before generating the rig")
+    parser.add_argument("--mesh-mode", default="COPY", type=str.upper, choices=["COPY", "MOVE"],
+                        help="Parent copies of the VRM meshes to the rig, or move the original meshes without copying")
+    parser.add_argument("--merge-orphan-weights", action="store_true",
+                        help="Merge the weights of vertex groups whose bone is not in the rig into the nearest parent bone")
+    parser.add_argument("--max-influences", dest="max_bone_influences", type=int, default=0,
+                        help="Keep at most this many bone weights per vertex (0 keeps all)")
+    parser.add_argument("--min-weight", dest="min_bone_weight", type=float, default=0.0,
+                        help="Remove bone weights below this value")
+    parser.add_argument("--remove-empty-groups", dest="remove_empty_vertex_groups", action="store_true",
+                        help="Remove the bone vertex groups that have no weight")
+    parser.add_argument("--disable-unweighted-bones", action="store_true",
+                        help="Turn off Deform on leaf deform bones that have no weight on any mesh")
+    parser.add_argument("--max-bones-per-mesh", type=int, default=0,
+                        help="Split meshes that reference more bones than this into parts (0 keeps the meshes)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Print per-stage timing and write <model>.profile.json")
+    parser.add_argument("--log-level", default="WARNING",
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="Level of conversion messages printed to the console")
+    parser.add_argument("--save-log", action="store_true",
+                        help="Write the full conversion log of each model to <model>.log")
+    parser.add_argument("--diagnostics", action="store_true",
+                        help="Write a bone mapping diagnostics report to <model>.diagnostics.json")
+    parser.add_argument("--addon", dest="addons", action="append", default=[],
+                        help="Additional add-on module to enable before converting (repeatable)")
+    parser.add_argument("--stop-on-error", action="store_true",
+                        help="Abort the batch on the first failed model")
+    return parser.parse_args(argv)
+
+
+def find_vrm_files(input_dir: str, recursive: bool = False) -> List[str]:
+    """
+    Collect .vrm files in a directory, sorted by path.
+
+    Args:
+        input_dir (str): Directory to search.
+        recursive (bool, optional): Whether to search subdirectories. Defaults to False.
+
+    Returns:
+        List[str]: Absolute paths of the found .vrm files.
+    """
+    vrm_files = []
+    if recursive:
+        for root, _dirs, files in os.walk(input_dir):
+            vrm_files.extend(os.path.join(root, f) for f in files if f.lower().endswith(".vrm"))
+    else:
+        vrm_files = [os.path.join(input_dir, f) for f in os.listdir(input_dir)
+                     if f.lower().endswith(".vrm")]
+    return sorted(os.path.abspath(f) for f in vrm_files)
+
+
+def enable_required_addons(extra_addons: List[str]):
+    """
+    Enable Rigify and any extra add-ons once for the whole batch.
+
+    Args:
+        extra_addons (List[str]): Additional add-on module names to enable.
+    """
+    for module_name in ["rigify"] + list(extra_addons):
+        addon_utils.enable(module_name, default_set=True)
+
+
+def reset_scene():
+    """
+    Load an empty scene while keeping the enabled add-ons loaded.
+    """
+    bpy.ops.wm.read_homefile(use_empty=True, load_ui=False)
+
+
+def import_vrm(filepath: str) -> bpy.types.Object:
+    """
+    Import a VRM file and return its armature object.
+
+    Args:
+        filepath (str): Path of the .vrm file.
+
+    Returns:
+        bpy.types.Object: The imported armature object.
+
+    Raises:
+        Exception: If no armature was imported.
+    """
+    bpy.ops.import_scene.vrm(filepath=filepath)
+
+    active = bpy.context.view_layer.objects.active
+    if active and active.type == 'ARMATURE':
+        return active
+
+    for obj in bpy.context.scene.objects:
+        if obj.type == 'ARMATURE':
+            bpy.context.view_layer.objects.active = obj
+            return obj
+
+    raise Exception(f"No armature found after importing '{filepath}'")
+
+
+def export_fbx(rig_object: bpy.types.Object, filepath: str):
+    """
+    Export the rig and its meshes as FBX for Unity.
+
+    Args:
+        rig_object (bpy.types.Object): The generated Rigify rig object.
+        filepath (str): Output FBX path.
+    """
+    bpy.ops.object.select_all(action='DESELECT')
+    rig_object.select_set(True)
+    for child in rig_object.children:
+        if child.type == 'MESH':
+            child.select_set(True)
+    bpy.context.view_layer.objects.active = rig_object
+
+    bpy.ops.export_scene.fbx(
+        filepath=filepath,
+        use_selection=True,
+        object_types={'ARMATURE', 'MESH'},
+        add_leaf_bones=False,
+        bake_anim=False,
+    )
+
+
+def convert_file(filepath: str, args: argparse.Namespace) -> Dict[str, object]:
+    """
+    Convert a single VRM file and write its outputs.
+
+    Args:
+        filepath (str): Path of the .vrm file.
+        args (argparse.Namespace): Parsed batch arguments.
+
+    Returns:
+        Dict[str, object]: Summary entry for this file.
+    """
+    base_name = os.path.splitext(os.path.basename(filepath))[0]
+    entry = {"input": filepath, "status": "FAILED", "outputs": [], "seconds": 0.0}
+    start_time = time.perf_counter()
+    profiler = conversion_profiler.StageProfiler(base_name)
+    log_path = os.path.join(args.output_dir, f"{base_name}.log") if args.save_log else None
+    diagnostics = conversion_diagnostics.ConversionDiagnostics(base_name) if args.diagnostics else None
+
+    try:
+        reset_scene()
+        with conversion_logger.capture_log(log_path):
+            with profiler.stage("import_vrm"):
+                vrm_object = import_vrm(filepath)
+
+            rig_object = conversion_pipeline.convert_vrm_to_rigify(
+                bpy.context,
+                vrm_object,
+                copy_vrm_settings=args.copy_vrm_settings,
+                setup_constraint_drivers=args.setup_constraint_drivers,
+                constraint_influence_mode=args.constraint_influence_mode,
+                use_metarig_cache=args.use_metarig_cache,
+                use_rig_cache=args.use_rig_cache,
+                strip_face_before_generate=args.strip_face_before_generate,
+                mesh_mode=args.mesh_mode,
+                merge_orphan_weights=args.merge_orphan_weights,
+                max_bone_influences=args.max_bone_influences,
+                min_bone_weight=args.min_bone_weight,
+                remove_empty_vertex_groups=args.remove_empty_vertex_groups,
+                disable_unweighted_bones=args.disable_unweighted_bones,
+                max_bones_per_mesh=args.max_bones_per_mesh,
+                profiler=profiler,
+                diagnostics=diagnostics,
+            )
+        entry["rig"] = rig_object.name
+
+        if args.export_fbx:
+            fbx_path = os.path.join(args.output_dir, f"{base_name}.fbx")
+            export_fbx(rig_object, fbx_path)
+            entry["outputs"].append(fbx_path)
+
+        if args.save_blend:
+            blend_path = os.path.join(args.output_dir, f"{base_name}.blend")
+            bpy.ops.wm.save_as_mainfile(filepath=blend_path, copy=True)
+            entry["outputs"].append(blend_path)
+
+        entry["status"] = "OK"
+    except Exception as e:
+        entry["error"] = str(e)
+        entry["traceback"] = traceback.format_exc()
+    finally:
+        entry["seconds"] = round(time.perf_counter() - start_time, 3)
+        entry["mode_set"] = profiler.total_mode_set()
+        if log_path and os.path.exists(log_path):
+            entry["outputs"].append(log_path)
+        if diagnostics is not None:
+            diagnostics_path = os.path.join(args.output_dir, f"{base_name}.diagnostics.json")
+            diagnostics.write_json(diagnostics_path)
+            entry["outputs"].append(diagnostics_path)
+            entry["warnings"] = diagnostics.warnings()
+
+    if args.profile and profiler.stages:
+        profiler.print_table()
+        profile_path = os.path.join(args.output_dir, f"{base_name}.profile.json")
+        profiler.write_json(profile_path)
+        entry["outputs"].append(profile_path)
+
+    return entry
+
+
+def run_batch(args: argparse.Namespace) -> Dict[str, object]:
+    """
+    Convert all VRM files in the input directory and write the summary.
+
+    Args:
+        args (argparse.Namespace): Parsed batch arguments.
+
+    Returns:
+        Dict[str, object]: The batch summary.
+    """
+    os.makedirs(args.output_dir, exist_ok=True)
+    enable_required_addons(args.addons)
+    conversion_logger.set_console_level(args.log_level)
+
+    vrm_files = find_vrm_files(args.input_dir, args.recursive)
+    batch_start = time.perf_counter()
+    results = []
+
+    for index, filepath in enumerate(vrm_files, start=1):
+        print(f"[{index}/{len(vrm_files)}] Converting {filepath}")
+        entry = convert_file(filepath, args)
+        results.append(entry)
+        print(f"[{index}/{len(vrm_files)}] {entry['status']} in {entry['seconds']:.1f}s"
+              + (f": {entry['error']}" if "error" in entry else ""))
+
+        # 生成済みリグのキャッシュを指定された上限まで削減（変換ごとに行い、バッチ中も上限を守る）
+        if args.use_rig_cache:
+            rig_cache.evict_rig_cache(args.rig_cache_max_size, args.rig_cache_max_age)
+
+        if entry["status"] != "OK" and args.stop_on_error:
+            break
+
+    summary = {
+        "blender_version": bpy.app.version_string,
+        "total": len(vrm_files),
+        "succeeded": sum(1 for r in results if r["status"] == "OK"),
+        "failed": sum(1 for r in results if r["status"] != "OK"),
+        "seconds": round(time.perf_counter() - batch_start, 3),
+        "results": results,
+    }
+
+    summary_path = os.path.join(args.output_dir, SUMMARY_FILE_NAME)
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+
+    print(f"Converted {summary['succeeded']}/{summary['total']} models "
+          f"in {summary['seconds']:.1f}s. Summary: {summary_path}")
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line entry point.
+
+    Args:
+        argv (List[str], optional): Argument list. Defaults to the arguments after "--" in sys.argv.
+
+    Returns:
+        int: Process exit code (0 if every model converted).
+    """
+    args = parse_arguments(argv)
+    summary = run_batch(args)
+    exit_code = 0 if summary["failed"] == 0 else 1
+
+    if bpy.app.background:
+        sys.exit(exit_code)
+    return exit_code
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,510 @@
+"""
+Benchmarks Module for VrmRigify Addon
+
+This module measures the effect of optional conversion modes by converting the
+same VRM file with each mode in a fresh scene and comparing the stage timings.
+
+Usage:
+    blender -b --python-expr "from vrm_rigify_for_unity import benchmarks; benchmarks.main()" -- BENCHMARK VRM_FILE [options]
+
+Benchmarks:
+    face-strip          rigify_generate time with and without stripping the metarig face bones
+    influence-playback  playback time of the rig with constraint influence drivers and
+                        with the driverless influence property
+    driver-bulk         per-constraint driver_add/driver_remove against the bulk driver engine
+    mesh-parenting      parent_set operator per mesh against batch parenting through the data API
+    mesh-mode           scene object counts and saved .blend size with copied and with moved meshes
+    orphan-weights      time of merging the weights of vertex groups whose bone is not in the rig
+    bone-budget         time of splitting the meshes into parts referencing at most 32 bones
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import bpy
+
+if __package__:
+    from . import batch_convert
+    from . import bone_constraint_utils
+    from . import constraint_driver_utils
+    from . import conversion_pipeline
+    from . import conversion_profiler
+    from . import vrm_rigify
+else:
+    # --python で直接実行された場合はインストール済みのアドオンから読み込む
+    from vrm_rigify_for_unity import batch_convert
+    from vrm_rigify_for_unity import bone_constraint_utils
+    from vrm_rigify_for_unity import constraint_driver_utils
+    from vrm_rigify_for_unity import conversion_pipeline
+    from vrm_rigify_for_unity import conversion_profiler
+    from vrm_rigify_for_unity import vrm_rigify
+
+
+def stage_seconds(profiler: conversion_profiler.StageProfiler, stage_name: str) -> float:
+    """
+    Sum the recorded time of a stage.
+
+    Args:
+        profiler (StageProfiler): Profiler of a finished conversion.
+        stage_name (str): Stage name.
+
+    Returns:
+        float: Seconds spent in the stage (0.0 if it did not run).
+    """
+    return sum(s["seconds"] for s in profiler.stages if s["stage"] == stage_name)
+
+
+def stage_counter(profiler: conversion_profiler.StageProfiler, counter: str) -> int:
+    """
+    Sum a counter over all stages.
+
+    Args:
+        profiler (StageProfiler): Profiler of a finished conversion.
+        counter (str): Counter name.
+
+    Returns:
+        int: Counter total.
+    """
+    return sum(s["counters"].get(counter, 0) for s in profiler.stages)
+
+
+def run_conversion(filepath: str, **options) -> tuple:
+    """
+    Convert a VRM file in an empty scene with profiling.
+    The generated rig cache is disabled unless requested, so rigify_generate really runs.
+
+    Args:
+        filepath (str): Path of the .vrm file.
+        **options: Keyword arguments for convert_vrm_to_rigify.
+
+    Returns:
+        tuple: (StageProfiler, rig object, VRM armature object)
+    """
+    batch_convert.reset_scene()
+    vrm_object = batch_convert.import_vrm(filepath)
+    profiler = conversion_profiler.StageProfiler(vrm_object.name)
+    options.setdefault("use_rig_cache", False)
+    rig_object = conversion_pipeline.convert_vrm_to_rigify(
+        bpy.context, vrm_object, profiler=profiler, **options)
+    return profiler, rig_object, vrm_object
+
+
+def _summarize(samples: List[float]) -> Dict[str, float]:
+    return {
+        "median": round(statistics.median(samples), 6),
+        "min": round(min(samples), 6),
+        "max": round(max(samples), 6),
+    }
+
+
+def benchmark_face_strip(filepath: str, repeat: int = 3) -> Dict[str, object]:
+    """
+    Compare rigify_generate time with and without stripping the metarig face bones.
+
+    Args:
+        filepath (str): Path of the .vrm file.
+        repeat (int, optional): Conversions per mode. Defaults to 3.
+
+    Returns:
+        Dict[str, object]: Per-mode timings, rig bone counts and the saved time.
+    """
+    results = {}
+    for mode, strip_face in (("full_face", False), ("strip_face", True)):
+        generate_samples, total_samples = [], []
+        rig_bones = stripped = 0
+        for _ in range(repeat):
+            profiler, rig_object, _vrm_object = run_conversion(filepath, strip_face_before_generate=strip_face)
+            generate_samples.append(stage_seconds(profiler, "generate_rigify_rig"))
+            total_samples.append(profiler.total_seconds())
+            rig_bones = len(rig_object.data.bones)
+            stripped = stage_counter(profiler, "face_bones_stripped")
+        results[mode] = {
+            "generate_rigify_rig_seconds": _summarize(generate_samples),
+            "total_seconds": _summarize(total_samples),
+            "face_bones_stripped": stripped,
+            "rig_bones": rig_bones,
+        }
+
+    full = results["full_face"]["generate_rigify_rig_seconds"]["median"]
+    stripped = results["strip_face"]["generate_rigify_rig_seconds"]["median"]
+    results["generate_seconds_saved"] = round(full - stripped, 6)
+    results["generate_speedup"] = round(full / stripped, 3) if stripped > 0 else None
+    return results
+
+
+def animate_rig_root(rig_object: bpy.types.Object, frame_start: int, frames: int):
+    """
+    Keyframe the root bone of the rig so every frame re-evaluates the armature.
+
+    Args:
+        rig_object (bpy.types.Object): The Rigify rig object.
+        frame_start (int): First frame.
+        frames (int): Number of frames.
+    """
+    pose_bones = rig_object.pose.bones
+    root = pose_bones.get("Root") or pose_bones.get("root") or pose_bones[0]
+    root.location = (0.0, 0.0, 0.0)
+    root.keyframe_insert("location", frame=frame_start)
+    root.location = (0.0, 0.0, 1.0)
+    root.keyframe_insert("location", frame=frame_start + frames - 1)
+
+
+def time_playback(scene: bpy.types.Scene, frames: int) -> float:
+    """
+    Step through frames like playback does and measure the time.
+
+    Args:
+        scene (bpy.types.Scene): The scene to play.
+        frames (int): Number of frames.
+
+    Returns:
+        float: Seconds per frame.
+    """
+    start_time = time.perf_counter()
+    for frame in range(scene.frame_start, scene.frame_start + frames):
+        scene.frame_set(frame)
+    return (time.perf_counter() - start_time) / frames
+
+
+def benchmark_influence_playback(filepath: str, repeat: int = 3, frames: int = 250) -> Dict[str, object]:
+    """
+    Compare playback time with constraint influence drivers and with the driverless property.
+
+    Args:
+        filepath (str): Path of the .vrm file.
+        repeat (int, optional): Playback runs per mode. Defaults to 3.
+        frames (int, optional): Frames per playback run. Defaults to 250.
+
+    Returns:
+        Dict[str, object]: Per-mode seconds per frame and the driver count.
+    """
+    _profiler, rig_object, _vrm_object = run_conversion(
+        filepath, constraint_influence_mode='DRIVER', use_rig_cache=True)
+    scene = bpy.context.scene
+    animate_rig_root(rig_object, scene.frame_start, frames)
+
+    results = {}
+    driver_count = len(rig_object.animation_data.drivers) if rig_object.animation_data else 0
+    samples = [time_playback(scene, frames) for _ in range(repeat)]
+    results["driver"] = {"seconds_per_frame": _summarize(samples), "drivers": driver_count}
+
+    constraint_driver_utils.remove_constraint_influence_drivers(rig_object)
+    vrm_rigify.setup_rig_constraint_influence_property(rig_object)
+    driver_count = len(rig_object.animation_data.drivers) if rig_object.animation_data else 0
+    samples = [time_playback(scene, frames) for _ in range(repeat)]
+    results["property"] = {"seconds_per_frame": _summarize(samples), "drivers": driver_count}
+
+    # 値の変更1回あたりのコストは更新コールバックによる一括書き込みの時間
+    def_bones = bone_constraint_utils.get_def_pose_bones(rig_object) or []
+    start_time = time.perf_counter()
+    bone_constraint_utils.set_def_constraint_influence(rig_object, 0.5)
+    results["property"]["update_seconds"] = round(time.perf_counter() - start_time, 6)
+    results["property"]["constraints"] = sum(len(bone.constraints) for bone in def_bones)
+
+    driver = results["driver"]["seconds_per_frame"]["median"]
+    driverless = results["property"]["seconds_per_frame"]["median"]
+    results["playback_speedup"] = round(driver / driverless, 3) if driverless > 0 else None
+    return results
+
+
+def _add_drivers_per_constraint(rig_object: bpy.types.Object) -> int:
+    # 比較用：コンストレイントごとにdriver_addを呼ぶ従来の方法
+    added_count = 0
+    for bone in bone_constraint_utils.get_def_pose_bones(rig_object) or []:
+        for constraint in bone.constraints:
+            fcurve = constraint.driver_add("influence")
+            constraint_driver_utils.configure_influence_driver(fcurve.driver, rig_object)
+            added_count += 1
+    return added_count
+
+
+def _remove_drivers_per_constraint(rig_object: bpy.types.Object) -> int:
+    # 比較用：コンストレイントごとにdriver_removeを呼ぶ従来の方法
+    removed_count = 0
+    for bone in bone_constraint_utils.get_def_pose_bones(rig_object) or []:
+        for constraint in bone.constraints:
+            removed_count += bool(constraint.driver_remove("influence"))
+    return removed_count
+
+
+def benchmark_driver_bulk(filepath: str, repeat: int = 3) -> Dict[str, object]:
+    """
+    Compare creating and removing the influence drivers one constraint at a time
+    against the bulk driver engine.
+
+    Args:
+        filepath (str): Path of the .vrm file.
+        repeat (int, optional): Create/remove cycles per method. Defaults to 3.
+
+    Returns:
+        Dict[str, object]: Per-method create/remove timings and the constraint count.
+    """
+    _profiler, rig_object, _vrm_object = run_conversion(
+        filepath, setup_constraint_drivers=False, use_rig_cache=True)
+    targets = constraint_driver_utils.collect_influence_targets(rig_object) or []
+    data_paths = [data_path for _bone_name, data_path in targets]
+
+    samples = {"per_constraint": {"create": [], "remove": []}, "bulk": {"create": [], "remove": []}}
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        _add_drivers_per_constraint(rig_object)
+        samples["per_constraint"]["create"].append(time.perf_counter() - start_time)
+        start_time = time.perf_counter()
+        _remove_drivers_per_constraint(rig_object)
+        samples["per_constraint"]["remove"].append(time.perf_counter() - start_time)
+
+        start_time = time.perf_counter()
+        constraint_driver_utils.bulk_create_influence_drivers(rig_object, data_paths)
+        samples["bulk"]["create"].append(time.perf_counter() - start_time)
+        start_time = time.perf_counter()
+        constraint_driver_utils.bulk_remove_influence_drivers(rig_object, data_paths)
+        samples["bulk"]["remove"].append(time.perf_counter() - start_time)
+
+    results = {"constraints": len(targets)}
+    for method, operations in samples.items():
+        results[method] = {operation: _summarize(values) for operation, values in operations.items()}
+    for operation in ("create", "remove"):
+        bulk = results["bulk"][operation]["median"]
+        per_constraint = results["per_constraint"][operation]["median"]
+        results[f"{operation}_speedup"] = round(per_constraint / bulk, 3) if bulk > 0 else None
+    return results
+
+
+def _copy_meshes(mesh_objects, count: int) -> list:
+    # 指定数になるまでメッシュを繰り返しコピーする（パーツ数の多いモデルの再現）
+    copies = []
+    while len(copies) < count:
+        for mesh in mesh_objects:
+            if len(copies) == count:
+                break
+            new_mesh = mesh.copy()
+            bpy.context.collection.objects.link(new_mesh)
+            copies.append(new_mesh)
+    return copies
+
+
+def _parent_meshes_with_operator(mesh_objects, rig_object: bpy.types.Object):
+    # 比較用：メッシュごとに選択してparent_setオペレーターを呼ぶ従来の方法
+    view_layer = bpy.context.view_layer
+    for mesh in mesh_objects:
+        bpy.ops.object.select_all(action='DESELECT')
+        mesh.select_set(True)
+        rig_object.select_set(True)
+        view_layer.objects.active = rig_object
+        mesh.parent = rig_object
+        bpy.ops.object.parent_set(type='ARMATURE', keep_transform=True)
+
+
+def _remove_objects(objects):
+    for obj in objects:
+        bpy.data.objects.remove(obj, do_unlink=True)
+
+
+def benchmark_mesh_parenting(filepath: str, repeat: int = 3, meshes: int = 80) -> Dict[str, object]:
+    """
+    Compare parenting copied meshes to the rig with the parent_set operator per mesh
+    against parent_meshes_to_armature. The model's meshes are copied until the
+    requested mesh count is reached.
+
+    Args:
+        filepath (str): Path of the .vrm file.
+        repeat (int, optional): Runs per method. Defaults to 3.
+        meshes (int, optional): Number of meshes to parent. Defaults to 80.
+
+    Returns:
+        Dict[str, object]: Per-method timings and the mesh count.
+    """
+    _profiler, rig_object, vrm_object = run_conversion(filepath, use_rig_cache=True)
+    source_meshes = [child for child in vrm_object.children if child.type == 'MESH']
+    if not source_meshes:
+        return {"meshes": 0}
+
+    samples = {"operator": [], "data_api": []}
+    for _ in range(repeat):
+        for method, parent in (("operator", _parent_meshes_with_operator),
+                               ("data_api", vrm_rigify.parent_meshes_to_armature)):
+            copies = _copy_meshes(source_meshes, meshes)
+            start_time = time.perf_counter()
+            parent(copies, rig_object)
+            bpy.context.view_layer.update()
+            samples[method].append(time.perf_counter() - start_time)
+            _remove_objects(copies)
+
+    results = {"meshes": meshes}
+    results.update({method: _summarize(values) for method, values in samples.items()})
+    data_api = results["data_api"]["median"]
+    results["speedup"] = round(results["operator"]["median"] / data_api, 3) if data_api > 0 else None
+    return results
+
+
+def scene_footprint() -> Dict[str, int]:
+    """
+    Count the objects, modifiers and vertex groups in the file and the size of the saved .blend.
+    The file is saved as a copy to a temporary path, so the current file path is kept.
+
+    Returns:
+        Dict[str, int]: Object, mesh object, modifier and vertex group counts, and the .blend size in bytes.
+    """
+    objects = list(bpy.data.objects)
+    fd, blend_path = tempfile.mkstemp(suffix=".blend")
+    os.close(fd)
+    try:
+        bpy.ops.wm.save_as_mainfile(filepath=blend_path, copy=True)
+        blend_bytes = os.path.getsize(blend_path)
+    finally:
+        os.remove(blend_path)
+    return {
+        "objects": len(objects),
+        "mesh_objects": sum(obj.type == 'MESH' for obj in objects),
+        "modifiers": sum(len(obj.modifiers) for obj in objects),
+        "vertex_groups": sum(len(obj.vertex_groups) for obj in objects),
+        "blend_bytes": blend_bytes,
+    }
+
+
+def benchmark_mesh_mode(filepath: str, repeat: int = 3) -> Dict[str, object]:
+    """
+    Compare converting with copied meshes against moving the original meshes to the rig.
+
+    Args:
+        filepath (str): Path of the .vrm file.
+        repeat (int, optional): Conversions per mode. Defaults to 3.
+
+    Returns:
+        Dict[str, object]: Per-mode mesh stage timings and scene footprint, and the savings of 'MOVE'.
+    """
+    stage_names = {'COPY': "copy_meshes_between_armatures", 'MOVE': "move_meshes_between_armatures"}
+    results = {}
+    for mode, stage_name in stage_names.items():
+        samples = []
+        for _ in range(repeat):
+            profiler, _rig_object, _vrm_object = run_conversion(filepath, mesh_mode=mode, use_rig_cache=True)
+            samples.append(stage_seconds(profiler, stage_name))
+        results[mode.lower()] = {"mesh_stage_seconds": _summarize(samples), **scene_footprint()}
+
+    results["saved"] = {
+        key: results["copy"][key] - results["move"][key]
+        for key in ("objects", "mesh_objects", "modifiers", "vertex_groups", "blend_bytes")
+    }
+    return results
+
+
+def benchmark_orphan_weights(filepath: str, repeat: int = 3) -> Dict[str, object]:
+    """
+    Measure the orphan vertex group weight merge stage.
+
+    Args:
+        filepath (str): Path of the .vrm file.
+        repeat (int, optional): Conversions. Defaults to 3.
+
+    Returns:
+        Dict[str, object]: Stage timings, vertex and weight entry counts and the merged group count.
+    """
+    samples = []
+    for _ in range(repeat):
+        profiler, rig_object, _vrm_object = run_conversion(filepath, merge_orphan_weights=True, use_rig_cache=True)
+        samples.append(stage_seconds(profiler, "merge_orphan_vertex_weights"))
+
+    return {
+        "merge_orphan_vertex_weights_seconds": _summarize(samples),
+        "vertices": sum(len(mesh.data.vertices) for mesh in vrm_rigify.get_rig_mesh_objects(rig_object)),
+        "weight_entries_read": stage_counter(profiler, "weight_entries_read"),
+        "orphan_groups_merged": stage_counter(profiler, "orphan_groups_merged"),
+        "vertices_reweighted": stage_counter(profiler, "vertices_reweighted"),
+    }
+
+
+def benchmark_bone_budget(filepath: str, repeat: int = 3, max_bones: int = 32) -> Dict[str, object]:
+    """
+    Measure splitting the meshes by a per-mesh bone budget.
+
+    Args:
+        filepath (str): Path of the .vrm file.
+        repeat (int, optional): Conversions. Defaults to 3.
+        max_bones (int, optional): Bone budget per mesh. Defaults to 32.
+
+    Returns:
+        Dict[str, object]: Stage timings, face count and the parts created.
+    """
+    samples = []
+    for _ in range(repeat):
+        profiler, rig_object, _vrm_object = run_conversion(
+            filepath, max_bones_per_mesh=max_bones, use_rig_cache=True)
+        samples.append(stage_seconds(profiler, "split_meshes_by_bone_budget"))
+
+    mesh_objects = vrm_rigify.get_rig_mesh_objects(rig_object)
+    return {
+        "max_bones": max_bones,
+        "split_meshes_by_bone_budget_seconds": _summarize(samples),
+        "faces": sum(len(mesh.data.polygons) for mesh in mesh_objects),
+        "mesh_parts_created": stage_counter(profiler, "mesh_parts_created"),
+    }
+
+
+BENCHMARKS = {
+    "face-strip": benchmark_face_strip,
+    "influence-playback": benchmark_influence_playback,
+    "driver-bulk": benchmark_driver_bulk,
+    "mesh-parenting": benchmark_mesh_parenting,
+    "mesh-mode": benchmark_mesh_mode,
+    "orphan-weights": benchmark_orphan_weights,
+    "bone-budget": benchmark_bone_budget,
+}
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """
+    Parse the benchmark arguments given after "--" on the Blender command line.
+
+    Args:
+        argv (List[str], optional): Argument list. Defaults to the arguments after "--" in sys.argv.
+
+    Returns:
+        argparse.Namespace: Parsed arguments.
+    """
+    if argv is None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+
+    parser = argparse.ArgumentParser(
+        prog="blender -b --python-expr ... --",
+        description="Benchmark optional VRM to Rigify conversion modes.")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS), help="Benchmark to run")
+    parser.add_argument("vrm_file", help=".vrm file to convert")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per mode")
+    parser.add_argument("--addon", dest="addons", action="append", default=[],
+                        help="Additional add-on module to enable before converting (repeatable)")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, object]:
+    """
+    Command line entry point.
+
+    Args:
+        argv (List[str], optional): Argument list. Defaults to the arguments after "--" in sys.argv.
+
+    Returns:
+        Dict[str, object]: The benchmark results.
+    """
+    args = parse_arguments(argv)
+    batch_convert.enable_required_addons(args.addons)
+
+    results = BENCHMARKS[args.benchmark](args.vrm_file, repeat=args.repeat)
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    print(text)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    return results
+
+
+if __name__ == "__main__":
+    main()
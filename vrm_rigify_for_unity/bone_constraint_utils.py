@@ -5,7 +5,213 @@ This module provides utility functions for managing bone constraints in Blender
 """
 
 import bpy
-from typing import Dict, Union
+import numpy as np
+from typing import Dict, List, Optional, Tuple, Union
+
+from . import conversion_logger
+
+logger = conversion_logger.get_logger(__name__)
+
+
+# ドライバーを使わずにDEFボーンのコンストレイント影響度を制御するオブジェクトプロパティ名
+CONSTRAINT_INFLUENCE_PROPERTY = "vrm_rigify_constraint_influence"
+
+# DEFボーンのコンストレイント状態のスナップショットを保存するIDプロパティ名
+CONSTRAINT_SNAPSHOT_KEY = "vrm_rigify_constraint_snapshot"
+
+# アーマチュアごとのボーンコレクション所属ボーン名のキャッシュ
+# {(アーマチュアのポインタ, コレクション名): (シグネチャ, ボーン名のリスト)}
+# PoseBoneの参照は編集モードやアンドゥで無効になるため、名前だけを保持する
+_collection_bone_cache: Dict[Tuple[int, str], Tuple[tuple, List[str]]] = {}
+
+
+def find_bone_collection(
+    armature: bpy.types.Object, 
+    collection_name: str
+) -> Optional[bpy.types.BoneCollection]:
+    """
+    Find a bone collection by name, including nested collections.
+
+    Args:
+        armature (bpy.types.Object): The armature object.
+        collection_name (str): Bone collection name.
+
+    Returns:
+        Optional[bpy.types.BoneCollection]: The collection, or None if not found.
+    """
+    armature_data = armature.data
+    # Blender 4.1以降、collectionsはルートのコレクションのみを含む
+    collections = getattr(armature_data, "collections_all", armature_data.collections)
+    return collections.get(collection_name)
+
+
+def _collection_signature(armature: bpy.types.Object, collection: bpy.types.BoneCollection) -> tuple:
+    # ボーンの追加・削除やコレクションへの割り当て変更を検出するための値
+    return (armature.data.as_pointer(), len(armature.data.bones), len(collection.bones))
+
+
+def get_collection_pose_bones(
+    armature: bpy.types.Object, 
+    collection_name: str = "DEF"
+) -> Optional[List[bpy.types.PoseBone]]:
+    """
+    Get the pose bones assigned to a bone collection.
+    The member names are read from the collection's own bone list and memoized
+    per armature, so repeated calls cost O(collection bones) instead of scanning
+    every pose bone and its collections.
+    The memo is rebuilt automatically when the bone count, the collection size or
+    the armature data changes, or when a cached name no longer resolves.
+    Call invalidate_def_bone_cache after renaming bones.
+
+    Args:
+        armature (bpy.types.Object): The armature object.
+        collection_name (str, optional): Bone collection name. Defaults to "DEF".
+
+    Returns:
+        Optional[List[bpy.types.PoseBone]]: The pose bones, or None if the collection does not exist.
+    """
+    collection = find_bone_collection(armature, collection_name)
+    if collection is None:
+        return None
+
+    key = (armature.as_pointer(), collection_name)
+    signature = _collection_signature(armature, collection)
+    pose_bones = armature.pose.bones
+
+    cached = _collection_bone_cache.get(key)
+    if cached is not None and cached[0] == signature:
+        try:
+            return [pose_bones[name] for name in cached[1]]
+        except KeyError:
+            # ボーン名が変更された場合は作り直す
+            pass
+
+    bone_names = [bone.name for bone in collection.bones]
+    _collection_bone_cache[key] = (signature, bone_names)
+    return [pose_bones[name] for name in bone_names]
+
+
+def get_def_pose_bones(armature: bpy.types.Object) -> Optional[List[bpy.types.PoseBone]]:
+    """
+    Get the pose bones of the DEF bone collection (see get_collection_pose_bones).
+
+    Args:
+        armature (bpy.types.Object): The armature object.
+
+    Returns:
+        Optional[List[bpy.types.PoseBone]]: The DEF pose bones, or None if there is no DEF collection.
+    """
+    return get_collection_pose_bones(armature, "DEF")
+
+
+def invalidate_def_bone_cache(armature: Optional[bpy.types.Object] = None):
+    """
+    Drop the memoized bone collection members of an armature, or of all armatures.
+
+    Args:
+        armature (bpy.types.Object, optional): The armature object. Clears everything if None.
+    """
+    if armature is None:
+        _collection_bone_cache.clear()
+        return
+    pointer = armature.as_pointer()
+    for key in [k for k in _collection_bone_cache if k[0] == pointer]:
+        del _collection_bone_cache[key]
+
+
+def snapshot_def_constraints(
+    armature: bpy.types.Object, 
+    def_bones: Optional[List[bpy.types.PoseBone]] = None
+) -> int:
+    """
+    Store the mute and influence state of all DEF bone constraints on the armature.
+    The state is kept as flat arrays in an ID property, in DEF bone and constraint
+    order, together with the constraint count of each bone to validate the layout
+    on restore. An existing snapshot is replaced.
+
+    Args:
+        armature (bpy.types.Object): The armature object.
+        def_bones (List[bpy.types.PoseBone], optional): DEF pose bones, resolved if None.
+
+    Returns:
+        int: Number of constraints stored.
+    """
+    if def_bones is None:
+        def_bones = get_def_pose_bones(armature) or []
+
+    counts, mutes, influences = [], [], []
+    for bone in def_bones:
+        constraints = bone.constraints
+        counts.append(len(constraints))
+        for constraint in constraints:
+            mutes.append(int(constraint.mute))
+            influences.append(constraint.influence)
+
+    if not mutes:
+        discard_constraint_snapshot(armature)
+        return 0
+
+    armature[CONSTRAINT_SNAPSHOT_KEY] = {"counts": counts, "mute": mutes, "influence": influences}
+    return len(mutes)
+
+
+def has_constraint_snapshot(armature: bpy.types.Object) -> bool:
+    return CONSTRAINT_SNAPSHOT_KEY in armature
+
+
+def discard_constraint_snapshot(armature: bpy.types.Object):
+    if CONSTRAINT_SNAPSHOT_KEY in armature:
+        del armature[CONSTRAINT_SNAPSHOT_KEY]
+
+
+def restore_def_constraints(
+    armature: bpy.types.Object, 
+    def_bones: Optional[List[bpy.types.PoseBone]] = None, 
+    discard: bool = True
+) -> Optional[int]:
+    """
+    Restore the state stored by snapshot_def_constraints in one linear pass.
+    Constraints are matched by position, so no names are looked up. The snapshot
+    is not applied if the DEF bones or their constraint counts have changed.
+
+    Args:
+        armature (bpy.types.Object): The armature object.
+        def_bones (List[bpy.types.PoseBone], optional): DEF pose bones, resolved if None.
+        discard (bool, optional): Delete the snapshot after restoring. Defaults to True.
+
+    Returns:
+        Optional[int]: Number of constraints restored, or None if there is no valid snapshot.
+    """
+    snapshot = armature.get(CONSTRAINT_SNAPSHOT_KEY)
+    if snapshot is None:
+        return None
+    if def_bones is None:
+        def_bones = get_def_pose_bones(armature) or []
+
+    counts = snapshot["counts"].to_list()
+    if len(counts) != len(def_bones) or any(
+            len(bone.constraints) != count for bone, count in zip(def_bones, counts)):
+        logger.warning("Constraint snapshot of %s does not match its DEF bones and was not restored.",
+                       armature.name)
+        if discard:
+            discard_constraint_snapshot(armature)
+        return None
+
+    mutes = snapshot["mute"].to_list()
+    influences = snapshot["influence"].to_list()
+    index = 0
+    for bone in def_bones:
+        for constraint in bone.constraints:
+            mute = bool(mutes[index])
+            if constraint.mute != mute:
+                constraint.mute = mute
+            if constraint.influence != influences[index]:
+                constraint.influence = influences[index]
+            index += 1
+
+    if discard:
+        discard_constraint_snapshot(armature)
+    return index
 
 
 def toggle_def_bone_constraints(
@@ -14,6 +220,8 @@ def toggle_def_bone_constraints(
 ) -> Dict[str, int]:
     """
     Toggle constraints for bones in the DEF collection.
+    Disabling stores a snapshot of the constraint state first, and enabling restores
+    it, so constraints the user had muted stay muted.
 
     Args:
         armature (bpy.types.Object): The armature object to process.
@@ -25,51 +233,109 @@ def toggle_def_bone_constraints(
     """
     # Validate armature type
     if armature.type != 'ARMATURE':
-        print("Active object is not an armature. Please select an armature.")
+        logger.warning("Active object is not an armature. Please select an armature.")
         return {}
 
-    # Find DEF bone collection
-    def_collection = None
-    for collection in armature.data.collections:
-        if collection.name == "DEF":
-            def_collection = collection
-            break
+    # Find DEF bones
+    def_bones = get_def_pose_bones(armature)
 
     # Handle case where DEF collection is not found
-    if not def_collection:
-        print("DEF bone collection not found. This might not be a Rigify rig.")
+    if def_bones is None:
+        logger.warning("DEF bone collection not found. This might not be a Rigify rig.")
         return {}
 
     # Track processed constraints
     result = {}
+    action_text = "disabled" if disable_constraints else "enabled"
+
+    # 無効化の前に現在の状態を保存し、有効化ではその状態に戻す
+    # （無効化中に再度無効化された場合は、元の状態のスナップショットを残す）
+    restored = None
+    if disable_constraints and not has_constraint_snapshot(armature):
+        snapshot_def_constraints(armature, def_bones)
+    elif not disable_constraints:
+        restored = restore_def_constraints(armature, def_bones)
 
     # Process constraints for DEF collection bones
-    for bone in armature.pose.bones:
-        # Check if bone is in DEF collection
-        if (bone.bone and bone.bone.collections and 
-            def_collection.name in [c.name for c in bone.bone.collections]):
-            
-            constraint_count = 0
-            # Toggle constraints
-            for constraint in bone.constraints:
+    changed_count = restored or 0
+    for bone in def_bones:
+        constraint_count = 0
+        # Toggle constraints (only the ones whose state differs)
+        for constraint in bone.constraints:
+            if restored is None and constraint.mute != disable_constraints:
                 constraint.mute = disable_constraints
-                constraint_count += 1
-            
-            # Record results
-            if constraint_count > 0:
-                result[bone.name] = constraint_count
-                action_text = "disabled" if disable_constraints else "enabled"
-                print(f"{bone.name}: {constraint_count} constraints {action_text}.")
-
-    # Print summary
-    total_constraints = sum(result.values())
-    total_bones = len(result)
-    action_text = "disabled" if disable_constraints else "enabled"
-    print(f"Total: {total_constraints} constraints {action_text} across {total_bones} bones.")
+                changed_count += 1
+            constraint_count += 1
+        
+        # Record results
+        if constraint_count > 0:
+            result[bone.name] = constraint_count
+            logger.debug("%s: %d constraints %s.", bone.name, constraint_count, action_text)
+
+    # Log summary
+    logger.info("Total: %d constraints %s across %d bones (%d %s).",
+                sum(result.values()), action_text, len(result), changed_count,
+                "restored" if restored is not None else "changed")
 
     return result
 
 
+def set_def_constraint_influence(
+    armature: bpy.types.Object, 
+    influence: float, 
+    constraint_types: Optional[List[str]] = None
+) -> int:
+    """
+    Write one influence value to the constraints of all DEF bones in a single pass.
+    Used instead of per-constraint drivers: nothing is evaluated during playback,
+    the value is only written when it changes.
+    Constraints that already have the value are not touched, so no redundant
+    depsgraph updates are triggered.
+    If a constraint snapshot is stored (the control rig is disabled), its influence
+    values are updated too, so enabling the control rig does not bring back the
+    previous influence.
+
+    Args:
+        armature (bpy.types.Object): The armature object to process.
+        influence (float): Influence value (0-1).
+        constraint_types (List[str], optional): Constraint types to affect.
+            If None, all constraints are affected.
+
+    Returns:
+        int: Number of constraints whose influence was changed.
+    """
+    if armature.type != 'ARMATURE':
+        logger.warning("Active object is not an armature. Please select an armature.")
+        return 0
+
+    def_bones = get_def_pose_bones(armature)
+    if def_bones is None:
+        logger.warning("DEF bone collection not found. This might not be a Rigify rig.")
+        return 0
+
+    # スナップショットはDEFボーンとコンストレイントの順に並んでいるため、同じ順序で更新する
+    snapshot = armature.get(CONSTRAINT_SNAPSHOT_KEY)
+    snapshot_influences = snapshot["influence"].to_list() if snapshot is not None else None
+
+    changed_count = 0
+    index = 0
+    for bone in def_bones:
+        for constraint in bone.constraints:
+            if not constraint_types or constraint.type in constraint_types:
+                if constraint.influence != influence:
+                    constraint.influence = influence
+                    changed_count += 1
+                if snapshot_influences is not None and index < len(snapshot_influences):
+                    snapshot_influences[index] = influence
+            index += 1
+
+    if snapshot_influences is not None:
+        snapshot["influence"] = snapshot_influences
+
+    logger.debug("Constraint influence set to %.3f on %d constraints.", influence, changed_count)
+    return changed_count
+
+
 def get_bone_constraints(
     armature: bpy.types.Object, 
     bone_name: str = None, 
@@ -89,46 +355,237 @@ def get_bone_constraints(
         Union[Dict[str, list], list]: Constraints for specified bone(s)
     """
     if armature.type != 'ARMATURE':
-        print("Active object is not an armature.")
+        logger.warning("Active object is not an armature.")
         return []
 
-    # Find bone collection
-    target_collection = None
-    for collection in armature.data.collections:
-        if collection.name == collection_name:
-            target_collection = collection
-            break
+    # Find bones in the collection
+    collection_bones = get_collection_pose_bones(armature, collection_name)
 
-    if not target_collection:
-        print(f"Collection '{collection_name}' not found.")
+    if collection_bones is None:
+        logger.warning("Collection '%s' not found.", collection_name)
         return []
 
     # Process constraints
     constraints_map = {}
-    for bone in armature.pose.bones:
-        # Check bone collection
-        if (bone.bone and bone.bone.collections and 
-            target_collection.name in [c.name for c in bone.bone.collections]):
-            
-            # If specific bone is requested
-            if bone_name and bone.name != bone_name:
-                continue
-
-            # Collect constraints
-            bone_constraints = [
-                {
-                    'type': constraint.type, 
-                    'name': constraint.name, 
-                    'muted': constraint.mute
-                } 
-                for constraint in bone.constraints
-            ]
-
-            if bone_name:
-                return bone_constraints
-
-            constraints_map[bone.name] = bone_constraints
+    for bone in collection_bones:
+        # If specific bone is requested
+        if bone_name and bone.name != bone_name:
+            continue
+
+        # Collect constraints
+        bone_constraints = [
+            {
+                'type': constraint.type, 
+                'name': constraint.name, 
+                'muted': constraint.mute
+            } 
+            for constraint in bone.constraints
+        ]
+
+        if bone_name:
+            return bone_constraints
+
+        constraints_map[bone.name] = bone_constraints
 
     return constraints_map
 
 
+# 列形式のコンストレイント表で、ボーンとコンストレイントの名前を結合するときの区切り文字
+_KEY_SEPARATOR = "\x1f"
+
+
+class ConstraintTable:
+    """
+    Columnar table of the constraints of a bone collection.
+    Each row is one constraint. String values are stored once in a name table
+    and referenced by index (-1 means none), so the columns are plain NumPy arrays.
+
+    Columns:
+        bone_index (int32): Index into bone_names.
+        constraint_names (ndarray of str): Constraint name.
+        type_code (int16): Index into type_names.
+        mute (bool): Constraint mute state.
+        influence (float32): Constraint influence.
+        target_index (int32): Index into target_names (-1 if no target).
+        subtarget_index (int32): Index into subtarget_names (-1 if no subtarget).
+
+    Usage:
+    before = get_bone_constraints_table(rig)
+    ...
+    diff = diff_constraint_tables(before, get_bone_constraints_table(rig))
+    """
+
+    def __init__(self, bone_names, type_names, target_names, subtarget_names, bone_index,
+                 constraint_names, type_code, mute, influence, target_index, subtarget_index):
+        self.bone_names: List[str] = bone_names
+        self.type_names: List[str] = type_names
+        self.target_names: List[str] = target_names
+        self.subtarget_names: List[str] = subtarget_names
+        self.bone_index: np.ndarray = bone_index
+        self.constraint_names: np.ndarray = constraint_names
+        self.type_code: np.ndarray = type_code
+        self.mute: np.ndarray = mute
+        self.influence: np.ndarray = influence
+        self.target_index: np.ndarray = target_index
+        self.subtarget_index: np.ndarray = subtarget_index
+
+    def __len__(self) -> int:
+        return len(self.bone_index)
+
+    def keys(self) -> np.ndarray:
+        """
+        Row keys made of the bone and constraint names, used to match rows between tables.
+        """
+        bone_names = np.asarray(self.bone_names, dtype=str)[self.bone_index]
+        return np.char.add(np.char.add(bone_names, _KEY_SEPARATOR), self.constraint_names.astype(str))
+
+    def types(self) -> np.ndarray:
+        return _lookup_names(self.type_names, self.type_code)
+
+    def targets(self) -> np.ndarray:
+        return _lookup_names(self.target_names, self.target_index)
+
+    def subtargets(self) -> np.ndarray:
+        return _lookup_names(self.subtarget_names, self.subtarget_index)
+
+    def to_dict(self) -> Dict[str, list]:
+        """
+        Convert the table to JSON serializable lists.
+        """
+        return {
+            "bone_names": list(self.bone_names),
+            "type_names": list(self.type_names),
+            "target_names": list(self.target_names),
+            "subtarget_names": list(self.subtarget_names),
+            "bone_index": self.bone_index.tolist(),
+            "constraint_names": self.constraint_names.tolist(),
+            "type_code": self.type_code.tolist(),
+            "mute": self.mute.tolist(),
+            "influence": self.influence.tolist(),
+            "target_index": self.target_index.tolist(),
+            "subtarget_index": self.subtarget_index.tolist(),
+        }
+
+
+def _lookup_names(names: List[str], indices: np.ndarray) -> np.ndarray:
+    # 名前表を参照して文字列の列に戻す（-1は空文字列）
+    table = np.asarray(list(names) + [""], dtype=str)
+    return table[np.where(indices < 0, len(names), indices)]
+
+
+def _intern(names: List[str], index_by_name: Dict[str, int], name: str) -> int:
+    if not name:
+        return -1
+    index = index_by_name.get(name)
+    if index is None:
+        index = index_by_name[name] = len(names)
+        names.append(name)
+    return index
+
+
+def get_bone_constraints_table(
+    armature: bpy.types.Object, 
+    collection_name: str = "DEF"
+) -> Optional[ConstraintTable]:
+    """
+    Columnar variant of get_bone_constraints.
+    Mute and influence are read with foreach_get per bone.
+
+    Args:
+        armature (bpy.types.Object): The armature object to process.
+        collection_name (str, optional): Bone collection to filter. 
+            Defaults to "DEF".
+
+    Returns:
+        Optional[ConstraintTable]: The constraint table, or None if the collection does not exist.
+    """
+    if armature.type != 'ARMATURE':
+        logger.warning("Active object is not an armature.")
+        return None
+
+    collection_bones = get_collection_pose_bones(armature, collection_name)
+    if collection_bones is None:
+        logger.warning("Collection '%s' not found.", collection_name)
+        return None
+
+    total = sum(len(bone.constraints) for bone in collection_bones)
+    bone_index = np.empty(total, dtype=np.int32)
+    type_code = np.empty(total, dtype=np.int16)
+    mute = np.empty(total, dtype=bool)
+    influence = np.empty(total, dtype=np.float32)
+    target_index = np.full(total, -1, dtype=np.int32)
+    subtarget_index = np.full(total, -1, dtype=np.int32)
+    constraint_names = []
+
+    bone_names = [bone.name for bone in collection_bones]
+    type_names, target_names, subtarget_names = [], [], []
+    type_ids, target_ids, subtarget_ids = {}, {}, {}
+
+    row = 0
+    for i, bone in enumerate(collection_bones):
+        constraints = bone.constraints
+        count = len(constraints)
+        if count == 0:
+            continue
+        end = row + count
+        bone_index[row:end] = i
+        constraints.foreach_get("mute", mute[row:end])
+        constraints.foreach_get("influence", influence[row:end])
+        for j, constraint in enumerate(constraints, start=row):
+            constraint_names.append(constraint.name)
+            type_code[j] = _intern(type_names, type_ids, constraint.type)
+            target = getattr(constraint, "target", None)
+            if target is not None:
+                target_index[j] = _intern(target_names, target_ids, target.name)
+            subtarget_index[j] = _intern(subtarget_names, subtarget_ids, getattr(constraint, "subtarget", ""))
+        row = end
+
+    return ConstraintTable(
+        bone_names, type_names, target_names, subtarget_names, bone_index,
+        np.asarray(constraint_names, dtype=str), type_code, mute, influence, target_index, subtarget_index)
+
+
+def diff_constraint_tables(
+    old: ConstraintTable, 
+    new: ConstraintTable, 
+    influence_tolerance: float = 1e-6
+) -> Dict[str, np.ndarray]:
+    """
+    Compare two constraint tables. Rows are matched by bone and constraint name.
+
+    Args:
+        old (ConstraintTable): The table before the change.
+        new (ConstraintTable): The table after the change.
+        influence_tolerance (float, optional): Influence differences up to this value are ignored.
+
+    Returns:
+        Dict[str, np.ndarray]: Row index arrays:
+            "added" (rows of new only in new), "removed" (rows of old only in old),
+            "matched_old" / "matched_new" (rows present in both, in the same order),
+            and boolean masks over the matched rows: "mute_changed", "influence_changed",
+            "type_changed", "target_changed", "subtarget_changed" and "changed" (any of them).
+    """
+    old_keys, new_keys = old.keys(), new.keys()
+    _common, matched_old, matched_new = np.intersect1d(old_keys, new_keys, return_indices=True)
+
+    added = np.setdiff1d(np.arange(len(new_keys)), matched_new, assume_unique=True)
+    removed = np.setdiff1d(np.arange(len(old_keys)), matched_old, assume_unique=True)
+
+    mute_changed = old.mute[matched_old] != new.mute[matched_new]
+    influence_changed = np.abs(old.influence[matched_old] - new.influence[matched_new]) > influence_tolerance
+    type_changed = old.types()[matched_old] != new.types()[matched_new]
+    target_changed = old.targets()[matched_old] != new.targets()[matched_new]
+    subtarget_changed = old.subtargets()[matched_old] != new.subtargets()[matched_new]
+
+    return {
+        "added": added,
+        "removed": removed,
+        "matched_old": matched_old,
+        "matched_new": matched_new,
+        "mute_changed": mute_changed,
+        "influence_changed": influence_changed,
+        "type_changed": type_changed,
+        "target_changed": target_changed,
+        "subtarget_changed": subtarget_changed,
+        "changed": mute_changed | influence_changed | type_changed | target_changed | subtarget_changed,
+    }
@@ -5,8 +5,319 @@ This module provides utility functions for adding drivers to bone constraints
 in Blender armatures for more fine-grained control.
 """
 
+import time
+
 import bpy
-from typing import Dict, List, Union, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from . import bone_constraint_utils
+from . import conversion_logger
+
+logger = conversion_logger.get_logger(__name__)
+
+
+# コンストレイント影響度ドライバーの設定値
+INFLUENCE_PROPERTY_NAME = "constraint_influence"
+INFLUENCE_PROPERTY_PATH = f'["{INFLUENCE_PROPERTY_NAME}"]'
+INFLUENCE_VARIABLE_NAME = "influence"
+
+
+def ensure_constraint_influence_property(armature: bpy.types.Object):
+    """
+    Add the custom property that the influence drivers read, if it is missing.
+    
+    Args:
+        armature (bpy.types.Object): The armature object
+    """
+    if INFLUENCE_PROPERTY_NAME in armature:
+        return
+    armature[INFLUENCE_PROPERTY_NAME] = 1.0
+    # Add property metadata for UI
+    try:
+        ui_data = armature.id_properties_ui(INFLUENCE_PROPERTY_NAME)
+        ui_data.update(min=0.0, max=1.0, soft_min=0.0, soft_max=1.0,
+                       description="Global influence of DEF bone constraints")
+    except (AttributeError, TypeError):
+        # Older Blender versions have different API
+        pass
+
+
+def collect_influence_targets(
+    armature: bpy.types.Object,
+    constraint_types: Optional[List[str]] = None,
+    collection_name: str = "DEF"
+) -> Optional[List[Tuple[str, str]]]:
+    """
+    Collect the constraints whose influence should be driven.
+    
+    Args:
+        armature (bpy.types.Object): The armature object to process
+        constraint_types (List[str], optional): List of constraint types to affect.
+            If None, all constraints will be affected.
+        collection_name (str, optional): Bone collection to filter.
+            Defaults to "DEF".
+            
+    Returns:
+        Optional[List[Tuple[str, str]]]: (bone name, influence data path) pairs,
+            or None if the bone collection does not exist
+    """
+    def_bones = bone_constraint_utils.get_collection_pose_bones(armature, collection_name)
+    if def_bones is None:
+        return None
+
+    targets = []
+    for bone in def_bones:
+        for constraint in bone.constraints:
+            # Skip if constraint type doesn't match the filter (if specified)
+            if constraint_types and constraint.type not in constraint_types:
+                continue
+            # Skip if the constraint doesn't have an influence property
+            if not hasattr(constraint, "influence"):
+                continue
+            targets.append((bone.name, influence_data_path(bone.name, constraint.name)))
+    return targets
+
+
+def influence_data_path(bone_name: str, constraint_name: str) -> str:
+    """
+    Build the data path of a pose bone constraint's influence, relative to the armature object.
+    
+    Args:
+        bone_name (str): Pose bone name
+        constraint_name (str): Constraint name
+        
+    Returns:
+        str: e.g. 'pose.bones["DEF-spine"].constraints["Copy Transforms"].influence'
+    """
+    escape = bpy.utils.escape_identifier
+    return f'pose.bones["{escape(bone_name)}"].constraints["{escape(constraint_name)}"].influence'
+
+
+def is_influence_driver_configured(driver: bpy.types.Driver, armature: bpy.types.Object) -> bool:
+    """
+    Check whether a driver reads exactly the armature's influence property.
+    
+    Args:
+        driver (bpy.types.Driver): The driver to check
+        armature (bpy.types.Object): The armature object owning the property
+        
+    Returns:
+        bool: True if the driver has the expected single variable and expression
+    """
+    if driver.type != 'SCRIPTED' or driver.expression != INFLUENCE_VARIABLE_NAME:
+        return False
+    if len(driver.variables) != 1:
+        return False
+    var = driver.variables[0]
+    if var.name != INFLUENCE_VARIABLE_NAME or var.type != 'SINGLE_PROP':
+        return False
+    target = var.targets[0]
+    return (target.id_type == 'OBJECT' and target.id == armature
+            and target.data_path == INFLUENCE_PROPERTY_PATH)
+
+
+def configure_influence_driver(driver: bpy.types.Driver, armature: bpy.types.Object):
+    """
+    Make a driver read the armature's influence property through a single variable.
+    
+    Args:
+        driver (bpy.types.Driver): The driver to configure
+        armature (bpy.types.Object): The armature object owning the property
+    """
+    # 重複した変数を含め、既存の変数をすべて削除してから1つだけ作成する
+    for var in list(driver.variables):
+        driver.variables.remove(var)
+
+    driver.type = 'SCRIPTED'
+    var = driver.variables.new()
+    var.name = INFLUENCE_VARIABLE_NAME
+    var.type = 'SINGLE_PROP'
+    
+    # Set target to the armature's custom property
+    target = var.targets[0]
+    target.id_type = 'OBJECT'
+    target.id = armature
+    target.data_path = INFLUENCE_PROPERTY_PATH
+    
+    # Set driver expression to use the variable directly
+    driver.expression = INFLUENCE_VARIABLE_NAME
+
+
+def _index_drivers_by_path(armature: bpy.types.Object) -> Dict[str, List[bpy.types.FCurve]]:
+    # 既存のドライバーをデータパスごとにまとめる（1回の走査）
+    drivers_by_path = {}
+    if armature.animation_data:
+        for fcurve in armature.animation_data.drivers:
+            drivers_by_path.setdefault(fcurve.data_path, []).append(fcurve)
+    return drivers_by_path
+
+
+def bulk_create_influence_drivers(
+    armature: bpy.types.Object,
+    data_paths: Iterable[str]
+) -> List[str]:
+    """
+    Create influence drivers for many data paths in one pass over animation_data.drivers.
+    The data paths must not have drivers yet (see _index_drivers_by_path).
+    A data path that fails is logged and skipped; the other drivers are still created.
+    
+    Args:
+        armature (bpy.types.Object): The armature object owning the drivers
+        data_paths (Iterable[str]): Influence data paths relative to the armature object
+        
+    Returns:
+        List[str]: Data paths whose drivers were created
+    """
+    start_time = time.perf_counter()
+    ensure_constraint_influence_property(armature)
+    if armature.animation_data is None:
+        armature.animation_data_create()
+    drivers = armature.animation_data.drivers
+
+    created_paths = []
+    for data_path in data_paths:
+        fcurve = None
+        try:
+            fcurve = drivers.new(data_path)
+            configure_influence_driver(fcurve.driver, armature)
+        except Exception as e:
+            logger.error("Error adding driver on %s: %s", data_path, e)
+            # 設定途中のドライバーを残さない
+            if fcurve is not None:
+                drivers.remove(fcurve)
+            continue
+        created_paths.append(data_path)
+
+    logger.debug("Created %d constraint drivers in %.4fs.", len(created_paths), time.perf_counter() - start_time)
+    return created_paths
+
+
+def bulk_remove_influence_drivers(
+    armature: bpy.types.Object,
+    data_paths: Iterable[str]
+) -> List[str]:
+    """
+    Remove the drivers of many data paths in one pass over animation_data.drivers.
+    
+    Args:
+        armature (bpy.types.Object): The armature object owning the drivers
+        data_paths (Iterable[str]): Influence data paths relative to the armature object
+        
+    Returns:
+        List[str]: Data paths whose drivers were removed
+    """
+    if armature.animation_data is None:
+        return []
+
+    start_time = time.perf_counter()
+    target_paths = set(data_paths)
+    drivers = armature.animation_data.drivers
+    # 削除中にコレクションが変化するため、対象のF-Curveを先にまとめて集める
+    fcurves = [fcurve for fcurve in drivers if fcurve.data_path in target_paths]
+    removed_paths = []
+    for fcurve in fcurves:
+        removed_paths.append(fcurve.data_path)
+        drivers.remove(fcurve)
+
+    logger.debug("Removed %d constraint drivers in %.4fs.", len(removed_paths), time.perf_counter() - start_time)
+    return removed_paths
+
+
+def _reconcile_influence_drivers(
+    armature: bpy.types.Object,
+    constraint_types: Optional[List[str]],
+    collection_name: str
+) -> Tuple[Optional[Dict[str, int]], Dict[str, int]]:
+    """
+    Bring the influence drivers to the desired state.
+    
+    Returns:
+        Tuple[Optional[Dict[str, int]], Dict[str, int]]: Change counts (None if the
+            collection does not exist) and driven constraint counts per bone
+    """
+    targets = collect_influence_targets(armature, constraint_types, collection_name)
+    if targets is None:
+        return None, {}
+
+    start_time = time.perf_counter()
+    ensure_constraint_influence_property(armature)
+    drivers_by_path = _index_drivers_by_path(armature)
+    stats = {"created": 0, "repaired": 0, "duplicates_removed": 0, "unchanged": 0, "failed": 0}
+    driven_per_bone = {}
+    missing = []
+
+    for bone_name, data_path in targets:
+        fcurves = drivers_by_path.get(data_path)
+        if not fcurves:
+            # 不足しているドライバーは最後にまとめて作成する
+            missing.append((bone_name, data_path))
+            continue
+        try:
+            fcurve = fcurves[0]
+            # 同じデータパスに複数のF-Curveがある場合は先頭以外を削除する
+            for duplicate in fcurves[1:]:
+                armature.animation_data.drivers.remove(duplicate)
+                stats["duplicates_removed"] += 1
+            if is_influence_driver_configured(fcurve.driver, armature):
+                stats["unchanged"] += 1
+            else:
+                configure_influence_driver(fcurve.driver, armature)
+                stats["repaired"] += 1
+        except Exception as e:
+            logger.error("Error reconciling driver on %s: %s", data_path, e)
+            stats["failed"] += 1
+            continue
+        driven_per_bone[bone_name] = driven_per_bone.get(bone_name, 0) + 1
+
+    if missing:
+        created_paths = set(bulk_create_influence_drivers(armature, [path for _, path in missing]))
+        for bone_name, data_path in missing:
+            if data_path in created_paths:
+                driven_per_bone[bone_name] = driven_per_bone.get(bone_name, 0) + 1
+        stats["created"] = len(created_paths)
+        stats["failed"] += len(missing) - len(created_paths)
+
+    stats["seconds"] = round(time.perf_counter() - start_time, 6)
+
+    logger.info("Constraint drivers: %d created, %d repaired, %d duplicates removed, %d unchanged in %.4fs.",
+                stats["created"], stats["repaired"], stats["duplicates_removed"], stats["unchanged"],
+                stats["seconds"])
+    return stats, driven_per_bone
+
+
+def reconcile_constraint_influence_drivers(
+    armature: bpy.types.Object,
+    constraint_types: Optional[List[str]] = None,
+    collection_name: str = "DEF"
+) -> Optional[Dict[str, int]]:
+    """
+    Make every DEF constraint influence driven by the armature's influence property,
+    changing only what differs from that state.
+    Existing drivers are inspected in one pass: missing drivers are created,
+    drivers with extra or wrong variables are repaired, duplicate F-curves are removed
+    and correct drivers are left untouched, so running it again is a no-op.
+    
+    Args:
+        armature (bpy.types.Object): The armature object to process
+        constraint_types (List[str], optional): List of constraint types to affect.
+            If None, all constraints will be affected.
+        collection_name (str, optional): Bone collection to filter.
+            Defaults to "DEF".
+            
+    Returns:
+        Optional[Dict[str, int]]: Counts of created, repaired, duplicates_removed,
+            unchanged and failed drivers and the elapsed seconds,
+            or None if nothing could be processed
+    """
+    # Validate armature type
+    if armature.type != 'ARMATURE':
+        logger.warning("Active object is not an armature. Please select an armature.")
+        return None
+
+    stats, _driven_per_bone = _reconcile_influence_drivers(armature, constraint_types, collection_name)
+    if stats is None:
+        logger.warning("%s bone collection not found. This might not be a Rigify rig.", collection_name)
+    return stats
 
 
 def add_constraint_influence_drivers(
@@ -16,6 +327,8 @@ def add_constraint_influence_drivers(
 ) -> Dict[str, int]:
     """
     Add drivers to control the influence of constraints on DEF bones.
+    Existing drivers are reused (see reconcile_constraint_influence_drivers),
+    so calling this repeatedly does not add variables or F-curves.
     
     Args:
         armature (bpy.types.Object): The armature object to process
@@ -25,90 +338,22 @@ def add_constraint_influence_drivers(
             Defaults to "DEF".
             
     Returns:
-        Dict[str, int]: A dictionary of bone names and their processed constraint count
+        Dict[str, int]: A dictionary of bone names and their driven constraint count
     """
     # Validate armature type
     if armature.type != 'ARMATURE':
-        print("Active object is not an armature. Please select an armature.")
+        logger.warning("Active object is not an armature. Please select an armature.")
         return {}
-        
-    # Ensure the armature has the custom property for influence control
-    if 'constraint_influence' not in armature:
-        armature['constraint_influence'] = 1.0
-        # Add property metadata for UI
-        try:
-            ui_data = armature.id_properties_ui('constraint_influence')
-            ui_data.update(min=0.0, max=1.0, description="Global influence of DEF bone constraints")
-        except (AttributeError, TypeError):
-            # Older Blender versions have different API
-            pass
-    
-    # Find the DEF bone collection
-    def_collection = None
-    for collection in armature.data.collections:
-        if collection.name == collection_name:
-            def_collection = collection
-            break
-            
-    if not def_collection:
-        print(f"{collection_name} bone collection not found. This might not be a Rigify rig.")
+
+    stats, driven_per_bone = _reconcile_influence_drivers(armature, constraint_types, collection_name)
+    if stats is None:
+        logger.warning("%s bone collection not found. This might not be a Rigify rig.", collection_name)
         return {}
-        
-    # Track processed constraints
-    result = {}
-    
-    # Process each bone in the DEF collection
-    for bone in armature.pose.bones:
-        # Check if bone is in DEF collection
-        if (bone.bone and bone.bone.collections and 
-            def_collection.name in [c.name for c in bone.bone.collections]):
-            
-            constraint_count = 0
-            
-            # Add drivers to each constraint based on specified types
-            for constraint in bone.constraints:
-                # Skip if constraint type doesn't match the filter (if specified)
-                if constraint_types and constraint.type not in constraint_types:
-                    continue
-                    
-                # Skip if the constraint doesn't have an influence property
-                if not hasattr(constraint, "influence"):
-                    continue
-                
-                # Create driver for constraint influence
-                try:
-                    fcurve = constraint.driver_add("influence")
-                    driver = fcurve.driver
-                    
-                    # Create a variable for the armature's custom property
-                    var = driver.variables.new()
-                    var.name = "influence"
-                    var.type = 'SINGLE_PROP'
-                    
-                    # Set target to the armature's custom property
-                    target = var.targets[0]
-                    target.id_type = 'OBJECT'
-                    target.id = armature
-                    target.data_path = '["constraint_influence"]'
-                    
-                    # Set driver expression to use the variable directly
-                    driver.expression = "influence"
-                    
-                    constraint_count += 1
-                except Exception as e:
-                    print(f"Error adding driver to {bone.name}.{constraint.name}: {e}")
-            
-            # Record results
-            if constraint_count > 0:
-                result[bone.name] = constraint_count
-                print(f"{bone.name}: {constraint_count} constraint drivers added.")
-    
-    # Print summary
-    total_constraints = sum(result.values())
-    total_bones = len(result)
-    print(f"Total: {total_constraints} constraint drivers added across {total_bones} bones.")
+
+    for bone_name, constraint_count in driven_per_bone.items():
+        logger.debug("%s: %d constraint drivers set.", bone_name, constraint_count)
     
-    return result
+    return driven_per_bone
 
 
 def remove_constraint_influence_drivers(
@@ -127,60 +372,37 @@ def remove_constraint_influence_drivers(
             Defaults to "DEF".
             
     Returns:
-        Dict[str, int]: A dictionary of bone names and their processed constraint count
+        Dict[str, int]: A dictionary of bone names and their removed driver count
     """
     # Validate armature type
     if armature.type != 'ARMATURE':
-        print("Active object is not an armature. Please select an armature.")
+        logger.warning("Active object is not an armature. Please select an armature.")
         return {}
         
-    # Find the DEF bone collection
-    def_collection = None
-    for collection in armature.data.collections:
-        if collection.name == collection_name:
-            def_collection = collection
-            break
+    # Collect the influence data paths of the DEF bones
+    targets = collect_influence_targets(armature, constraint_types, collection_name)
             
-    if not def_collection:
-        print(f"{collection_name} bone collection not found. This might not be a Rigify rig.")
+    if targets is None:
+        logger.warning("%s bone collection not found. This might not be a Rigify rig.", collection_name)
+        return {}
+    
+    # Remove all drivers in one pass
+    start_time = time.perf_counter()
+    bone_by_path = {data_path: bone_name for bone_name, data_path in targets}
+    try:
+        removed_paths = bulk_remove_influence_drivers(armature, bone_by_path.keys())
+    except Exception as e:
+        logger.error("Error removing constraint drivers: %s", e)
         return {}
         
-    # Track processed constraints
+    # Track removed drivers per bone
     result = {}
+    for data_path in removed_paths:
+        bone_name = bone_by_path[data_path]
+        result[bone_name] = result.get(bone_name, 0) + 1
     
-    # Process each bone in the DEF collection
-    for bone in armature.pose.bones:
-        # Check if bone is in DEF collection
-        if (bone.bone and bone.bone.collections and 
-            def_collection.name in [c.name for c in bone.bone.collections]):
-            
-            constraint_count = 0
-            
-            # Remove drivers from each constraint based on specified types
-            for constraint in bone.constraints:
-                # Skip if constraint type doesn't match the filter (if specified)
-                if constraint_types and constraint.type not in constraint_types:
-                    continue
-                    
-                # Skip if the constraint doesn't have an influence property
-                if not hasattr(constraint, "influence"):
-                    continue
-                
-                # Remove driver for constraint influence
-                try:
-                    constraint.driver_remove("influence")
-                    constraint_count += 1
-                except Exception as e:
-                    print(f"Error removing driver from {bone.name}.{constraint.name}: {e}")
-            
-            # Record results
-            if constraint_count > 0:
-                result[bone.name] = constraint_count
-                print(f"{bone.name}: {constraint_count} constraint drivers removed.")
-    
-    # Print summary
-    total_constraints = sum(result.values())
-    total_bones = len(result)
-    print(f"Total: {total_constraints} constraint drivers removed across {total_bones} bones.")
+    # Log summary
+    logger.info("Total: %d constraint drivers removed across %d bones in %.4fs.",
+                sum(result.values()), len(result), time.perf_counter() - start_time)
     
     return result
@@ -0,0 +1,199 @@
+"""
+Conversion Diagnostics Module for VrmRigify Addon
+
+This module builds an opt-in, structured report about bone name mapping and
+the attachment of unmapped VRM bones. The report is only built when a
+ConversionDiagnostics object is passed to the conversion, and can be saved as
+JSON next to the converted output.
+"""
+
+import json
+import re
+from typing import Dict, List, Optional
+
+import bpy
+
+from . import conversion_logger
+
+logger = conversion_logger.get_logger(__name__)
+
+
+# VRM規定外（揺れもの等）のボーンを検出するためのキーワード
+CUSTOM_BONE_KEYWORDS = ("bust", "breast", "chest", "tail", "hair", "skirt", "sleeve")
+_CUSTOM_BONE_PATTERN = re.compile("|".join(map(re.escape, CUSTOM_BONE_KEYWORDS)), re.IGNORECASE)
+
+# 非マッピングボーンのアタッチ判定結果
+ATTACH = "attach"
+SKIP_IN_RIG = "skip_already_in_rig"
+SKIP_NO_PARENT = "skip_no_parent"
+SKIP_PARENT_NOT_IN_RIG = "skip_parent_not_in_rig"
+
+
+def is_custom_bone_name(bone_name: str) -> bool:
+    """
+    Check whether a bone name looks like a non-standard VRM bone (hair, skirt, ...).
+
+    Args:
+        bone_name (str): Bone name.
+
+    Returns:
+        bool: True if the name contains one of CUSTOM_BONE_KEYWORDS.
+    """
+    return _CUSTOM_BONE_PATTERN.search(bone_name) is not None
+
+
+def build_bone_name_mapping_report(
+    original_bone_names: Dict[int, str],
+    bone_name_mapping: Dict[str, str],
+    vrm_object: bpy.types.Object
+) -> Dict[str, object]:
+    """
+    Describe how the VRM bone names were standardized.
+
+    Args:
+        original_bone_names (Dict[int, str]): Bone IDs (BONE_ID_KEY values) and original bone names.
+        bone_name_mapping (Dict[str, str]): Standardized bone names to original bone names.
+        vrm_object (bpy.types.Object): The VRM armature object (after renaming).
+
+    Returns:
+        Dict[str, object]: The report section.
+    """
+    bone_name_mapping = bone_name_mapping or {}
+    standardized_names = [bone.name for bone in vrm_object.data.bones]
+    # オリジナル名から標準化名を引くための逆引き辞書
+    standardized_by_original = {orig: std for std, orig in bone_name_mapping.items()}
+
+    warnings = []
+    if not bone_name_mapping:
+        warnings.append("bone_name_mapping is empty")
+
+    custom_bones = []
+    seen = set()
+    for bone_name in original_bone_names.values():
+        if bone_name in seen or not is_custom_bone_name(bone_name):
+            continue
+        seen.add(bone_name)
+        standardized_name = standardized_by_original.get(bone_name)
+        custom_bones.append({"name": bone_name, "source": "original", "standardized_name": standardized_name})
+        if standardized_name is None:
+            warnings.append(f"Custom bone '{bone_name}' is NOT in the mapping")
+
+    for bone_name in standardized_names:
+        if bone_name in seen or not is_custom_bone_name(bone_name):
+            continue
+        seen.add(bone_name)
+        custom_bones.append({"name": bone_name, "source": "standardized",
+                             "original_name": bone_name_mapping.get(bone_name)})
+
+    return {
+        "original_bone_names": dict(original_bone_names),
+        "standardized_bone_names": standardized_names,
+        "bone_name_mapping": dict(bone_name_mapping),
+        "custom_bones": custom_bones,
+        "warnings": warnings,
+    }
+
+
+def build_attach_unmapped_bones_report(
+    rig_object: bpy.types.Object,
+    vrm_object: bpy.types.Object,
+    bone_name_mapping: Optional[Dict[str, str]]
+) -> Dict[str, object]:
+    """
+    Describe which VRM bones will be attached to the rig, using the same name
+    resolution as attach_unmapped_vrm_model_bones_to_rig.
+
+    Args:
+        rig_object (bpy.types.Object): The Rigify rig object.
+        vrm_object (bpy.types.Object): The VRM armature object.
+        bone_name_mapping (Dict[str, str], optional): Standardized bone names to original bone names.
+
+    Returns:
+        Dict[str, object]: The report section.
+    """
+    bone_name_mapping = bone_name_mapping or {}
+    armature_rig = rig_object.data
+    # 編集セッション中はarmature_rig.bonesに変更が反映されていないため、edit_bonesを参照する
+    rig_bones = armature_rig.edit_bones if rig_object.mode == 'EDIT' else armature_rig.bones
+    rig_bone_names = {bone.name for bone in rig_bones}
+
+    bones = []
+    action_counts = {ATTACH: 0, SKIP_IN_RIG: 0, SKIP_NO_PARENT: 0, SKIP_PARENT_NOT_IN_RIG: 0}
+    for vrm_bone in vrm_object.data.bones:
+        rig_name = bone_name_mapping.get(vrm_bone.name, vrm_bone.name)
+        parent_rig_name = None
+        if vrm_bone.parent:
+            parent_rig_name = bone_name_mapping.get(vrm_bone.parent.name, vrm_bone.parent.name)
+
+        if rig_name in rig_bone_names:
+            action = SKIP_IN_RIG
+        elif parent_rig_name is None:
+            action = SKIP_NO_PARENT
+        elif parent_rig_name not in rig_bone_names:
+            action = SKIP_PARENT_NOT_IN_RIG
+        else:
+            action = ATTACH
+        action_counts[action] += 1
+
+        bones.append({
+            "name": vrm_bone.name,
+            "rig_name": rig_name,
+            "parent": parent_rig_name,
+            "mapped": vrm_bone.name in bone_name_mapping,
+            "custom": is_custom_bone_name(vrm_bone.name),
+            "action": action,
+        })
+
+    return {
+        "vrm_bone_count": len(vrm_object.data.bones),
+        "rig_bone_count": len(rig_bone_names),
+        "action_counts": action_counts,
+        "bones": bones,
+    }
+
+
+class ConversionDiagnostics:
+    """
+    Collects diagnostics report sections for one conversion.
+
+    Usage:
+    diagnostics = ConversionDiagnostics("Avatar")
+    convert_vrm_to_rigify(context, vrm_object, diagnostics=diagnostics)
+    diagnostics.write_json("Avatar.diagnostics.json")
+    """
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.sections: Dict[str, Dict[str, object]] = {}
+
+    def add_section(self, section_name: str, data: Dict[str, object]):
+        """
+        Add a report section and log its warnings.
+
+        Args:
+            section_name (str): Section name.
+            data (Dict[str, object]): Section contents.
+        """
+        self.sections[section_name] = data
+        for warning in data.get("warnings", ()):
+            logger.warning("%s: %s", section_name, warning)
+
+    def warnings(self) -> List[str]:
+        return [w for data in self.sections.values() for w in data.get("warnings", ())]
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "name": self.name,
+            "blender_version": bpy.app.version_string,
+            "sections": self.sections,
+        }
+
+    def write_json(self, filepath: str):
+        """
+        Write the report to a JSON file.
+
+        Args:
+            filepath (str): Output path.
+        """
+        with open(filepath, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
@@ -0,0 +1,122 @@
+"""
+Conversion Logger Module for VrmRigify Addon
+
+This module provides the leveled logger used by the conversion functions.
+Console output is quiet by default (warnings and errors only). The full log,
+including per-bone debug messages, can be captured and written to a file at
+the end of a conversion.
+
+Messages use lazy %-style arguments, so they are only formatted when a handler
+actually records them:
+
+    logger = conversion_logger.get_logger(__name__)
+    logger.debug("renaming bone '%s' to '%s'", bone.name, target_name)
+
+Build expensive arguments (e.g. get_full_bone_path) only after checking
+logger.isEnabledFor(logging.DEBUG).
+"""
+
+import logging
+from contextlib import contextmanager
+from typing import List, Optional, Union
+
+LOGGER_NAME = "vrm_rigify_for_unity"
+DEFAULT_CONSOLE_LEVEL = logging.WARNING
+LOG_FORMAT = "%(levelname)s %(name)s: %(message)s"
+FILE_LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_root_logger = logging.getLogger(LOGGER_NAME)
+# Blenderのルートロガーの設定に左右されないよう、アドオン専用のハンドラーだけに出力する
+_root_logger.propagate = False
+
+if not any(getattr(h, "_vrm_rigify_console", False) for h in _root_logger.handlers):
+    _console_handler = logging.StreamHandler()
+    _console_handler._vrm_rigify_console = True
+    _console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _root_logger.addHandler(_console_handler)
+else:
+    # アドオンの再読み込み時は既存のハンドラーを使い回す
+    _console_handler = next(h for h in _root_logger.handlers
+                            if getattr(h, "_vrm_rigify_console", False))
+
+_console_handler.setLevel(DEFAULT_CONSOLE_LEVEL)
+_root_logger.setLevel(DEFAULT_CONSOLE_LEVEL)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Get the addon logger for a module.
+
+    Args:
+        name (str): Module name (usually __name__).
+
+    Returns:
+        logging.Logger: A child of the addon logger.
+    """
+    if name == LOGGER_NAME or name.startswith(LOGGER_NAME + "."):
+        return logging.getLogger(name)
+    return logging.getLogger(f"{LOGGER_NAME}.{name.rsplit('.', 1)[-1]}")
+
+
+def _to_level(level: Union[int, str]) -> int:
+    if isinstance(level, str):
+        return logging.getLevelName(level.upper())
+    return level
+
+
+def _update_logger_level():
+    # ロガーのレベルは全ハンドラーの中で最も詳細なレベルに合わせる
+    levels = [h.level for h in _root_logger.handlers] or [DEFAULT_CONSOLE_LEVEL]
+    _root_logger.setLevel(min(levels))
+
+
+def set_console_level(level: Union[int, str]):
+    """
+    Set the level of messages printed to the console.
+
+    Args:
+        level (Union[int, str]): Logging level (e.g. logging.INFO or "DEBUG").
+    """
+    _console_handler.setLevel(_to_level(level))
+    _update_logger_level()
+
+
+class _BufferHandler(logging.Handler):
+    """
+    Keeps the records in memory so the log file is written once at the end.
+    """
+
+    def __init__(self, level: int):
+        super().__init__(level)
+        self.records: List[logging.LogRecord] = []
+
+    def emit(self, record: logging.LogRecord):
+        self.records.append(record)
+
+
+@contextmanager
+def capture_log(filepath: Optional[str], level: Union[int, str] = logging.DEBUG):
+    """
+    Capture the log of the enclosed block and write it to a file when the block exits.
+    Nothing is captured if filepath is None.
+
+    Args:
+        filepath (str, optional): Output path of the log file.
+        level (Union[int, str], optional): Lowest level to capture. Defaults to DEBUG.
+    """
+    if not filepath:
+        yield
+        return
+
+    handler = _BufferHandler(_to_level(level))
+    handler.setFormatter(logging.Formatter(FILE_LOG_FORMAT))
+    _root_logger.addHandler(handler)
+    _update_logger_level()
+    try:
+        yield
+    finally:
+        _root_logger.removeHandler(handler)
+        _update_logger_level()
+        with open(filepath, "w", encoding="utf-8") as f:
+            for record in handler.records:
+                f.write(handler.format(record) + "\n")
@@ -0,0 +1,253 @@
+"""
+Conversion Pipeline Module for VrmRigify Addon
+
+This module runs the VRM to Rigify conversion stages in order. It is shared by
+the sidebar operator and the headless batch converter.
+"""
+
+from typing import Optional
+
+import bpy
+
+from . import vrm_rigify
+from . import vrm_extension_utils
+from . import conversion_diagnostics
+from .conversion_diagnostics import ConversionDiagnostics
+from .conversion_profiler import StageProfiler
+
+
+def convert_vrm_to_rigify(
+    context: bpy.types.Context,
+    vrm_object: bpy.types.Object,
+    hide_original: bool = True,
+    hide_metarig: bool = True,
+    copy_vrm_settings: bool = True,
+    setup_constraint_drivers: bool = True,
+    constraint_influence_mode: str = 'DRIVER',
+    use_metarig_cache: bool = True,
+    use_rig_cache: bool = True,
+    strip_face_before_generate: bool = False,
+    mesh_mode: str = 'COPY',
+    merge_orphan_weights: bool = False,
+    max_bone_influences: int = 0,
+    min_bone_weight: float = 0.0,
+    remove_empty_vertex_groups: bool = False,
+    disable_unweighted_bones: bool = False,
+    max_bones_per_mesh: int = 0,
+    profiler: Optional[StageProfiler] = None,
+    diagnostics: Optional[ConversionDiagnostics] = None
+) -> bpy.types.Object:
+    """
+    Convert a VRM armature into a Unity-ready Rigify rig.
+
+    Args:
+        context (bpy.types.Context): The current Blender context.
+        vrm_object (bpy.types.Object): The imported VRM armature object.
+        hide_original (bool, optional): Hide the VRM armature and its meshes afterwards.
+        hide_metarig (bool, optional): Hide the metarig afterwards.
+        copy_vrm_settings (bool, optional): Copy VRM extension data to the rig.
+        setup_constraint_drivers (bool, optional): Set up influence control of DEF constraints.
+        constraint_influence_mode (str, optional): 'DRIVER' adds a driver per DEF constraint.
+            'PROPERTY' uses a single Object property whose update callback writes the
+            influence, so nothing is evaluated during playback.
+        use_metarig_cache (bool, optional): Clone a cached, pre-assigned template metarig
+            instead of creating one with the Rigify operator.
+        use_rig_cache (bool, optional): Reuse a cached rig generated from an identical
+            metarig instead of running rigify_generate.
+        strip_face_before_generate (bool, optional): Remove the face bones except the eyes
+            from the metarig, so Rigify does not generate the face rig that is deleted afterwards.
+        mesh_mode (str, optional): 'COPY' parents copies of the VRM meshes to the rig and keeps
+            the originals on the VRM armature. 'MOVE' re-parents the original meshes to the rig
+            without copying them.
+        merge_orphan_weights (bool, optional): Merge the weights of vertex groups whose bone is not
+            in the rig into the nearest deforming ancestor bone, so they keep deforming the mesh.
+        max_bone_influences (int, optional): Keep at most this many bone weights per vertex,
+            like Unity's skin weights setting (0 for no limit).
+        min_bone_weight (float, optional): Remove bone weights below this value.
+        remove_empty_vertex_groups (bool, optional): Remove the bone vertex groups that have
+            no weight on their mesh.
+        disable_unweighted_bones (bool, optional): Turn off Deform on the leaf deform bones
+            that have no weight on any mesh.
+        max_bones_per_mesh (int, optional): Split meshes that reference more bones than this
+            into parts within the budget (0 for no limit).
+        profiler (StageProfiler, optional): Profiler that records each stage.
+            A private one is used if None.
+        diagnostics (ConversionDiagnostics, optional): Collects the bone mapping diagnostics
+            report. The report is not built if None.
+
+    Returns:
+        bpy.types.Object: The generated Rigify rig object.
+    """
+    if profiler is None:
+        profiler = StageProfiler(vrm_object.name)
+    stage = profiler.stage
+
+    # オリジナルのボーン名を保存
+    with stage("store_original_bone_names", vrm_object):
+        original_bone_names = vrm_rigify.store_original_bone_names(vrm_object)
+
+    # メインの変換プロセスを実行
+    with stage("rename_vrm_model_bones_name", vrm_object):
+        vrm_rigify.rename_vrm_model_bones_name(vrm_object)
+
+    # 標準化後のボーン名とオリジナルボーン名のマッピングを更新
+    with stage("update_bone_name_mapping_after_rename", vrm_object):
+        bone_name_mapping = vrm_rigify.update_bone_name_mapping_after_rename(
+            vrm_object, original_bone_names)
+
+    # 診断レポート（要求された場合のみ作成）
+    if diagnostics is not None:
+        with stage("diagnose_bone_name_mapping", vrm_object):
+            diagnostics.add_section("bone_name_mapping", conversion_diagnostics.build_bone_name_mapping_report(
+                original_bone_names, bone_name_mapping, vrm_object))
+
+    # メタリグを生成
+    metarig_name = f"{vrm_object.name}.metarig"
+    with stage("generate_template_metarig"):
+        metarig = vrm_rigify.generate_template_metarig(metarig_name, use_metarig_cache)
+
+    # ボーンのマッピング
+    with stage("mapping_metarig_and_vrm_model_bones", metarig, vrm_object):
+        bone_mapping = vrm_rigify.mapping_metarig_and_vrm_model_bones(metarig, vrm_object)
+
+    # メタリグのRigifyパラメーター調整（ポーズボーンのみを使うため編集モードの外で行う）
+    with stage("Modify_metarig_limb_rotation_axes", metarig):
+        vrm_rigify.Modify_metarig_limb_rotation_axes(metarig)
+    with stage("modify_metarig_limb_segments", metarig):
+        vrm_rigify.modify_metarig_limb_segments(metarig)
+
+    # メタリグの編集処理は1回の編集モードでまとめて行う
+    with stage("metarig_edit_session", metarig), vrm_rigify.ModeContext.edit_session(metarig):
+        with stage("remove_or_log_unmapped_metarig_bones", metarig):
+            vrm_rigify.remove_or_log_unmapped_metarig_bones(
+                metarig, bone_mapping, strip_face=strip_face_before_generate)
+        with stage("position_metarig_bones_to_vrm_model", metarig, vrm_object):
+            vrm_rigify.position_metarig_bones_to_vrm_model(metarig, vrm_object, bone_mapping)
+        with stage("adjust_position_of_metarig_spine_bones", metarig):
+            vrm_rigify.adjust_position_of_metarig_spine_bones(metarig)
+        with stage("modify_metarig_arm_hand_finger_rotation", metarig):
+            vrm_rigify.modify_metarig_arm_hand_finger_rotation(metarig)
+
+    # Rigifyリグを生成
+    with stage("generate_rigify_rig", metarig):
+        rig_object = vrm_rigify.generate_rigify_rig(metarig, use_rig_cache)
+
+    # リグの編集処理は1回の編集モードでまとめて行う
+    with stage("rig_edit_session", rig_object), vrm_rigify.ModeContext.edit_session(rig_object):
+        with stage("removed_rigify_rig_facial_bones", rig_object):
+            vrm_rigify.removed_rigify_rig_facial_bones(rig_object)
+        with stage("rename_rig_bones_to_match_vrm_model_vertex_groups", rig_object):
+            vrm_rigify.rename_rig_bones_to_match_vrm_model_vertex_groups(rig_object, bone_mapping, bone_name_mapping)
+
+        # 診断レポート（要求された場合のみ作成）
+        if diagnostics is not None:
+            with stage("diagnose_attach_unmapped_bones", rig_object, vrm_object):
+                diagnostics.add_section("attach_unmapped_bones", conversion_diagnostics.build_attach_unmapped_bones_report(
+                    rig_object, vrm_object, bone_name_mapping))
+
+        with stage("attach_unmapped_vrm_model_bones_to_rig", rig_object, vrm_object):
+            vrm_rigify.attach_unmapped_vrm_model_bones_to_rig(rig_object, vrm_object, bone_name_mapping)
+        with stage("modify_rigify_rig_eyes_control_bones", rig_object):
+            vrm_rigify.modify_rigify_rig_eyes_control_bones(rig_object)
+        with stage("adjust_bone_hierarchy_for_Unity", rig_object):
+            vrm_rigify.adjust_bone_hierarchy_for_Unity(rig_object)
+
+    with stage("copy_shape_key_controls_from_vrm_armature", rig_object, vrm_object):
+        vrm_rigify.copy_shape_key_controls_from_vrm_armature(rig_object, vrm_object)
+
+    # リグのボーン調整
+    with stage("disable_ik_stretching", rig_object):
+        vrm_rigify.disable_ik_stretching(rig_object)
+    with stage("show_ik_toggle_pole", rig_object):
+        vrm_rigify.show_ik_toggle_pole(rig_object)
+
+    # メッシュのコピー（または移動）と設定
+    # コピー後にウェイトを編集する場合は、元のモデルを変更しないようメッシュデータもコピーする
+    edits_mesh_weights = (merge_orphan_weights or max_bone_influences > 0 or min_bone_weight > 0.0
+                          or remove_empty_vertex_groups or disable_unweighted_bones or max_bones_per_mesh > 0)
+    if mesh_mode == 'MOVE':
+        with stage("move_meshes_between_armatures", vrm_object, rig_object):
+            mesh_object_mapping = vrm_rigify.move_meshes_between_armatures(vrm_object, rig_object, bone_name_mapping)
+    else:
+        with stage("copy_meshes_between_armatures", vrm_object, rig_object):
+            mesh_object_mapping = vrm_rigify.copy_meshes_between_armatures(
+                vrm_object, rig_object, bone_name_mapping, copy_mesh_data=edits_mesh_weights)
+    with stage("change_meshes_modifier_object", rig_object):
+        vrm_rigify.change_meshes_modifier_object(rig_object)
+
+    # 目のボーンの制約など最終調整
+    with stage("add_eye_bone_constraints_for_Unity", rig_object):
+        vrm_rigify.add_eye_bone_constraints_for_Unity(rig_object)
+
+    # 元のArmatureのボーン名を元に戻す
+    with stage("restore_original_bone_names", vrm_object):
+        vrm_rigify.restore_original_bone_names(vrm_object, original_bone_names)
+
+    # リグに存在しないボーンのウェイトを祖先のボーンに統合
+    if merge_orphan_weights:
+        with stage("merge_orphan_vertex_weights", rig_object):
+            orphan_weights_report = vrm_rigify.merge_orphan_vertex_weights(rig_object, vrm_object)
+        if diagnostics is not None:
+            diagnostics.add_section("orphan_vertex_weights", orphan_weights_report)
+
+    # 頂点あたりのボーンウェイト数の制限と小さいウェイトの削除
+    if max_bone_influences > 0 or min_bone_weight > 0.0:
+        with stage("limit_vertex_weight_influences", rig_object):
+            influences_report = vrm_rigify.limit_vertex_weight_influences(
+                rig_object, max_bone_influences, min_bone_weight)
+        if diagnostics is not None:
+            diagnostics.add_section("vertex_weight_influences", influences_report)
+
+    # ウェイトのない頂点グループと変形ボーンの整理
+    if remove_empty_vertex_groups or disable_unweighted_bones:
+        with stage("strip_unweighted_deform_data", rig_object):
+            unweighted_report = vrm_rigify.strip_unweighted_deform_data(
+                rig_object, remove_empty_vertex_groups, disable_unweighted_bones)
+        if diagnostics is not None:
+            diagnostics.add_section("unweighted_deform_data", unweighted_report)
+
+    # ボーン数の上限を超えるメッシュの分割（追加したパーツはVRM拡張情報のコピーで参照を追加する）
+    mesh_parts = {}
+    if max_bones_per_mesh > 0:
+        with stage("split_meshes_by_bone_budget", rig_object):
+            split_report = vrm_rigify.split_meshes_by_bone_budget(rig_object, max_bones_per_mesh)
+        mesh_parts = split_report["mesh_parts"]
+        if diagnostics is not None:
+            diagnostics.add_section("mesh_bone_budget", split_report)
+
+    # コンストレイントドライバーのセットアップ
+    if setup_constraint_drivers and constraint_influence_mode == 'PROPERTY':
+        with stage("setup_rig_constraint_influence_property", rig_object):
+            vrm_rigify.setup_rig_constraint_influence_property(rig_object)
+    elif setup_constraint_drivers:
+        with stage("setup_rig_constraint_drivers", rig_object):
+            vrm_rigify.setup_rig_constraint_drivers(rig_object)
+
+    # VRM拡張情報のコピー
+    if copy_vrm_settings:
+        with stage("copy_vrm_extension_from_armature", vrm_object, rig_object):
+            vrm_extension_utils.copy_vrm_extension_from_armature(
+                vrm_object, rig_object, mesh_object_mapping, mesh_parts)
+
+    # オブジェクトの表示設定（リクエストに応じて非表示）
+    if hide_metarig:
+        metarig.hide_set(True)
+        metarig.hide_render = True
+
+    if hide_original:
+        for vrm_child in vrm_object.children:
+            if vrm_child.type == 'MESH':
+                vrm_child.hide_set(True)
+                vrm_child.hide_render = True
+        vrm_object.hide_set(True)
+        vrm_object.hide_render = True
+
+    # 最終設定
+    rig_object.show_in_front = True
+
+    # 新しいリグを選択し、アクティブに設定
+    bpy.ops.object.select_all(action='DESELECT')
+    rig_object.select_set(True)
+    context.view_layer.objects.active = rig_object
+
+    return rig_object
@@ -0,0 +1,190 @@
+"""
+Conversion Profiler Module for VrmRigify Addon
+
+This module records per-stage timing and counters for the conversion pipeline
+and writes them as a JSON report and a compact console table.
+"""
+
+import json
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import bpy
+
+
+# 作成されたデータブロック数の集計対象となるbpy.dataのコレクション
+DATA_BLOCK_TYPES = (
+    "objects", "meshes", "armatures", "actions", "collections",
+    "materials", "texts", "images", "node_groups",
+)
+
+# 現在計測中のプロファイラー（count()から参照される）
+_active_profiler: Optional["StageProfiler"] = None
+
+
+def count(counter: str, amount: int = 1):
+    """
+    Add to a counter of the stage currently being profiled.
+    Does nothing when no profiler is active.
+
+    Args:
+        counter (str): Counter name (e.g. "mode_set").
+        amount (int, optional): Amount to add. Defaults to 1.
+    """
+    if _active_profiler is not None:
+        _active_profiler.add_count(counter, amount)
+
+
+def _count_data_blocks() -> Dict[str, int]:
+    return {name: len(getattr(bpy.data, name)) for name in DATA_BLOCK_TYPES}
+
+
+def _count_bones_and_meshes(objects) -> tuple:
+    bones = 0
+    meshes = set()
+    for obj in objects:
+        if obj is None:
+            continue
+        if obj.type == 'ARMATURE':
+            bones += len(obj.data.bones)
+            meshes.update(child.name for child in obj.children if child.type == 'MESH')
+        elif obj.type == 'MESH':
+            meshes.add(obj.name)
+    return bones, len(meshes)
+
+
+class StageProfiler:
+    """
+    Records wall time, mode_set calls, bones and meshes touched and
+    data-blocks created for each conversion stage.
+
+    Usage:
+    profiler = StageProfiler("Avatar")
+    with profiler.stage("generate_rigify_rig", metarig):
+        ...
+    profiler.print_table()
+    """
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.stages: List[Dict[str, object]] = []
+        self._current: Optional[Dict[str, object]] = None
+
+    @contextmanager
+    def stage(self, stage_name: str, *objects):
+        """
+        Profile the enclosed block as one stage.
+        Stages may be nested; a nested stage is recorded with a greater depth and
+        only top-level stages are summed into the total time.
+
+        Args:
+            stage_name (str): Name shown in the report.
+            *objects: Objects the stage works on. Their bones and meshes are counted as touched.
+        """
+        global _active_profiler
+        previous_profiler, previous_stage = _active_profiler, self._current
+
+        depth = 0 if previous_stage is None else previous_stage["depth"] + 1
+        record = {"stage": stage_name, "depth": depth, "seconds": 0.0, "mode_set": 0, "counters": {}}
+        bones_before, meshes_before = _count_bones_and_meshes(objects)
+        data_before = _count_data_blocks()
+
+        record["_index"] = len(self.stages)
+        self._current = record
+        _active_profiler = self
+        start_time = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - start_time
+            _active_profiler = previous_profiler
+            self._current = previous_stage
+
+            bones_after, meshes_after = _count_bones_and_meshes(objects)
+            record["bones"] = max(bones_before, bones_after)
+            record["meshes"] = max(meshes_before, meshes_after)
+
+            data_after = _count_data_blocks()
+            created = {name: data_after[name] - data_before[name]
+                       for name in DATA_BLOCK_TYPES if data_after[name] != data_before[name]}
+            record["data_blocks_created"] = sum(created.values())
+            record["data_blocks_by_type"] = created
+
+            # 入れ子のステージは親の直後に並ぶよう、親の開始位置を基準に挿入する
+            self.stages.insert(record.pop("_index"), record)
+
+    def add_count(self, counter: str, amount: int = 1):
+        """
+        Add to a counter of the current stage.
+
+        Args:
+            counter (str): Counter name. "mode_set" is reported in its own column.
+            amount (int, optional): Amount to add. Defaults to 1.
+        """
+        if self._current is None:
+            return
+        if counter == "mode_set":
+            self._current["mode_set"] += amount
+            return
+        counters = self._current["counters"]
+        counters[counter] = counters.get(counter, 0) + amount
+
+    def total_seconds(self) -> float:
+        return sum(s["seconds"] for s in self.stages if s["depth"] == 0)
+
+    def total_mode_set(self) -> int:
+        return sum(s["mode_set"] for s in self.stages)
+
+    def to_dict(self) -> Dict[str, object]:
+        """
+        Build the JSON report.
+
+        Returns:
+            Dict[str, object]: The report with per-stage records and totals.
+        """
+        return {
+            "name": self.name,
+            "blender_version": bpy.app.version_string,
+            "total_seconds": round(self.total_seconds(), 6),
+            "total_mode_set": self.total_mode_set(),
+            "stages": [
+                dict(s, seconds=round(s["seconds"], 6)) for s in self.stages
+            ],
+        }
+
+    def write_json(self, filepath: str):
+        """
+        Write the JSON report to a file.
+
+        Args:
+            filepath (str): Output path.
+        """
+        with open(filepath, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+
+    def format_table(self) -> str:
+        """
+        Format the stages as a compact text table.
+
+        Returns:
+            str: The table.
+        """
+        def label(s):
+            return "  " * s["depth"] + s["stage"]
+
+        name_width = max([len("Stage")] + [len(label(s)) for s in self.stages])
+        header = (f"{'Stage':<{name_width}}  {'Time(s)':>8}  {'mode_set':>8}  "
+                  f"{'Bones':>6}  {'Meshes':>6}  {'NewData':>7}")
+        lines = [f"==== Conversion profile: {self.name} ====", header, "-" * len(header)]
+        for s in self.stages:
+            lines.append(
+                f"{label(s):<{name_width}}  {s['seconds']:>8.3f}  {s['mode_set']:>8}  "
+                f"{s['bones']:>6}  {s['meshes']:>6}  {s['data_blocks_created']:>7}")
+        lines.append("-" * len(header))
+        lines.append(
+            f"{'Total':<{name_width}}  {self.total_seconds():>8.3f}  {self.total_mode_set():>8}")
+        return "\n".join(lines)
+
+    def print_table(self):
+        print(self.format_table())
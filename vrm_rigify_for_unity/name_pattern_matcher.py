@@ -0,0 +1,135 @@
+"""
+Name Pattern Matcher Module for VrmRigify Addon
+
+This module compiles a set of regular expression patterns once into a single
+alternation, so objects such as bones can be selected by name in one pass
+instead of running every pattern against every name.
+"""
+
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+
+def _group_name(index: int) -> str:
+    return f"_p{index}"
+
+
+@lru_cache(maxsize=None)
+def _compile(patterns: tuple) -> re.Pattern:
+    # 各パターンを名前付きグループで囲むことで、一致したパターンをlastgroupで判別できる
+    return re.compile("|".join(
+        f"(?P<{_group_name(i)}>{pattern})" for i, pattern in enumerate(patterns)))
+
+
+def compile_name_patterns(patterns: Sequence[str]) -> re.Pattern:
+    """
+    Compile a set of patterns into one alternation. Compiled sets are cached,
+    so calling this again with the same patterns is free.
+    Patterns must not use numbered backreferences or group names of the form "_p<N>".
+
+    Args:
+        patterns (Sequence[str]): Regular expression patterns (matched with re.match semantics).
+
+    Returns:
+        re.Pattern: The compiled alternation.
+    """
+    return _compile(tuple(patterns))
+
+
+def match_objects_by_name_patterns(objects: Iterable, patterns: Sequence[str]) -> List[object]:
+    """
+    Find the objects whose name matches any of the patterns.
+
+    Args:
+        objects (Iterable): Objects with a "name" attribute (bones, pose bones, ...).
+        patterns (Sequence[str]): Regular expression patterns.
+
+    Returns:
+        List[object]: Matching objects, in iteration order.
+    """
+    if not patterns:
+        return []
+    match = compile_name_patterns(patterns).match
+    return [obj for obj in objects if match(obj.name)]
+
+
+def group_objects_by_name_patterns(objects: Iterable, patterns: Sequence[str]) -> Dict[str, List[object]]:
+    """
+    Group objects by the pattern their name matches.
+    An object matching several patterns is listed under the first one.
+
+    Args:
+        objects (Iterable): Objects with a "name" attribute.
+        patterns (Sequence[str]): Regular expression patterns.
+
+    Returns:
+        Dict[str, List[object]]: Matching objects for every pattern (empty lists included).
+    """
+    return NameIndex(objects).group(patterns)
+
+
+class NameIndex:
+    """
+    Prebuilt name index of a collection for repeated pattern queries.
+    Each pattern set is evaluated with one pass over the names and the result is kept,
+    so several selection rules on the same rig do not rescan it.
+    Rebuild the index after bones are added, removed or renamed.
+
+    Usage:
+    index = NameIndex(armature.edit_bones)
+    facial = index.match(FACIAL_PATTERNS)
+    by_pattern = index.group(FACIAL_PATTERNS)
+    """
+
+    def __init__(self, objects: Iterable):
+        self.objects = list(objects)
+        self.names = [obj.name for obj in self.objects]
+        self._matches: Dict[tuple, List[Tuple[int, int]]] = {}
+
+    def _match_indices(self, patterns: tuple) -> List[Tuple[int, int]]:
+        """
+        Return (object index, pattern index) pairs of the matching names, cached per pattern set.
+        """
+        if patterns not in self._matches:
+            match = _compile(patterns).match
+            result = []
+            for i, name in enumerate(self.names):
+                m = match(name)
+                if m:
+                    result.append((i, int(m.lastgroup[2:])))
+            self._matches[patterns] = result
+        return self._matches[patterns]
+
+    def match(self, patterns: Sequence[str]) -> List[object]:
+        """
+        Find the indexed objects whose name matches any of the patterns.
+
+        Args:
+            patterns (Sequence[str]): Regular expression patterns.
+
+        Returns:
+            List[object]: Matching objects, in index order.
+        """
+        patterns = tuple(patterns)
+        if not patterns:
+            return []
+        return [self.objects[i] for i, _ in self._match_indices(patterns)]
+
+    def group(self, patterns: Sequence[str]) -> Dict[str, List[object]]:
+        """
+        Group the indexed objects by the first pattern their name matches.
+
+        Args:
+            patterns (Sequence[str]): Regular expression patterns.
+
+        Returns:
+            Dict[str, List[object]]: Matching objects for every pattern (empty lists included).
+        """
+        patterns = tuple(patterns)
+        groups = {pattern: [] for pattern in patterns}
+        if not patterns:
+            return groups
+        for i, pattern_index in self._match_indices(patterns):
+            groups[patterns[pattern_index]].append(self.objects[i])
+        return groups
@@ -0,0 +1,119 @@
+"""
+Rename Planner Module for VrmRigify Addon
+
+This module plans the renaming of a set of named items (vertex groups, bones)
+so that every item is renamed once. Blender adds a ".001" suffix when a name is
+already taken, so renames are ordered to free each target name before it is
+used, and temporary names are only introduced to break cycles (A -> B, B -> A).
+"""
+
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+TEMP_NAME_PREFIX = "_TMP_"
+
+
+def plan_renames(
+    current_names: Sequence[str],
+    name_mapping: Dict[str, str],
+    temp_prefix: str = TEMP_NAME_PREFIX
+) -> Tuple[List[Tuple[str, str]], List[str]]:
+    """
+    Plan the rename steps that apply a name mapping without name collisions.
+
+    Args:
+        current_names (Sequence[str]): Current names of all items in the collection.
+        name_mapping (Dict[str, str]): Old name to new name. Names not in the collection are ignored.
+        temp_prefix (str, optional): Prefix of temporary names used to break cycles.
+
+    Returns:
+        Tuple[List[Tuple[str, str]], List[str]]: Rename steps (old name, new name) to apply in order,
+            and the names that were not planned because their target is used by an item that
+            is not renamed or is the target of several items.
+    """
+    occupied = set(current_names)
+    renames = {old: name_mapping[old] for old in current_names
+               if old in name_mapping and name_mapping[old] != old}
+
+    # 同じ名前を複数の項目が目標にしている場合と、名前を変更しない項目が目標の名前を使っている場合は衝突
+    sources_by_target: Dict[str, List[str]] = {}
+    for old, new in renames.items():
+        sources_by_target.setdefault(new, []).append(old)
+    conflicts = []
+    for new, sources in sources_by_target.items():
+        if len(sources) > 1:
+            conflicts.extend(sources)
+            for old in sources:
+                del renames[old]
+    # 衝突で名前を変更しなくなった項目が、さらに別の項目の目標を塞ぐことがあるため、変化がなくなるまで繰り返す
+    blocked = [old for old, new in renames.items() if new in occupied and new not in renames]
+    while blocked:
+        for old in blocked:
+            del renames[old]
+        conflicts.extend(blocked)
+        blocked = [old for old, new in renames.items() if new in occupied and new not in renames]
+
+    # 目標の名前を使っている項目（＝先に名前を変更する必要がある項目）から、待っている項目を引く
+    waiting_on = {new: old for old, new in renames.items() if new in renames}
+
+    steps: List[Tuple[str, str]] = []
+
+    def rename_chain(old: str):
+        # 目標の名前が空いた項目から順に名前を変更し、空いた名前を待っている項目へ連鎖させる
+        while old is not None:
+            new = renames.pop(old)
+            steps.append((old, new))
+            occupied.discard(old)
+            occupied.add(new)
+            old = waiting_on.get(old)
+            if old not in renames:
+                old = None
+
+    for old in [old for old, new in renames.items() if new not in occupied]:
+        if old in renames:
+            rename_chain(old)
+
+    # 残りはすべて循環しているので、1つを一時的な名前に退避して循環を断ち切る
+    temp_index = 0
+    while renames:
+        old = next(iter(renames))
+        temp_name = f"{temp_prefix}{temp_index}"
+        while temp_name in occupied:
+            temp_index += 1
+            temp_name = f"{temp_prefix}{temp_index}"
+        temp_index += 1
+
+        new = renames.pop(old)
+        steps.append((old, temp_name))
+        occupied.discard(old)
+        occupied.add(temp_name)
+
+        waiter = waiting_on.get(old)
+        if waiter in renames:
+            rename_chain(waiter)
+
+        steps.append((temp_name, new))
+        occupied.discard(temp_name)
+        occupied.add(new)
+
+    return steps, conflicts
+
+
+def apply_renames(items: Iterable, steps: Sequence[Tuple[str, str]]) -> int:
+    """
+    Apply planned rename steps to a collection of items with a "name" attribute.
+
+    Args:
+        items (Iterable): Items to rename (e.g. mesh.vertex_groups, armature.bones).
+        steps (Sequence[Tuple[str, str]]): Steps returned by plan_renames.
+
+    Returns:
+        int: Number of rename steps applied.
+    """
+    if not steps:
+        return 0
+    items_by_name = {item.name: item for item in items}
+    for old, new in steps:
+        item = items_by_name.pop(old)
+        item.name = new
+        items_by_name[new] = item
+    return len(steps)
@@ -0,0 +1,448 @@
+"""
+Rig Cache Module for VrmRigify Addon
+
+This module keeps a pre-built Rigify human metarig with its VRM1 humanoid
+bones already assigned, so conversions can clone it instead of running
+armature_human_metarig_add and the automatic bone assignment every time.
+The template is kept in memory for the session and in an on-disk .blend
+cache keyed by the Blender and Rigify versions.
+
+It also caches generated Rigify rigs keyed by a fingerprint of the adjusted
+metarig, so models built from the same base body skip rigify_generate.
+"""
+
+import hashlib
+import json
+import os
+import time
+from typing import Dict, Optional
+
+import addon_utils
+import bpy
+
+from . import conversion_logger
+
+logger = conversion_logger.get_logger(__name__)
+
+CACHE_DIRECTORY_NAME = "vrm_rigify_for_unity_cache"
+
+# テンプレートメタリグのオブジェクト名（シーンにはリンクしない）
+TEMPLATE_METARIG_NAME = "VRM_Rigify_Metarig_Template"
+
+# VRM1ヒューマノイドボーンの自動割り当てが済んでいることを示すアーマチュアのカスタムプロパティ
+HUMANOID_ASSIGNED_KEY = "vrm_rigify_humanoid_assigned"
+
+# 生成済みリグのキャッシュ
+RIG_CACHE_DIRECTORY_NAME = "rigs"
+DEFAULT_RIG_CACHE_MAX_SIZE_MB = 512
+DEFAULT_RIG_CACHE_MAX_AGE_DAYS = 30
+
+# フィンガープリント計算時の量子化単位（位置は0.1mm、ロールと行列要素は1e-4）
+POSITION_QUANTUM = 1e-4
+ROTATION_QUANTUM = 1e-4
+
+
+def get_cache_directory() -> str:
+    """
+    Get the on-disk cache directory, creating it if needed.
+
+    Returns:
+        str: Absolute path of the cache directory.
+    """
+    return bpy.utils.user_resource('DATAFILES', path=CACHE_DIRECTORY_NAME, create=True)
+
+
+def get_rigify_version() -> tuple:
+    """
+    Get the version of the installed Rigify add-on.
+
+    Returns:
+        tuple: The Rigify version, or an empty tuple if Rigify is not found.
+    """
+    for module in addon_utils.modules():
+        if module.__name__ == "rigify":
+            return tuple(addon_utils.module_bl_info(module).get("version", ()))
+    return ()
+
+
+def get_version_key() -> str:
+    """
+    Build a cache key part from the Blender and Rigify versions.
+
+    Returns:
+        str: A file-name safe version key.
+    """
+    rigify_version = ".".join(str(v) for v in get_rigify_version()) or "unknown"
+    return bpy.path.clean_name(f"blender{bpy.app.version_string}_rigify{rigify_version}")
+
+
+def _template_metarig_path() -> str:
+    return os.path.join(get_cache_directory(), f"metarig_template_{get_version_key()}.blend")
+
+
+def _build_template_metarig() -> bpy.types.Object:
+    """
+    Create the template metarig with the Rigify operator and assign its humanoid bones.
+    The result is unlinked from the scene and only kept in bpy.data.
+    """
+    try:
+        bpy.ops.object.armature_human_metarig_add()
+    except AttributeError as e:
+        raise Exception(
+            "Failed to spawn metarig. Is the Rigify addon enabled?") from e
+
+    template = bpy.context.view_layer.objects.active
+    template.name = TEMPLATE_METARIG_NAME
+    template.data.name = TEMPLATE_METARIG_NAME
+
+    # 自動的にVRM1のヒューマノイドボーンを割り当て
+    bpy.ops.vrm.assign_vrm1_humanoid_human_bones_automatically(
+        armature_name=template.name
+    )
+    template.data[HUMANOID_ASSIGNED_KEY] = True
+
+    for collection in list(template.users_collection):
+        collection.objects.unlink(template)
+
+    return template
+
+
+def _load_template_metarig(filepath: str) -> bpy.types.Object:
+    with bpy.data.libraries.load(filepath, link=False) as (data_from, data_to):
+        if TEMPLATE_METARIG_NAME not in data_from.objects:
+            return None
+        data_to.objects = [TEMPLATE_METARIG_NAME]
+
+    return data_to.objects[0] if data_to.objects else None
+
+
+def get_template_metarig(use_disk_cache: bool = True) -> bpy.types.Object:
+    """
+    Get the pre-assigned template metarig, building it on first use.
+    Looks in the current session first, then in the on-disk cache.
+
+    Args:
+        use_disk_cache (bool, optional): Whether to read and write the on-disk cache.
+            Defaults to True.
+
+    Returns:
+        bpy.types.Object: The template metarig (not linked to any scene).
+    """
+    template = bpy.data.objects.get(TEMPLATE_METARIG_NAME)
+    if template is not None and template.type == 'ARMATURE' and template.data.get(HUMANOID_ASSIGNED_KEY):
+        return template
+
+    filepath = _template_metarig_path() if use_disk_cache else None
+    if filepath and os.path.exists(filepath):
+        template = _load_template_metarig(filepath)
+        if template is not None:
+            return template
+
+    template = _build_template_metarig()
+    if filepath:
+        bpy.data.libraries.write(filepath, {template})
+    return template
+
+
+def clone_template_metarig(metarig_name: str, use_disk_cache: bool = True) -> bpy.types.Object:
+    """
+    Create a new metarig in the current collection by copying the template.
+    Behaves like armature_human_metarig_add: the new metarig is placed at the
+    3D cursor and becomes the only selected, active object.
+
+    Args:
+        metarig_name (str): Name of the new metarig object and armature.
+        use_disk_cache (bool, optional): Whether to use the on-disk cache. Defaults to True.
+
+    Returns:
+        bpy.types.Object: The new metarig object.
+    """
+    template = get_template_metarig(use_disk_cache)
+
+    metarig = template.copy()
+    metarig.data = template.data.copy()
+    metarig.name = metarig_name
+    metarig.data.name = metarig_name
+    metarig.location = bpy.context.scene.cursor.location
+
+    bpy.context.collection.objects.link(metarig)
+    for obj in bpy.context.selected_objects:
+        obj.select_set(False)
+    metarig.select_set(True)
+    bpy.context.view_layer.objects.active = metarig
+
+    return metarig
+
+
+#################################################
+# 生成済みRigifyリグのキャッシュ
+#################################################
+
+def get_rig_cache_directory() -> str:
+    """
+    Get the directory of the generated rig cache, creating it if needed.
+
+    Returns:
+        str: Absolute path of the rig cache directory.
+    """
+    directory = os.path.join(get_cache_directory(), RIG_CACHE_DIRECTORY_NAME)
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def _quantize(value: float, quantum: float) -> int:
+    return int(round(value / quantum))
+
+
+def _rna_value(value):
+    """
+    Convert an RNA property value into a hashable, deterministic Python value.
+    """
+    if isinstance(value, bool) or isinstance(value, (int, str)):
+        return value
+    if isinstance(value, float):
+        return _quantize(value, ROTATION_QUANTUM)
+    if value is None:
+        return None
+    if isinstance(value, bpy.types.bpy_prop_collection):
+        return tuple(_rna_value(v) for v in value)
+    if isinstance(value, bpy.types.bpy_struct):
+        # ポインタープロパティ（ID参照など）は名前で比較する
+        return getattr(value, "name", value.bl_rna.identifier)
+    try:
+        return tuple(_rna_value(v) for v in value)
+    except TypeError:
+        return str(value)
+
+
+def _rigify_parameters_items(pose_bone: bpy.types.PoseBone) -> list:
+    params = getattr(pose_bone, "rigify_parameters", None)
+    if params is None:
+        return []
+    items = []
+    for prop in params.bl_rna.properties:
+        if prop.identifier == "rna_type":
+            continue
+        items.append((prop.identifier, _rna_value(getattr(params, prop.identifier, None))))
+    return items
+
+
+def compute_metarig_fingerprint(metarig: bpy.types.Object) -> str:
+    """
+    Compute a fingerprint of an adjusted metarig for the generated rig cache.
+    Covers the Blender and Rigify versions, the metarig transform, and for each bone
+    its name, parent, connection, quantized head/tail/roll, rigify_type and
+    rigify_parameters. Must be called outside of edit mode.
+
+    Args:
+        metarig (bpy.types.Object): The metarig about to be generated.
+
+    Returns:
+        str: Hex digest of the fingerprint.
+    """
+    digest = hashlib.sha1()
+
+    def feed(*values):
+        digest.update(repr(values).encode("utf-8"))
+
+    feed("version", get_version_key())
+    feed("matrix_world", [_quantize(v, ROTATION_QUANTUM) for row in metarig.matrix_world for v in row])
+    feed("collections", [c.name for c in metarig.data.collections_all]
+         if hasattr(metarig.data, "collections_all") else [])
+
+    pose_bones = metarig.pose.bones
+    for bone in metarig.data.bones:
+        _axis, roll = bpy.types.Bone.AxisRollFromMatrix(bone.matrix_local.to_3x3())
+        pose_bone = pose_bones.get(bone.name)
+        feed(
+            bone.name,
+            bone.parent.name if bone.parent else None,
+            bone.use_connect,
+            [_quantize(v, POSITION_QUANTUM) for v in bone.head_local],
+            [_quantize(v, POSITION_QUANTUM) for v in bone.tail_local],
+            _quantize(roll, ROTATION_QUANTUM),
+            getattr(pose_bone, "rigify_type", "") if pose_bone else "",
+            _rigify_parameters_items(pose_bone) if pose_bone else [],
+        )
+
+    return digest.hexdigest()
+
+
+def _rig_cache_paths(fingerprint: str) -> tuple:
+    directory = get_rig_cache_directory()
+    return (os.path.join(directory, f"{fingerprint}.blend"),
+            os.path.join(directory, f"{fingerprint}.json"))
+
+
+def _rigify_rig_name(metarig: bpy.types.Object) -> str:
+    """
+    Get the name rigify_generate would give a new rig for this metarig.
+    """
+    if "metarig" in metarig.name:
+        return metarig.name.replace("metarig", "rig")
+    if "META" in metarig.name:
+        return metarig.name.replace("META", "RIG")
+    return "RIG-" + metarig.name
+
+
+def _may_run_rig_ui() -> bool:
+    """
+    Check whether the rig UI script of a cache entry may be executed.
+    The cache directory is user-writable, so anything stored next to the entry can be
+    rewritten along with it; the script is only run when Blender's Auto Run Python
+    Scripts preference is enabled.
+    """
+    return bpy.context.preferences.filepaths.use_scripts_auto_execute
+
+
+def store_cached_rig(metarig: bpy.types.Object, rig_object: bpy.types.Object, fingerprint: str):
+    """
+    Write a freshly generated rig to the cache.
+    Old entries are not evicted here; the caller knows the size and age limits
+    and calls evict_rig_cache with them.
+
+    Args:
+        metarig (bpy.types.Object): The metarig the rig was generated from.
+        rig_object (bpy.types.Object): The generated rig.
+        fingerprint (str): Fingerprint of the metarig (see compute_metarig_fingerprint).
+    """
+    blend_path, meta_path = _rig_cache_paths(fingerprint)
+
+    data_blocks = {rig_object}
+    rig_ui = getattr(metarig.data, "rigify_rig_ui", None)
+    if rig_ui is not None:
+        data_blocks.add(rig_ui)
+
+    bpy.data.libraries.write(blend_path, data_blocks)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "rig": rig_object.name,
+            "rig_ui": rig_ui.name if rig_ui is not None else None,
+            "version": get_version_key(),
+        }, f)
+
+
+def load_cached_rig(metarig: bpy.types.Object, fingerprint: str) -> Optional[bpy.types.Object]:
+    """
+    Append a cached rig for the given metarig fingerprint.
+    The rig is linked to the current collection, named as rigify_generate would
+    name it, set as the metarig's target rig and made active.
+    The cached rig UI script is only executed if Auto Run Python Scripts is enabled;
+    otherwise an entry with a rig UI script is treated as a cache miss.
+
+    Args:
+        metarig (bpy.types.Object): The metarig to get a rig for.
+        fingerprint (str): Fingerprint of the metarig (see compute_metarig_fingerprint).
+
+    Returns:
+        Optional[bpy.types.Object]: The appended rig, or None on a cache miss.
+    """
+    blend_path, meta_path = _rig_cache_paths(fingerprint)
+    if not (os.path.exists(blend_path) and os.path.exists(meta_path)):
+        return None
+
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+
+    # リグUIスクリプトを実行できない場合は読み込まずにキャッシュミスとする
+    if meta.get("rig_ui") and not _may_run_rig_ui():
+        logger.info("rig cache entry %s: Auto Run Python Scripts is disabled, so the cached "
+                    "rig UI script is not run and the rig is regenerated", fingerprint)
+        return None
+
+    with bpy.data.libraries.load(blend_path, link=False) as (data_from, data_to):
+        if meta["rig"] not in data_from.objects:
+            return None
+        data_to.objects = [meta["rig"]]
+        if meta.get("rig_ui") and meta["rig_ui"] in data_from.texts:
+            data_to.texts = [meta["rig_ui"]]
+
+    rig_object = data_to.objects[0]
+    rig_ui = data_to.texts[0] if data_to.texts else None
+
+    rig_name = _rigify_rig_name(metarig)
+    rig_object.name = rig_name
+    rig_object.data.name = rig_name
+
+    bpy.context.collection.objects.link(rig_object)
+    for obj in bpy.context.selected_objects:
+        obj.select_set(False)
+    rig_object.select_set(True)
+    bpy.context.view_layer.objects.active = rig_object
+
+    if hasattr(metarig.data, "rigify_target_rig"):
+        metarig.data.rigify_target_rig = rig_object
+
+    # リグUIスクリプトを登録（rigify_generateと同様に実行する）
+    if rig_ui is not None:
+        if hasattr(metarig.data, "rigify_rig_ui"):
+            metarig.data.rigify_rig_ui = rig_ui
+        rig_ui.use_module = True
+        exec(rig_ui.as_string(), {})
+
+    # LRU方式の削除のため、使用したキャッシュの更新日時を更新する
+    now = time.time()
+    os.utime(blend_path, (now, now))
+    os.utime(meta_path, (now, now))
+
+    return rig_object
+
+
+def evict_rig_cache(
+    max_size_mb: float = DEFAULT_RIG_CACHE_MAX_SIZE_MB,
+    max_age_days: float = DEFAULT_RIG_CACHE_MAX_AGE_DAYS
+) -> int:
+    """
+    Remove cached rigs older than max_age_days, then the least recently used
+    ones until the cache is no larger than max_size_mb.
+
+    Args:
+        max_size_mb (float, optional): Maximum total size of the rig cache in MB.
+        max_age_days (float, optional): Maximum age of a cache entry in days.
+
+    Returns:
+        int: Number of removed cache entries.
+    """
+    directory = get_rig_cache_directory()
+    entries: Dict[str, Dict[str, float]] = {}
+    for file_name in os.listdir(directory):
+        fingerprint, ext = os.path.splitext(file_name)
+        if ext not in (".blend", ".json"):
+            continue
+        stat = os.stat(os.path.join(directory, file_name))
+        entry = entries.setdefault(fingerprint, {"size": 0, "mtime": 0.0})
+        entry["size"] += stat.st_size
+        entry["mtime"] = max(entry["mtime"], stat.st_mtime)
+
+    def remove(fingerprint):
+        for path in _rig_cache_paths(fingerprint):
+            if os.path.exists(path):
+                os.remove(path)
+        del entries[fingerprint]
+
+    removed = 0
+    oldest_allowed = time.time() - max_age_days * 86400
+    for fingerprint in [fp for fp, e in entries.items() if e["mtime"] < oldest_allowed]:
+        remove(fingerprint)
+        removed += 1
+
+    max_size = max_size_mb * 1024 * 1024
+    total_size = sum(e["size"] for e in entries.values())
+    for fingerprint in sorted(entries, key=lambda fp: entries[fp]["mtime"]):
+        if total_size <= max_size:
+            break
+        total_size -= entries[fingerprint]["size"]
+        remove(fingerprint)
+        removed += 1
+
+    return removed
+
+
+def clear_rig_cache() -> int:
+    """
+    Remove every cached rig.
+
+    Returns:
+        int: Number of removed cache entries.
+    """
+    return evict_rig_cache(max_size_mb=0, max_age_days=0)
@@ -0,0 +1,476 @@
+"""
+Vertex Weight Utilities Module for VrmRigify Addon
+
+This module reads the vertex group weights of a mesh into flat NumPy arrays,
+edits them with vectorized operations and writes back only what changed.
+
+Blender does not expose vertex group weights to foreach_get, so the weights
+are read with a single pass over the vertices. Every other operation works on
+the arrays, and the write touches only the vertices whose weights changed.
+
+Usage:
+    weights = read_vertex_weights(mesh_object)
+    merged = merge_vertex_groups(weights, {orphan_index: parent_index})
+    write_vertex_weights(mesh_object, weights, merged)
+"""
+
+from typing import Container, Dict, List, Mapping, Optional
+
+import bpy
+import numpy as np
+
+from . import conversion_profiler
+
+
+class VertexWeights:
+    """
+    Vertex group weights of a mesh in coordinate form. Each entry is one
+    (vertex, vertex group, weight) assignment. Entries are sorted by vertex and
+    then by vertex group, and each pair appears at most once.
+
+    Columns:
+        vertex_index (int32): Vertex index.
+        group_index (int32): Vertex group index (index into group_names).
+        weight (float32): Weight.
+    """
+
+    def __init__(self, group_names, vertex_count, vertex_index, group_index, weight):
+        self.group_names: List[str] = group_names
+        self.vertex_count: int = vertex_count
+        self.vertex_index: np.ndarray = vertex_index
+        self.group_index: np.ndarray = group_index
+        self.weight: np.ndarray = weight
+
+    def __len__(self) -> int:
+        return len(self.vertex_index)
+
+    def keys(self) -> np.ndarray:
+        """
+        Entry keys made of the vertex and group index, in ascending order.
+        """
+        return self.vertex_index.astype(np.int64) * len(self.group_names) + self.group_index
+
+    def offsets(self) -> np.ndarray:
+        """
+        Start of each vertex's entries (vertex_count + 1 values, CSR row pointers).
+        """
+        return np.searchsorted(self.vertex_index, np.arange(self.vertex_count + 1))
+
+    def influence_counts(self) -> np.ndarray:
+        """
+        Number of vertex groups assigned to each vertex.
+        """
+        return np.bincount(self.vertex_index, minlength=self.vertex_count)
+
+    def group_mask(self, names: Container[str]) -> np.ndarray:
+        """
+        Boolean mask over the vertex groups whose name is in names.
+        """
+        return np.array([name in names for name in self.group_names], dtype=bool)
+
+    def with_entries(self, vertex_index, group_index, weight) -> "VertexWeights":
+        """
+        Build weights of the same mesh from new entries. Duplicate (vertex, group)
+        entries are summed and the entries are sorted.
+        """
+        group_count = max(len(self.group_names), 1)
+        keys = vertex_index.astype(np.int64) * group_count + group_index
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        summed = np.bincount(inverse, weights=weight, minlength=len(unique_keys))
+        return VertexWeights(
+            self.group_names,
+            self.vertex_count,
+            (unique_keys // group_count).astype(np.int32),
+            (unique_keys % group_count).astype(np.int32),
+            summed.astype(np.float32),
+        )
+
+    def select(self, mask: np.ndarray) -> "VertexWeights":
+        """
+        Keep the entries where mask is True.
+        """
+        return VertexWeights(self.group_names, self.vertex_count,
+                             self.vertex_index[mask], self.group_index[mask], self.weight[mask])
+
+
+def read_vertex_weights(mesh_object: bpy.types.Object) -> VertexWeights:
+    """
+    Read all vertex group weights of a mesh object with one pass over the vertices.
+
+    Args:
+        mesh_object (bpy.types.Object): Mesh object.
+
+    Returns:
+        VertexWeights: The weights.
+    """
+    vertices = mesh_object.data.vertices
+    counts = np.zeros(len(vertices), dtype=np.int32)
+    group_index = []
+    weight = []
+    for i, vertex in enumerate(vertices):
+        elements = vertex.groups
+        counts[i] = len(elements)
+        for element in elements:
+            group_index.append(element.group)
+            weight.append(element.weight)
+
+    weights = VertexWeights(
+        [vertex_group.name for vertex_group in mesh_object.vertex_groups],
+        len(vertices),
+        np.repeat(np.arange(len(vertices), dtype=np.int32), counts),
+        np.array(group_index, dtype=np.int32),
+        np.array(weight, dtype=np.float32),
+    )
+    conversion_profiler.count("weight_entries_read", len(weights))
+    # Blenderの要素順はグループ順とは限らないため、並べ替えて正規化する
+    return weights.with_entries(weights.vertex_index, weights.group_index, weights.weight)
+
+
+def write_vertex_weights(
+    mesh_object: bpy.types.Object,
+    old: VertexWeights,
+    new: VertexWeights,
+    tolerance: float = 1e-6
+) -> int:
+    """
+    Write the difference between two weights of the same mesh: removed entries are
+    removed from their vertex groups per group, added entries are added per group,
+    and only the vertices with added or changed entries are rewritten.
+
+    Args:
+        mesh_object (bpy.types.Object): Mesh object the weights were read from.
+        old (VertexWeights): Weights currently on the mesh (as read).
+        new (VertexWeights): Weights to write.
+        tolerance (float, optional): Weight differences up to this value are not written.
+
+    Returns:
+        int: Number of vertices whose weights were changed.
+    """
+    _common, matched_old, matched_new = np.intersect1d(
+        old.keys(), new.keys(), assume_unique=True, return_indices=True)
+    removed = np.setdiff1d(np.arange(len(old)), matched_old, assume_unique=True)
+    added = np.setdiff1d(np.arange(len(new)), matched_new, assume_unique=True)
+    changed = matched_new[np.abs(old.weight[matched_old] - new.weight[matched_new]) > tolerance]
+
+    vertex_groups = mesh_object.vertex_groups
+    # 削除と追加はグループごとに1回の呼び出しで行う
+    for group in np.unique(old.group_index[removed]):
+        vertex_groups[int(group)].remove(old.vertex_index[removed][old.group_index[removed] == group].tolist())
+    for group in np.unique(new.group_index[added]):
+        vertex_groups[int(group)].add(new.vertex_index[added][new.group_index[added] == group].tolist(), 0.0, 'REPLACE')
+
+    # 追加・変更のあった頂点だけ、要素のグループ番号で重みを引いて書き込む
+    vertices = mesh_object.data.vertices
+    offsets = new.offsets()
+    written = np.unique(np.concatenate((new.vertex_index[added], new.vertex_index[changed])))
+    for vertex in written.tolist():
+        start, end = offsets[vertex], offsets[vertex + 1]
+        vertex_weights = dict(zip(new.group_index[start:end].tolist(), new.weight[start:end].tolist()))
+        for element in vertices[vertex].groups:
+            weight = vertex_weights.get(element.group)
+            if weight is not None:
+                element.weight = weight
+
+    changed_vertices = len(np.union1d(written, old.vertex_index[removed]))
+    conversion_profiler.count("vertices_reweighted", changed_vertices)
+    return changed_vertices
+
+
+def normalize_vertex_weights(
+    weights: VertexWeights,
+    group_mask: Optional[np.ndarray] = None,
+    vertex_mask: Optional[np.ndarray] = None
+) -> VertexWeights:
+    """
+    Scale the weights of each vertex so they sum to 1. Vertices without weight are left as they are.
+
+    Args:
+        weights (VertexWeights): The weights.
+        group_mask (np.ndarray, optional): Vertex groups that are normalized (e.g. deform bones).
+            Other groups are kept and do not count towards the sum. All groups if None.
+        vertex_mask (np.ndarray, optional): Vertices that are normalized. All vertices if None.
+
+    Returns:
+        VertexWeights: Normalized weights.
+    """
+    entry_mask = np.ones(len(weights), dtype=bool) if group_mask is None else group_mask[weights.group_index]
+    if vertex_mask is not None:
+        entry_mask &= vertex_mask[weights.vertex_index]
+
+    totals = np.bincount(weights.vertex_index[entry_mask], weights=weights.weight[entry_mask],
+                         minlength=weights.vertex_count)
+    scale = np.ones(weights.vertex_count)
+    np.divide(1.0, totals, out=scale, where=totals > 0)
+
+    weight = weights.weight.copy()
+    weight[entry_mask] *= scale[weights.vertex_index[entry_mask]]
+    return VertexWeights(weights.group_names, weights.vertex_count,
+                         weights.vertex_index, weights.group_index, weight)
+
+
+def find_nearest_ancestors(
+    names: List[str],
+    parent_of: Mapping[str, Optional[str]],
+    targets: Container[str]
+) -> Dict[str, Optional[str]]:
+    """
+    Find the nearest ancestor of each name that is one of the targets.
+
+    Args:
+        names (List[str]): Bone names to resolve.
+        parent_of (Mapping[str, Optional[str]]): Bone names to parent bone names (None for roots).
+        targets (Container[str]): Bone names that can be used as an ancestor.
+
+    Returns:
+        Dict[str, Optional[str]]: The nearest target ancestor of each name (None if there is none).
+    """
+    resolved: Dict[str, Optional[str]] = {}
+    for name in names:
+        chain = []
+        parent = parent_of.get(name)
+        while parent is not None and parent not in targets and parent not in resolved:
+            chain.append(parent)
+            parent = parent_of.get(parent)
+        ancestor = resolved.get(parent) if parent in resolved and parent not in targets else parent
+        # 途中のボーンにも同じ祖先を記録して、兄弟ボーンの探索を省く
+        for bone_name in chain:
+            resolved[bone_name] = ancestor
+        resolved[name] = ancestor
+    return {name: resolved[name] for name in names}
+
+
+def merge_vertex_groups(weights: VertexWeights, group_targets: Mapping[int, int]) -> VertexWeights:
+    """
+    Move the weights of vertex groups into other vertex groups. Weights of a vertex
+    that is in both groups are added together.
+
+    Args:
+        weights (VertexWeights): The weights.
+        group_targets (Mapping[int, int]): Source vertex group index to target vertex group index.
+
+    Returns:
+        VertexWeights: Merged weights (the source groups have no entries).
+    """
+    if not group_targets:
+        return weights
+    remap = np.arange(len(weights.group_names), dtype=np.int32)
+    remap[list(group_targets.keys())] = list(group_targets.values())
+    return weights.with_entries(weights.vertex_index, remap[weights.group_index], weights.weight)
+
+
+def influence_stats(weights: VertexWeights, group_mask: Optional[np.ndarray] = None) -> Dict[str, float]:
+    """
+    Count the influences per vertex.
+
+    Args:
+        weights (VertexWeights): The weights.
+        group_mask (np.ndarray, optional): Vertex groups that count as influences (e.g. deform bones).
+            All groups if None.
+
+    Returns:
+        Dict[str, float]: "max" and "average" influences per vertex (over all vertices) and
+            "weights" (the number of influences).
+    """
+    entries = weights if group_mask is None else weights.select(group_mask[weights.group_index])
+    counts = entries.influence_counts()
+    return {
+        "max": int(counts.max()) if len(counts) else 0,
+        "average": round(float(counts.mean()), 3) if len(counts) else 0.0,
+        "weights": len(entries),
+    }
+
+
+def limit_vertex_influences(
+    weights: VertexWeights,
+    max_influences: int = 4,
+    min_weight: float = 0.0,
+    group_mask: Optional[np.ndarray] = None
+) -> VertexWeights:
+    """
+    Keep at most max_influences of the strongest weights per vertex, drop weights below
+    min_weight and renormalize the vertices that lost weights. The strongest weight of
+    each vertex is always kept, so no vertex becomes unweighted.
+
+    Args:
+        weights (VertexWeights): The weights.
+        max_influences (int, optional): Influences kept per vertex (0 for no limit). Defaults to 4.
+        min_weight (float, optional): Weights below this value are removed. Defaults to 0.0.
+        group_mask (np.ndarray, optional): Vertex groups that count as influences (e.g. deform bones).
+            Other groups are kept as they are. All groups if None.
+
+    Returns:
+        VertexWeights: Limited weights.
+    """
+    influence = np.ones(len(weights), dtype=bool) if group_mask is None else group_mask[weights.group_index]
+    candidates = np.flatnonzero(influence)
+
+    # 頂点ごとに重みの大きい順に並べ、頂点内での順位を求める
+    order = candidates[np.lexsort((-weights.weight[candidates], weights.vertex_index[candidates]))]
+    vertex_index = weights.vertex_index[order]
+    first = np.r_[True, vertex_index[1:] != vertex_index[:-1]]
+    run_start = np.flatnonzero(first)
+    rank = np.arange(len(order)) - np.repeat(run_start, np.diff(np.r_[run_start, len(order)]))
+
+    drop = weights.weight[order] < min_weight
+    if max_influences > 0:
+        drop |= rank >= max_influences
+    drop &= rank > 0
+    dropped = order[drop]
+    if not len(dropped):
+        return weights
+
+    keep = np.ones(len(weights), dtype=bool)
+    keep[dropped] = False
+    affected = np.zeros(weights.vertex_count, dtype=bool)
+    affected[weights.vertex_index[dropped]] = True
+    return normalize_vertex_weights(weights.select(keep), group_mask, affected)
+
+
+def group_weight_totals(weights: VertexWeights) -> np.ndarray:
+    """
+    Sum the weights of each vertex group.
+
+    Args:
+        weights (VertexWeights): The weights.
+
+    Returns:
+        np.ndarray: Total weight per vertex group (float64, one value per group name).
+    """
+    return np.bincount(weights.group_index, weights=weights.weight, minlength=len(weights.group_names))
+
+
+def bone_weight_matrix(bone_names: List[str], mesh_weights: List[VertexWeights]) -> np.ndarray:
+    """
+    Build a bones x meshes matrix of the total weight each bone has on each mesh.
+    Vertex groups that are not bones are ignored and bones without a vertex group are 0.
+
+    Args:
+        bone_names (List[str]): Bone names (rows).
+        mesh_weights (List[VertexWeights]): Weights of each mesh (columns).
+
+    Returns:
+        np.ndarray: Matrix of shape (len(bone_names), len(mesh_weights)).
+    """
+    bone_rows = {name: row for row, name in enumerate(bone_names)}
+    matrix = np.zeros((len(bone_names), len(mesh_weights)))
+    for column, weights in enumerate(mesh_weights):
+        groups, rows = [], []
+        for group, name in enumerate(weights.group_names):
+            row = bone_rows.get(name)
+            if row is not None:
+                groups.append(group)
+                rows.append(row)
+        matrix[rows, column] = group_weight_totals(weights)[groups]
+    return matrix
+
+
+def read_face_vertices(mesh_object: bpy.types.Object) -> tuple:
+    """
+    Read the face corners of a mesh with foreach_get.
+
+    Args:
+        mesh_object (bpy.types.Object): Mesh object.
+
+    Returns:
+        tuple: (loop_start, loop_total, loop_vertex) int32 arrays. The vertices of face i are
+            loop_vertex[loop_start[i]:loop_start[i] + loop_total[i]].
+    """
+    mesh = mesh_object.data
+    loop_start = np.empty(len(mesh.polygons), dtype=np.int32)
+    loop_total = np.empty(len(mesh.polygons), dtype=np.int32)
+    loop_vertex = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_start", loop_start)
+    mesh.polygons.foreach_get("loop_total", loop_total)
+    mesh.loops.foreach_get("vertex_index", loop_vertex)
+    return loop_start, loop_total, loop_vertex
+
+
+def face_bone_signatures(
+    weights: VertexWeights,
+    loop_start: np.ndarray,
+    loop_total: np.ndarray,
+    loop_vertex: np.ndarray,
+    group_mask: Optional[np.ndarray] = None
+) -> tuple:
+    """
+    Find the set of vertex groups each face references through its vertices, and
+    group the faces that reference the same set (signature).
+
+    Args:
+        weights (VertexWeights): The weights.
+        loop_start, loop_total, loop_vertex (np.ndarray): Face corners (see read_face_vertices).
+        group_mask (np.ndarray, optional): Vertex groups that are counted (e.g. deform bones).
+            All groups if None. Zero weights are not counted.
+
+    Returns:
+        tuple: (group_indices, signatures, face_signature).
+            group_indices: the vertex groups referenced by any face (columns of signatures).
+            signatures: bool array (signature count x len(group_indices)).
+            face_signature: signature index of each face.
+    """
+    face_count = len(loop_start)
+    mask = weights.weight > 0
+    if group_mask is not None:
+        mask &= group_mask[weights.group_index]
+    referenced = weights.select(mask)
+
+    # 面の各頂点（面の順に並べた角）のエントリーを展開して（面, グループ）の組を作る
+    corner_face = np.repeat(np.arange(face_count), loop_total)
+    corner_loop = np.repeat(loop_start - (np.cumsum(loop_total) - loop_total), loop_total) + np.arange(len(corner_face))
+    corner_vertex = loop_vertex[corner_loop]
+
+    offsets = referenced.offsets()
+    counts = offsets[corner_vertex + 1] - offsets[corner_vertex]
+    entry_corner = np.repeat(np.arange(len(corner_vertex)), counts)
+    entry = np.repeat(offsets[corner_vertex] - (np.cumsum(counts) - counts), counts) + np.arange(len(entry_corner))
+
+    group_indices, columns = np.unique(referenced.group_index[entry], return_inverse=True)
+    incidence = np.zeros((face_count, len(group_indices)), dtype=bool)
+    incidence[corner_face[entry_corner], columns] = True
+
+    # 同じグループの組を参照する面をまとめる（ビットマスクにしてから行単位で一意化）
+    packed = np.packbits(incidence, axis=1)
+    _unique, first_face, face_signature = np.unique(packed, axis=0, return_index=True, return_inverse=True)
+    return group_indices, incidence[first_face], face_signature.reshape(-1)
+
+
+def pack_signatures_first_fit(signatures: np.ndarray, budget: int, face_counts: np.ndarray) -> tuple:
+    """
+    Assign signatures to parts so each part references at most budget vertex groups.
+    Signatures are placed largest first into the first part they fit in (first-fit decreasing).
+    A signature that alone exceeds the budget gets its own part.
+
+    Args:
+        signatures (np.ndarray): Bool array (signature count x group count).
+        budget (int): Maximum vertex groups per part.
+        face_counts (np.ndarray): Number of faces of each signature (used to order ties).
+
+    Returns:
+        tuple: (signature_part, over_budget).
+            signature_part: part index of each signature.
+            over_budget: indices of the signatures that exceed the budget alone.
+    """
+    # ビット演算で和集合を求めるため、各シグネチャを整数のビットマスクに変換する
+    masks = [int.from_bytes(row.tobytes(), "big") for row in np.packbits(signatures, axis=1)]
+    sizes = signatures.sum(axis=1)
+    order = np.lexsort((-face_counts, -sizes))
+
+    signature_part = np.empty(len(signatures), dtype=np.int32)
+    parts: List[int] = []
+    over_budget = []
+    for signature in order.tolist():
+        mask = masks[signature]
+        if sizes[signature] > budget:
+            over_budget.append(signature)
+            signature_part[signature] = len(parts)
+            parts.append(mask)
+            continue
+        for part, part_mask in enumerate(parts):
+            if bin(part_mask | mask).count("1") <= budget:
+                parts[part] = part_mask | mask
+                signature_part[signature] = part
+                break
+        else:
+            signature_part[signature] = len(parts)
+            parts.append(mask)
+    return signature_part, over_budget
@@ -1,4 +1,33 @@
-def copy_vrm_extension_from_armature(vrm_object, rig_object):
+from . import conversion_logger
+
+logger = conversion_logger.get_logger(__name__)
+
+
+def add_mesh_part_morph_target_binds(morph_target_binds, mesh_parts):
+    """
+    分割したメッシュのパーツにも、元のメッシュと同じモーフターゲットバインドを追加する関数
+    （パーツはシェイプキーを引き継いでいるため、同じシェイプキー名で参照できる）
+    
+    Args:
+        morph_target_binds: 表情のモーフターゲットバインドのコレクション
+        mesh_parts: メッシュオブジェクト名から追加のパーツのオブジェクト名リストへのマッピング辞書
+        
+    Returns:
+        追加したバインドの数
+    """
+    # 追加中にコレクションが変化するため、先に対象のバインドを集める
+    part_binds = [(part_name, morph_bind.index, morph_bind.weight)
+                  for morph_bind in morph_target_binds
+                  for part_name in mesh_parts.get(morph_bind.node.mesh_object_name, ())]
+    for part_name, index, weight in part_binds:
+        new_bind = morph_target_binds.add()
+        new_bind.node.mesh_object_name = part_name
+        new_bind.index = index
+        new_bind.weight = weight
+    return len(part_binds)
+
+
+def copy_vrm_extension_from_armature(vrm_object, rig_object, mesh_object_mapping=None, mesh_parts=None):
     """
     VRMモデルのアーマチュアからVRM拡張情報をRigifyリグにコピーする関数
     ※この関数は、メッシュのコピーとアーマチュアモディファイアの更新が完了した後に呼び出すこと
@@ -6,6 +35,11 @@ def copy_vrm_extension_from_armature(vrm_object, rig_object):
     Args:
         vrm_object: VRMモデルのアーマチュアオブジェクト（コピー元）
         rig_object: Rigifyリグオブジェクト（コピー先）
+        mesh_object_mapping: VRMモデルのメッシュオブジェクト名からRigifyリグのメッシュオブジェクト名への
+            マッピング辞書（copy_meshes_between_armatures/move_meshes_between_armaturesの戻り値）
+            Noneの場合は両方のアーマチュアの子メッシュをメッシュデータ名で対応付ける
+        mesh_parts: Rigifyリグのメッシュオブジェクト名から、ボーン数の上限で分割した追加パーツの
+            オブジェクト名リストへのマッピング辞書（split_meshes_by_bone_budgetのレポートのmesh_parts）
     """
     import bpy
     from mathutils import Matrix, Vector
@@ -15,13 +49,26 @@ def copy_vrm_extension_from_armature(vrm_object, rig_object):
     armature_rig = rig_object.data
     
     # デバッグ出力
-    print(f"Copying VRM extension from {vrm_object.name} to {rig_object.name}")
+    logger.info("Copying VRM extension from %s to %s", vrm_object.name, rig_object.name)
     
     # vrm_addon_extensionが存在するか確認
     if not hasattr(armature_vrm, "vrm_addon_extension") or not hasattr(armature_rig, "vrm_addon_extension"):
-        print("Error: vrm_addon_extension not found on one of the armatures")
+        logger.error("vrm_addon_extension not found on one of the armatures")
         return
 
+    mesh_parts = mesh_parts or {}
+
+    # メッシュオブジェクトのマッピングが渡されなかった場合は、現在の状態から作成
+    if mesh_object_mapping is None:
+        mesh_object_mapping = {}
+        for vrm_child in vrm_object.children:
+            if vrm_child.type == 'MESH':
+                for rig_child in rig_object.children:
+                    if rig_child.type == 'MESH' and rig_child.data.name == vrm_child.data.name:
+                        mesh_object_mapping[vrm_child.name] = rig_child.name
+                        logger.debug("Mapped mesh: %s → %s", vrm_child.name, rig_child.name)
+                        break
+
     # spec_versionを保存（VRM 0.0またはVRM 1.0）
     spec_version = armature_vrm.vrm_addon_extension.spec_version
     
@@ -51,7 +98,7 @@ def copy_vrm_extension_from_armature(vrm_object, rig_object):
         blend_shape_master = armature_vrm.vrm_addon_extension.vrm0["blend_shape_master"]
         armature_rig.vrm_addon_extension.vrm0["blend_shape_master"] = blend_shape_master
     except Exception as e:
-        print(f"Error while copying VRM0 meta info: {e}")
+        logger.error("Error while copying VRM0 meta info: %s", e)
         
     # ボーンマッピング情報を更新
     try:
@@ -67,7 +114,7 @@ def copy_vrm_extension_from_armature(vrm_object, rig_object):
                         new_human_bone.node.bone_name = original_bone
         
     except Exception as e:
-        print(f"Error while updating VRM0 bone mapping: {e}")
+        logger.error("Error while updating VRM0 bone mapping: %s", e)
 
     # SpringBoneの設定をコピー
     try:
@@ -122,7 +169,7 @@ def copy_vrm_extension_from_armature(vrm_object, rig_object):
                     new_collider.bpy_object = new_collider_obj
                     
     except Exception as e:
-        print(f"Error while copying SpringBone settings: {e}")
+        logger.error("Error while copying SpringBone settings: %s", e)
         
     # =====================================================
     # 2. VRM1の情報をコピー
@@ -165,7 +212,7 @@ def copy_vrm_extension_from_armature(vrm_object, rig_object):
             new_reference = vrm1_meta_dst.references.add()
             new_reference.value = reference.value
     except Exception as e:
-        print(f"Error while copying VRM1 meta info: {e}")
+        logger.error("Error while copying VRM1 meta info: %s", e)
         
     # VRM1のボーンマッピングを更新
     try:
@@ -186,7 +233,7 @@ def copy_vrm_extension_from_armature(vrm_object, rig_object):
                 if human_bone_dst and hasattr(human_bone_dst, 'node') and original_bone in armature_rig.bones:
                     human_bone_dst.node.bone_name = original_bone
     except Exception as e:
-        print(f"Error while updating VRM1 bone mapping: {e}")
+        logger.error("Error while updating VRM1 bone mapping: %s", e)
     
     # Expressions（表情）のコピー
     try:
@@ -195,29 +242,8 @@ def copy_vrm_extension_from_armature(vrm_object, rig_object):
         armature_rig.vrm_addon_extension.vrm1["expressions"] = expressions
         
         # 表情内のメッシュ参照を更新（マテリアルバインディング、モーフターゲットバインディングなど）
-        # メッシュオブジェクトのマッピングを作成
-        mesh_object_mapping = {}
-        for vrm_child in vrm_object.children:
-            if vrm_child.type == 'MESH':
-                for rig_child in rig_object.children:
-                    if rig_child.type == 'MESH' and rig_child.data.name == vrm_child.data.name:
-                        mesh_object_mapping[vrm_child.name] = rig_child.name
-                        break
-        
-        # 表情内のメッシュ参照を更新
         expressions_dst = armature_rig.vrm_addon_extension.vrm1.expressions
         
-        # メッシュオブジェクトのマッピングがない場合は、現在の状態から作成
-        if not mesh_object_mapping:
-            for vrm_child in vrm_object.children:
-                if vrm_child.type == 'MESH':
-                    for rig_child in rig_object.children:
-                        if (rig_child.type == 'MESH' and 
-                            rig_child.data.name == vrm_child.data.name):
-                            mesh_object_mapping[vrm_child.name] = rig_child.name
-                            print(f"Mapped mesh: {vrm_child.name} → {rig_child.name}")
-                            break
-                            
         # すべての表情（プリセットとカスタム）を更新
         # プリセット表情の処理
         preset_expressions = expressions_dst.preset
@@ -232,7 +258,10 @@ def copy_vrm_extension_from_armature(vrm_object, rig_object):
                     old_mesh_name = morph_bind.node.mesh_object_name
                     if old_mesh_name in mesh_object_mapping:
                         morph_bind.node.mesh_object_name = mesh_object_mapping[old_mesh_name]
-                        print(f"Updated mesh reference in preset '{preset_name}': {old_mesh_name} → {mesh_object_mapping[old_mesh_name]}")
+                        logger.debug("Updated mesh reference in preset '%s': %s → %s",
+                                     preset_name, old_mesh_name, mesh_object_mapping[old_mesh_name])
+                if mesh_parts:
+                    add_mesh_part_morph_target_binds(preset_expr.morph_target_binds, mesh_parts)
         
         # カスタム表情の処理
         for custom_expr in expressions_dst.custom:
@@ -241,9 +270,12 @@ def copy_vrm_extension_from_armature(vrm_object, rig_object):
                 old_mesh_name = morph_bind.node.mesh_object_name
                 if old_mesh_name in mesh_object_mapping:
                     morph_bind.node.mesh_object_name = mesh_object_mapping[old_mesh_name]
-                    print(f"Updated mesh reference in custom expression: {old_mesh_name} → {mesh_object_mapping[old_mesh_name]}")
+                    logger.debug("Updated mesh reference in custom expression: %s → %s",
+                                 old_mesh_name, mesh_object_mapping[old_mesh_name])
+            if mesh_parts:
+                add_mesh_part_morph_target_binds(custom_expr.morph_target_binds, mesh_parts)
     except Exception as e:
-        print(f"Error while copying expressions: {e}")
+        logger.error("Error while copying expressions: %s", e)
     
     # Look Atの設定をコピー
     try:
@@ -267,7 +299,7 @@ def copy_vrm_extension_from_armature(vrm_object, rig_object):
         look_at_dst.range_map_vertical_up.input_max_value = look_at_src.range_map_vertical_up.input_max_value
         look_at_dst.range_map_vertical_up.output_scale = look_at_src.range_map_vertical_up.output_scale
     except Exception as e:
-        print(f"Error while copying look_at settings: {e}")
+        logger.error("Error while copying look_at settings: %s", e)
     
     # First Person（一人称視点）の設定をコピー
     try:
@@ -282,8 +314,13 @@ def copy_vrm_extension_from_armature(vrm_object, rig_object):
                 new_annotation = first_person_dst.mesh_annotations.add()
                 new_annotation.type = mesh_annotation.type
                 new_annotation.node.mesh_object_name = mesh_object_mapping[mesh_annotation.node.mesh_object_name]
+                # 分割したメッシュのパーツにも同じアノテーションを設定
+                for part_name in mesh_parts.get(new_annotation.node.mesh_object_name, ()):
+                    part_annotation = first_person_dst.mesh_annotations.add()
+                    part_annotation.type = mesh_annotation.type
+                    part_annotation.node.mesh_object_name = part_name
     except Exception as e:
-        print(f"Error while copying first person settings: {e}")
+        logger.error("Error while copying first person settings: %s", e)
 
     # VRM1のSpringBone設定をコピー
     try:
@@ -399,12 +436,12 @@ def copy_vrm_extension_from_armature(vrm_object, rig_object):
         # アニメーション設定のコピー
         spring_bone1_dst.enable_animation = spring_bone1_src.enable_animation
         
-        print(f"VRM1 SpringBone settings copied successfully")
+        logger.debug("VRM1 SpringBone settings copied successfully")
     except Exception as e:
-        print(f"Error while copying VRM1 SpringBone settings: {e}")
+        logger.error("Error while copying VRM1 SpringBone settings: %s", e)
     
     # VRM0とVRM1の情報をコピーした後、バージョン設定を更新
     armature_rig.vrm_addon_extension.spec_version = spec_version
     
-    print(f"VRM extension copied from {vrm_object.name} to {rig_object.name}")
+    logger.info("VRM extension copied from %s to %s", vrm_object.name, rig_object.name)
     return True
@@ -5,17 +5,39 @@
 #################################################
 
 
-import re
+import logging
 import math
 
+import bmesh
 import bpy
+import numpy as np
 from . import bone_constraint_utils
 from . import constraint_driver_utils
+from . import conversion_logger
+from . import conversion_profiler
+from . import name_pattern_matcher
+from . import rename_planner
+from . import rig_cache
+from . import vertex_weight_utils
+
+logger = conversion_logger.get_logger(__name__)
 
 #################################################
 #region ユーティリティクラスと関数
 #################################################
 
+def set_object_mode(mode: str):
+    """
+    オブジェクトモードを切り替える関数
+    プロファイラーでmode_setの呼び出し回数を数えるため、モード切り替えは必ずこの関数を経由する
+    
+    Args:
+        mode: 切り替え先のモード（"EDIT", "POSE", "OBJECT"など）
+    """
+    conversion_profiler.count("mode_set")
+    bpy.ops.object.mode_set(mode=mode)
+
+
 class ModeContext:
     """
     Blenderのオブジェクトモード（編集モード、ポーズモードなど）を
@@ -25,6 +47,9 @@ class ModeContext:
     with ModeContext("EDIT"):
         # 編集モードでの操作
     # 自動的に元のモードに戻る
+
+    既に指定されたモードの場合は切り替えを行わないため、
+    edit_session()の中で呼ばれたediting()は外側の編集モードをそのまま使う
     """
     
     def __init__(self, mode):
@@ -33,11 +58,13 @@ class ModeContext:
     def __enter__(self):
         # 現在のモードを保存して、指定されたモードに切り替え
         self.old_mode = bpy.context.object.mode
-        bpy.ops.object.mode_set(mode=self.mode)
+        if self.old_mode != self.mode:
+            set_object_mode(self.mode)
 
     def __exit__(self, _type, _value, _trace):
         # 元のモードに戻す
-        bpy.ops.object.mode_set(mode=self.old_mode)
+        if bpy.context.object.mode != self.old_mode:
+            set_object_mode(self.old_mode)
 
     @staticmethod
     def editing(node: bpy.types.Object):
@@ -47,6 +74,21 @@ class ModeContext:
         node.select_set(True)
         return ModeContext("EDIT")
 
+    @staticmethod
+    def edit_session(node: bpy.types.Object):
+        """
+        複数の編集処理をまとめて1回の編集モードで行うためのメソッド
+        指定されたオブジェクトをアクティブにして編集モードに入り、
+        内側のediting()によるモード切り替えを省略させる
+
+        使用例:
+        with ModeContext.edit_session(metarig):
+            remove_or_log_unmapped_metarig_bones(metarig, bone_mapping)
+            position_metarig_bones_to_vrm_model(metarig, vrm_object, bone_mapping)
+        """
+        bpy.context.view_layer.objects.active = node
+        return ModeContext.editing(node)
+
 
 def blender_version():
     """
@@ -60,6 +102,8 @@ def blender_version():
 def matche_objects_by_name_patterns(objects, patterns: list[str]) -> list[object]:
     """
     正規表現パターンに一致するオブジェクトを検索する関数
+    パターンは1つの正規表現にまとめてコンパイル・キャッシュされるため、
+    オブジェクトごとに1回の照合で済む
     
     Args:
         objects: 検索対象のオブジェクトのコレクション
@@ -68,15 +112,53 @@ def matche_objects_by_name_patterns(objects, patterns: list[str]) -> list[object
     Returns:
         一致するオブジェクトのリスト
     """
-    object_matches = []
-    for node in objects:
-        matches = False
-        for pattern in patterns:
-            matches |= bool(re.match(pattern, node.name))
-        if matches:
-            object_matches.append(node)
+    return name_pattern_matcher.match_objects_by_name_patterns(objects, patterns)
 
-    return object_matches
+
+def remove_edit_bone_subtrees(edit_bones, root_bones) -> int:
+    """
+    指定されたボーンとその子孫ボーンをまとめて削除する関数
+    親子関係の辞書を1回だけ作成し、各ボーンを1度だけ訪問するため、処理はボーン数に対して線形
+    ボーンは子から親の順に削除する
+    
+    Args:
+        edit_bones: アーマチュアのedit_bones（編集モードで呼び出すこと）
+        root_bones: 削除するサブツリーの根となるボーンのリスト
+        
+    Returns:
+        削除したボーンの数
+    """
+    root_names = {bone.name for bone in root_bones}
+    if not root_names:
+        return 0
+
+    # EditBone.childrenは呼び出しごとに全ボーンを走査するため、子ボーンの辞書を先に作成する
+    children_map = {}
+    for bone in edit_bones:
+        if bone.parent:
+            children_map.setdefault(bone.parent.name, []).append(bone)
+
+    # 他の根の子孫になっている根は、その根のサブツリーに含まれるので除外する
+    top_roots = [bone for bone in root_bones
+                 if not any(parent.name in root_names for parent in bone.parent_recursive)]
+
+    # 親から子の順（行きがけ順）でボーンを集める
+    visited = set()
+    bones_to_remove = []
+    stack = list(reversed(top_roots))
+    while stack:
+        bone = stack.pop()
+        if bone.name in visited:
+            continue
+        visited.add(bone.name)
+        bones_to_remove.append(bone)
+        stack.extend(children_map.get(bone.name, ()))
+
+    # 逆順にすることで子ボーンを親ボーンより先に削除する
+    for bone in reversed(bones_to_remove):
+        edit_bones.remove(bone)
+
+    return len(bones_to_remove)
 
 
 def get_full_bone_path(bone: bpy.types.Bone | bpy.types.EditBone) -> str:
@@ -98,12 +180,14 @@ def get_full_bone_path(bone: bpy.types.Bone | bpy.types.EditBone) -> str:
 #region メタリグと基本設定関連の関数
 #################################################
 
-def generate_template_metarig(metarig_name: str) -> bpy.types.Object:
+def generate_template_metarig(metarig_name: str, use_cache: bool = True) -> bpy.types.Object:
     """
     Rigifyのテンプレートメタリグを生成する関数
+    キャッシュを使う場合は、ヒューマノイドボーン割り当て済みのテンプレートを複製する
     
     Args:
         metarig_name: 生成するメタリグの名前
+        use_cache: テンプレートメタリグのキャッシュを使うかどうか
         
     Returns:
         生成されたメタリグオブジェクト
@@ -111,6 +195,9 @@ def generate_template_metarig(metarig_name: str) -> bpy.types.Object:
     Raises:
         Exception: Rigifyアドオンが有効でない場合
     """
+    if use_cache:
+        return rig_cache.clone_template_metarig(metarig_name)
+
     try:
         bpy.ops.object.armature_human_metarig_add()
         metarig = bpy.context.view_layer.objects.active
@@ -158,51 +245,73 @@ def rename_vrm_model_bones_name(vrm_object):
     bpy.ops.vrm.bones_rename(armature_name="Armature")
 
 
-def store_original_bone_names(vrm_object) -> dict:
+# ボーン名の標準化前後で同じボーンを識別するための、ボーンのカスタムプロパティ名
+BONE_ID_KEY = "vrm_rigify_bone_id"
+
+
+def store_original_bone_names(vrm_object) -> dict[int, str]:
     """
     VRMモデルのオリジナルのボーン名を保存する関数
+    各ボーンに永続的なIDをカスタムプロパティとして付与するため、
+    ボーン名の変更や並び順の変化があっても同じボーンを特定できる
     
     Args:
         vrm_object: VRMモデルのアーマチュアオブジェクト
         
     Returns:
-        オリジナルボーン名と標準化後のボーン名のマッピング辞書
+        ボーンIDとオリジナルボーン名のマッピング辞書 {ボーンID: オリジナルのボーン名}
     """
     armature_vrm = vrm_object.data
     original_bone_names = {}
     
     # オリジナルのボーン名を保存
-    for bone in armature_vrm.bones:
-        original_bone_names[bone.name] = bone.name
+    for bone_id, bone in enumerate(armature_vrm.bones):
+        bone[BONE_ID_KEY] = bone_id
+        original_bone_names[bone_id] = bone.name
     
     return original_bone_names
 
 
-def restore_original_bone_names(vrm_object, original_bone_names):
+def restore_original_bone_names(vrm_object, original_bone_names: dict[int, str]):
     """
     VRMモデルのボーン名を元の名前に戻す関数
+    ボーンIDで元の名前を引くため、処理はボーン数に対して線形
+    編集モード以外で呼び出すこと（ボーンデータを直接変更するため）
     
     Args:
         vrm_object: VRMモデルのアーマチュアオブジェクト
-        original_bone_names: オリジナルのボーン名の辞書
+        original_bone_names: ボーンID（BONE_ID_KEYの整数値）とオリジナルボーン名の辞書
     """
     armature_vrm = vrm_object.data
     
-    # 編集モードでボーン名を元に戻す
-    with ModeContext.editing(vrm_object):
-        for i, bone in enumerate(armature_vrm.edit_bones):
-            if i in range(len(original_bone_names.values())):
-                original_name = list(original_bone_names.values())[i]
-                bone.name = original_name
+    # 現在の名前からオリジナルの名前へのマッピングを作成
+    name_mapping = {}
+    for bone in armature_vrm.bones:
+        original_name = original_bone_names.get(bone.get(BONE_ID_KEY))
+        if original_name is not None:
+            name_mapping[bone.name] = original_name
+    
+    # 各ボーンの名前を1回だけ変更する（一時的な名前は名前の入れ替わりにのみ使用）
+    steps, conflicts = rename_planner.plan_renames(
+        [bone.name for bone in armature_vrm.bones], name_mapping)
+    for name in conflicts:
+        logger.warning("bone '%s' can't be renamed back to '%s': the name is already used",
+                       name, name_mapping[name])
+    rename_planner.apply_renames(armature_vrm.bones, steps)
+    
+    # ボーンIDを削除
+    for bone in armature_vrm.bones:
+        if BONE_ID_KEY in bone:
+            del bone[BONE_ID_KEY]
 
 
-def update_bone_name_mapping_after_rename(vrm_object, original_bone_names) -> dict:
+def update_bone_name_mapping_after_rename(vrm_object, original_bone_names: dict[int, str]) -> dict:
     """
     ボーン名の標準化後にマッピングを更新する関数
     
     Args:
         vrm_object: VRMモデルのアーマチュアオブジェクト
-        original_bone_names: オリジナルボーン名の辞書
+        original_bone_names: ボーンID（BONE_ID_KEYの整数値）とオリジナルボーン名の辞書
         
     Returns:
         更新されたマッピング辞書 {標準化後のボーン名: オリジナルのボーン名}
@@ -210,16 +319,10 @@ def update_bone_name_mapping_after_rename(vrm_object, original_bone_names) -> di
     armature_vrm = vrm_object.data
     bone_name_mapping = {}
     
-    # まず、全てのオリジナルボーンのインデックスを記録
-    bone_indices = {}
-    for i, bone_name in enumerate(original_bone_names.keys()):
-        bone_indices[i] = bone_name
-    
-    # 標準化後のボーンとオリジナルボーンのマッピングを作成
-    # インデックスベースでマッピングを行う（順序は変わらないと仮定）
-    for i, bone in enumerate(armature_vrm.bones):
-        if i in bone_indices:
-            original_name = bone_indices[i]
+    # ボーンIDで標準化後のボーンとオリジナルボーンを対応付ける
+    for bone in armature_vrm.bones:
+        original_name = original_bone_names.get(bone.get(BONE_ID_KEY))
+        if original_name is not None:
             # 標準化後の名前をキー、オリジナルの名前を値とする
             bone_name_mapping[bone.name] = original_name
     
@@ -246,10 +349,11 @@ def mapping_metarig_and_vrm_model_bones(
     Returns:
         (メタリグのボーン名, VRMモデルのボーン名)のタプルのリスト
     """
-    # 自動的にVRM1のヒューマノイドボーンを割り当て
-    bpy.ops.vrm.assign_vrm1_humanoid_human_bones_automatically(
-        armature_name = metarig.name
-    )
+    # 自動的にVRM1のヒューマノイドボーンを割り当て（キャッシュから複製したメタリグは割り当て済み）
+    if not metarig.data.get(rig_cache.HUMANOID_ASSIGNED_KEY):
+        bpy.ops.vrm.assign_vrm1_humanoid_human_bones_automatically(
+            armature_name = metarig.name
+        )
 
     bpy.ops.vrm.assign_vrm1_humanoid_human_bones_automatically(
         armature_name = vrm_object.name
@@ -282,13 +386,60 @@ def mapping_metarig_and_vrm_model_bones(
     return bone_mapping
 
 
-def remove_or_log_unmapped_metarig_bones(metarig: bpy.types.Object, bone_mapping):
+# 生成前に削除するメタリグの顔ボーンの根と、残す目のボーン
+METARIG_FACE_ROOT_BONE_NAME = "face"
+METARIG_KEPT_FACE_BONE_PATTERNS = [
+    r"^eye\.(L|R)$",       # 目（目のコントロールボーンの生成に必要）
+    r"^lid\.(B|T)\.(L|R)",  # まぶた（skin_eyeリグが目の位置の計算に使用する）
+]
+# 旧形式の顔リグは1つのリグタイプで顔全体を生成するため、一部のボーンだけを削除できない
+LEGACY_FACE_RIG_TYPE = "faces.super_face"
+
+
+def remove_metarig_face_bones(metarig: bpy.types.Object) -> int:
+    """
+    Rigifyリグ生成前にメタリグから顔のサブリグを削除する関数
+    目のボーンは残す。生成後にremoved_rigify_rig_facial_bonesで削除される顔ボーンを
+    あらかじめ取り除くことで、rigify_generateでのボーン・ウィジェット・コンストレイントの生成を省く
+    
+    Args:
+        metarig: Rigifyのメタリグオブジェクト
+        
+    Returns:
+        削除したボーンの数
+    """
+    face_pose_bone = metarig.pose.bones.get(METARIG_FACE_ROOT_BONE_NAME)
+    if face_pose_bone is None:
+        return 0
+    if face_pose_bone.rigify_type == LEGACY_FACE_RIG_TYPE:
+        logger.warning("skip stripping face bones: '%s' face rig can't be partially removed",
+                       LEGACY_FACE_RIG_TYPE)
+        return 0
+
+    armature_metarig: bpy.types.Armature = metarig.data
+    with ModeContext.editing(metarig):
+        edit_bones = armature_metarig.edit_bones
+        face_bone = edit_bones.get(METARIG_FACE_ROOT_BONE_NAME)
+        kept_bone_names = {bone.name for bone in matche_objects_by_name_patterns(
+                                edit_bones, METARIG_KEPT_FACE_BONE_PATTERNS)}
+        # faceボーン直下のサブツリーのうち、目以外をまとめて削除する
+        root_bones = [bone for bone in edit_bones
+                      if bone.parent == face_bone and bone.name not in kept_bone_names]
+        removed_count = remove_edit_bone_subtrees(edit_bones, root_bones)
+
+    conversion_profiler.count("face_bones_stripped", removed_count)
+    return removed_count
+
+
+def remove_or_log_unmapped_metarig_bones(
+        metarig: bpy.types.Object, bone_mapping, strip_face: bool = False):
     """
     VRMモデルにマッピングされていないメタリグのボーンを削除または記録する関数
     
     Args:
         metarig: Rigifyのメタリグオブジェクト
         bone_mapping: ボーンマッピングのリスト（mapping_metarig_and_vrm_model_bones関数の戻り値）
+        strip_face: Trueの場合、目以外の顔ボーンをリグ生成前に削除する
     """
     # マッピングされているメタリグのボーン名のセット
     mapped_metarig_bone_names = set(
@@ -301,6 +452,10 @@ def remove_or_log_unmapped_metarig_bones(metarig: bpy.types.Object, bone_mapping
                                     armature_metarig.edit_bones, [r"^palm.*$"]):
             # print(f"removing: metarig palm bone'{metarig_bone.name}'")
             armature_metarig.edit_bones.remove(metarig_bone)
+
+        # 顔ボーン（目以外）を削除
+        if strip_face:
+            remove_metarig_face_bones(metarig)
         
         # その他のボーンを処理（未マッピングのものは削除またはログ）
         for metarig_bone in armature_metarig.edit_bones:
@@ -441,61 +596,76 @@ def modify_metarig_arm_hand_finger_rotation(metarig: bpy.types.Object):
 #region Rigifyリグの生成と調整関数
 #################################################
 
-def generate_rigify_rig(metarig: bpy.types.Object) -> bpy.types.Object:
+def generate_rigify_rig(metarig: bpy.types.Object, use_cache: bool = True) -> bpy.types.Object:
     """
     メタリグからRigifyリグを生成する関数
+    キャッシュを使う場合は、同じフィンガープリントのメタリグから生成済みのリグを読み込む
     
     Args:
         metarig: Rigifyのメタリグオブジェクト
+        use_cache: 生成済みリグのキャッシュを使うかどうか
         
     Returns:
         生成されたRigifyリグオブジェクト
     """
+    if use_cache:
+        fingerprint = rig_cache.compute_metarig_fingerprint(metarig)
+        rig_object = rig_cache.load_cached_rig(metarig, fingerprint)
+        if rig_object is not None:
+            conversion_profiler.count("rig_cache_hit")
+            return rig_object
+        conversion_profiler.count("rig_cache_miss")
+
     bpy.context.view_layer.objects.active = metarig
     bpy.ops.pose.rigify_generate()
-    return bpy.context.view_layer.objects.active
-
-
-def removed_rigify_rig_facial_bones(rig_object: bpy.types.Object):
+    rig_object = bpy.context.view_layer.objects.active
+    # 再生成ではリグオブジェクトが使い回されるため、DEFボーンのキャッシュを破棄する
+    bone_constraint_utils.invalidate_def_bone_cache(rig_object)
+
+    if use_cache:
+        rig_cache.store_cached_rig(metarig, rig_object, fingerprint)
+
+    return rig_object
+
+
+# Rigifyリグから削除する顔ボーンのパターン
+RIGIFY_RIG_FACIAL_BONE_PATTERNS = [
+    r"^(ORG|DEF)-forehead.*$",       # 額
+    r"^(ORG|DEF)-temple.*$",         # こめかみ
+    r"^((ORG|DEF)-)?brow.*$",        # 眉
+    r"^((MCH|ORG|DEF)-)?lid\.(B|T).*$", # まぶた
+    r"^((ORG|DEF)-)?ear\.(L|R).*$",  # 耳
+    r"^((MCH|ORG|DEF)-)?tongue.*$",  # 舌
+    r"^((ORG|DEF)-)?chin.*$",        # あご
+    r"^((ORG|DEF)-)?cheek\.(B|T).*$", # 頬
+    r"^(ORG-)?teeth\.(B|T)$",        # 歯
+    r"^((ORG|DEF)-)?nose.*$",        # 鼻
+    r"^((ORG|DEF)-)?lip.*$",         # 唇
+    r"^((MCH|ORG|DEF)-)?jaw.*$",     # 顎
+    r"^MCH-mouth_lock$",             # 口制御
+]
+
+
+def removed_rigify_rig_facial_bones(rig_object: bpy.types.Object) -> int:
     """
     Rigifyリグの顔部分のボーンを削除する関数
     VRMモデルでは顔のリギングが異なるため不要なボーンを削除
     
     Args:
         rig_object: Rigifyリグオブジェクト
+        
+    Returns:
+        削除したボーンの数
     """
-    # 削除対象の顔ボーンパターン
-    rig_bones_to_delete_by_name_pattern = [
-        r"^(ORG|DEF)-forehead.*$",       # 額
-        r"^(ORG|DEF)-temple.*$",         # こめかみ
-        r"^((ORG|DEF)-)?brow.*$",        # 眉
-        r"^((MCH|ORG|DEF)-)?lid\.(B|T).*$", # まぶた
-        r"^((ORG|DEF)-)?ear\.(L|R).*$",  # 耳
-        r"^((MCH|ORG|DEF)-)?tongue.*$",  # 舌
-        r"^((ORG|DEF)-)?chin.*$",        # あご
-        r"^((ORG|DEF)-)?cheek\.(B|T).*$", # 頬
-        r"^(ORG-)?teeth\.(B|T)$",        # 歯
-        r"^((ORG|DEF)-)?nose.*$",        # 鼻
-        r"^((ORG|DEF)-)?lip.*$",         # 唇
-        r"^((MCH|ORG|DEF)-)?jaw.*$",     # 顎
-        r"^MCH-mouth_lock$",             # 口制御
-    ]
-
     armature_rig: bpy.types.Armature = rig_object.data
     with ModeContext.editing(rig_object):
-        bones_to_remove = []
-        # 削除対象のボーンとその子孫ボーンを集める
-        for bone_root in matche_objects_by_name_patterns(
-            armature_rig.edit_bones, rig_bones_to_delete_by_name_pattern):
-
-            for bone in bone_root.children_recursive + [bone_root]:
-                if bone not in bones_to_remove:
-                    bones_to_remove.append(bone)
+        # 削除対象のボーンとその子孫ボーンをまとめて削除
+        root_bones = matche_objects_by_name_patterns(
+            armature_rig.edit_bones, RIGIFY_RIG_FACIAL_BONE_PATTERNS)
+        removed_count = remove_edit_bone_subtrees(armature_rig.edit_bones, root_bones)
 
-        # ボーンを削除
-        for bone in bones_to_remove:
-            # print(f"deleting facial bone '{get_full_bone_path(bone)}'")
-            armature_rig.edit_bones.remove(bone)
+    conversion_profiler.count("bones_removed", removed_count)
+    return removed_count
 
 
 def rename_rig_bones_to_match_vrm_model_vertex_groups(
@@ -526,7 +696,8 @@ def rename_rig_bones_to_match_vrm_model_vertex_groups(
             if bone_name_mapping and vrm_bone_name in bone_name_mapping:
                 target_name = bone_name_mapping[vrm_bone_name]
 
-            print(f"renaming bone '{get_full_bone_path(rig_bone)}' to '{target_name}'")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("renaming bone '%s' to '%s'", get_full_bone_path(rig_bone), target_name)
             rig_bone.name = target_name
 
         # Special handling: if a bone exactly matches "root", rename it to "Root"
@@ -535,6 +706,8 @@ def rename_rig_bones_to_match_vrm_model_vertex_groups(
                 bone.name = "Root"
                 break
 
+    bone_constraint_utils.invalidate_def_bone_cache(rig_object)
+
 
 def attach_unmapped_vrm_model_bones_to_rig(
         rig_object: bpy.types.Object, vrm_object: bpy.types.Object, bone_name_mapping=None):
@@ -578,7 +751,8 @@ def attach_unmapped_vrm_model_bones_to_rig(
                 
             # 親ボーンをリグで取得
             parent_bone_in_rig = armature_rig.edit_bones[parent_original_name]
-            print(f"generating bone '{get_full_bone_path(parent_bone_in_rig)}/{original_name}'")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("generating bone '%s/%s'", get_full_bone_path(parent_bone_in_rig), original_name)
             
             # ボーン名を決定（オリジナル名を使用）
             bone_in_rig = armature_rig.edit_bones.new(original_name)
@@ -588,7 +762,7 @@ def attach_unmapped_vrm_model_bones_to_rig(
             
             # Blenderバージョンによる処理分岐
             if blender_version() <= 3:
-                print('Blender version is less than 3')
+                logger.debug("Blender version is less than 3")
                 bone_in_rig.layers = parent_bone_in_rig.layers
                 continue
             if blender_version() >= 4:
@@ -738,11 +912,11 @@ def show_ik_toggle_pole(rig_object: bpy.types.Object):
         if blender_version() >= 5:
             # Blender 5.0以降: Edit Modeでedit_bonesを使って選択
             current_mode = bpy.context.object.mode
-            bpy.ops.object.mode_set(mode='EDIT')
+            set_object_mode('EDIT')
             for bone_name in bones_to_select:
                 if bone_name in rig_object.data.edit_bones:
                     rig_object.data.edit_bones[bone_name].select = True
-            bpy.ops.object.mode_set(mode=current_mode)
+            set_object_mode(current_mode)
         else:
             # Blender 4.x: 従来通りbone.selectを使用
             for bone_name in bones_to_select:
@@ -760,25 +934,43 @@ def update_vertex_groups_to_original_names(mesh_object, bone_name_mapping):
     if bone_name_mapping is None:
         return
 
-    # 名前の衝突を避けるため、元の名前とハッシュ値を記録
-    temp_mapping = {}  # {一時的な名前: (元の標準化名, ターゲット名)}
-
-    # 頂点グループのリネーム（一時的な名前を使用して衝突を避ける）
-    for vg in mesh_object.vertex_groups:
-        if vg.name in bone_name_mapping:
-            # 64文字制限を考慮した短い一時名を生成（ハッシュ値を使用）
-            temp_name = f"_TMP_{hash(vg.name) % 1000000:06d}"
-            temp_mapping[temp_name] = (vg.name, bone_name_mapping[vg.name])
-            vg.name = temp_name
-
-    # 一時的な名前からオリジナルの名前に変更
-    for vg in mesh_object.vertex_groups:
-        if vg.name in temp_mapping:
-            _, target_name = temp_mapping[vg.name]
-            vg.name = target_name
+    rename_vertex_groups_to_original_names([mesh_object], bone_name_mapping)
 
 
-def copy_meshes_between_armatures(vrm_object, rig_object, bone_name_mapping=None):
+def rename_vertex_groups_to_original_names(mesh_objects, bone_name_mapping) -> int:
+    """
+    複数のメッシュの頂点グループ名をまとめてオリジナルのボーン名に更新する関数
+    各頂点グループは1回だけ名前を変更し、一時的な名前は名前の入れ替わり（循環）にのみ使用する
+    同じ頂点グループ構成のメッシュでは変更計画を使い回す
+    
+    Args:
+        mesh_objects: 更新するメッシュオブジェクトのリスト
+        bone_name_mapping: 標準化されたボーン名からオリジナルボーン名へのマッピング辞書
+        
+    Returns:
+        名前を変更した回数
+    """
+    if not bone_name_mapping:
+        return 0
+
+    plans = {}  # {頂点グループ名のタプル: 変更手順}
+    rename_count = 0
+    for mesh_object in mesh_objects:
+        vertex_groups = mesh_object.vertex_groups
+        names = tuple(vg.name for vg in vertex_groups)
+        if names not in plans:
+            steps, conflicts = rename_planner.plan_renames(names, bone_name_mapping)
+            for name in conflicts:
+                logger.warning("vertex group '%s' of '%s' can't be renamed to '%s': the name is already used",
+                               name, mesh_object.name, bone_name_mapping[name])
+            plans[names] = steps
+        rename_count += rename_planner.apply_renames(vertex_groups, plans[names])
+
+    conversion_profiler.count("vertex_group_renames", rename_count)
+    return rename_count
+
+
+def copy_meshes_between_armatures(vrm_object, rig_object, bone_name_mapping=None, copy_mesh_data=False):
     """
     VRMモデルのメッシュをRigifyリグにコピーする関数
     
@@ -786,21 +978,95 @@ def copy_meshes_between_armatures(vrm_object, rig_object, bone_name_mapping=None
         vrm_object: VRMモデルのアーマチュアオブジェクト
         rig_object: Rigifyリグオブジェクト
         bone_name_mapping: 標準化されたボーン名からオリジナルボーン名へのマッピング辞書
+        copy_mesh_data: メッシュデータもコピーする（コピー後にウェイトを編集する場合、
+            Blender 3.0以降はウェイトと頂点グループ名がメッシュデータにあるため、元のモデルを変更しないよう必要）
+        
+    Returns:
+        VRMモデルのメッシュオブジェクト名からコピーしたメッシュオブジェクト名へのマッピング辞書
     """
     # VRMモデルの子メッシュオブジェクトをすべてコピー
+    new_meshes = []
+    world_matrices = []
+    mesh_object_mapping = {}
     for vrm_child in vrm_object.children:
         if vrm_child.type == 'MESH':
             new_mesh = vrm_child.copy()
+            if copy_mesh_data:
+                new_mesh.data = vrm_child.data.copy()
             
             # 新しいメッシュをコレクションに追加
             bpy.context.collection.objects.link(new_mesh)
-            
-            # 頂点グループ名をオリジナルのボーン名に更新
-            update_vertex_groups_to_original_names(new_mesh, bone_name_mapping)
-            
-            # 新しいメッシュをRigifyリグの子に設定
-            new_mesh.parent = rig_object
-            bpy.ops.object.parent_set(type='ARMATURE', keep_transform=True)
+            new_meshes.append(new_mesh)
+            world_matrices.append(vrm_child.matrix_world.copy())
+            mesh_object_mapping[vrm_child.name] = new_mesh.name
+    
+    # 頂点グループ名をすべてのメッシュでまとめてオリジナルのボーン名に更新
+    rename_vertex_groups_to_original_names(new_meshes, bone_name_mapping)
+    
+    # 新しいメッシュをまとめてRigifyリグの子に設定
+    parent_meshes_to_armature(new_meshes, rig_object, world_matrices)
+    conversion_profiler.count("mesh_objects_copied", len(new_meshes))
+    return mesh_object_mapping
+
+
+def move_meshes_between_armatures(vrm_object, rig_object, bone_name_mapping=None):
+    """
+    VRMモデルのメッシュをコピーせずにRigifyリグへ移動する関数
+    アーマチュアモディファイアの対象を変更し、頂点グループ名をその場で更新してから親を付け替える
+    オブジェクト・モディファイア・頂点グループが複製されないため、シーンと.blendのサイズが増えない
+    ※移動後のVRMモデルのアーマチュアにはメッシュが残らない
+    
+    Args:
+        vrm_object: VRMモデルのアーマチュアオブジェクト
+        rig_object: Rigifyリグオブジェクト
+        bone_name_mapping: 標準化されたボーン名からオリジナルボーン名へのマッピング辞書
+        
+    Returns:
+        VRMモデルのメッシュオブジェクト名から移動後のメッシュオブジェクト名へのマッピング辞書（名前は変わらない）
+    """
+    mesh_objects = [vrm_child for vrm_child in vrm_object.children if vrm_child.type == 'MESH']
+    
+    # 頂点グループ名をすべてのメッシュでまとめてオリジナルのボーン名に更新
+    rename_vertex_groups_to_original_names(mesh_objects, bone_name_mapping)
+    
+    # メッシュをまとめてRigifyリグの子に付け替え（アーマチュアモディファイアの対象も変更）
+    parent_meshes_to_armature(mesh_objects, rig_object)
+    
+    # コピーした場合に複製されていたデータ量を記録
+    conversion_profiler.count("mesh_objects_moved", len(mesh_objects))
+    conversion_profiler.count("modifiers_not_copied", sum(len(mesh.modifiers) for mesh in mesh_objects))
+    conversion_profiler.count("vertex_groups_not_copied", sum(len(mesh.vertex_groups) for mesh in mesh_objects))
+    return {mesh.name: mesh.name for mesh in mesh_objects}
+
+
+def parent_meshes_to_armature(mesh_objects, armature_object, world_matrices=None):
+    """
+    メッシュをアーマチュアの子に設定する関数（parent_set(type='ARMATURE', keep_transform=True)相当）
+    オペレーターを使わずにデータAPIで親・親の逆行列・アーマチュアモディファイアを設定するため、
+    選択状態に依存せず、メッシュごとのビューレイヤー更新も発生しない
+    
+    Args:
+        mesh_objects: メッシュオブジェクトのリスト
+        armature_object: 親にするアーマチュアオブジェクト
+        world_matrices: 維持するワールド行列のリスト（Noneの場合は各メッシュの現在のワールド行列）
+    """
+    if world_matrices is None:
+        world_matrices = [mesh.matrix_world.copy() for mesh in mesh_objects]
+    parent_inverse = armature_object.matrix_world.inverted()
+    
+    for mesh, world_matrix in zip(mesh_objects, world_matrices):
+        mesh.parent = armature_object
+        mesh.parent_type = 'OBJECT'
+        mesh.matrix_parent_inverse = parent_inverse
+        # 親の逆行列を設定したうえでワールド行列を元に戻す（keep_transform）
+        mesh.matrix_world = world_matrix
+        
+        # アーマチュアモディファイアの対象を新しいアーマチュアにする（なければ追加）
+        armature_modifiers = [m for m in mesh.modifiers if m.type == 'ARMATURE']
+        if not armature_modifiers:
+            armature_modifiers = [mesh.modifiers.new(name="Armature", type='ARMATURE')]
+        for modifier in armature_modifiers:
+            modifier.object = armature_object
 
 
 def change_meshes_modifier_object(rig_object):
@@ -818,10 +1084,32 @@ def change_meshes_modifier_object(rig_object):
                     modifier.object = bpy.data.objects.get(rig_object.name)
 
 
+# Unity向けに目のボーンに設定する親とコピー元のボーン
+UNITY_EYE_BONE_ADJUSTMENTS = {
+    "J_Adj_L_FaceEye": {"parent": "J_Bip_C_Head", "target": "MCH-eye.L"},
+    "J_Adj_R_FaceEye": {"parent": "J_Bip_C_Head", "target": "MCH-eye.R"}
+}
+
+
 def adjust_bone_hierarchy_and_constraints_for_Unity(rig_object):
     """
     Unity向けにRigifyモデルのボーン階層と制約を調整する関数
     
+    Args:
+        rig_object: Rigifyリグオブジェクト
+    """
+    armature_data = rig_object.data
+    if not isinstance(armature_data, bpy.types.Armature):
+        return
+
+    adjust_bone_hierarchy_for_Unity(rig_object)
+    add_eye_bone_constraints_for_Unity(rig_object)
+
+
+def adjust_bone_hierarchy_for_Unity(rig_object):
+    """
+    Unity向けにRigifyモデルのボーン階層を調整する関数（編集モードで行う部分）
+    
     Args:
         rig_object: Rigifyリグオブジェクト
     """
@@ -857,12 +1145,7 @@ def adjust_bone_hierarchy_and_constraints_for_Unity(rig_object):
                 armature_data.edit_bones[bone_name].parent = armature_data.edit_bones[parent_name]
 
         # 目のボーンの調整
-        eye_bone_adjustments = {
-            "J_Adj_L_FaceEye": {"parent": "J_Bip_C_Head", "target": "MCH-eye.L"},
-            "J_Adj_R_FaceEye": {"parent": "J_Bip_C_Head", "target": "MCH-eye.R"}
-        }
-
-        for bone_name, adjustment in eye_bone_adjustments.items():
+        for bone_name, adjustment in UNITY_EYE_BONE_ADJUSTMENTS.items():
             if bone_name not in armature_data.edit_bones:
                 continue
 
@@ -870,10 +1153,16 @@ def adjust_bone_hierarchy_and_constraints_for_Unity(rig_object):
             if adjustment['parent'] in armature_data.edit_bones:
                 armature_data.edit_bones[bone_name].parent = armature_data.edit_bones[adjustment['parent']]
 
-    # ボーンコレクションと制約の設定（ポーズモードで行う）
-    bpy.ops.object.mode_set(mode='POSE')
+
+def add_eye_bone_constraints_for_Unity(rig_object):
+    """
+    Unity向けに目のボーンをDEFコレクションに追加し、制約を設定する関数
+    編集モード以外で呼び出すこと（ポーズボーンを使用するため）
     
-    for bone_name, adjustment in eye_bone_adjustments.items():
+    Args:
+        rig_object: Rigifyリグオブジェクト
+    """
+    for bone_name, adjustment in UNITY_EYE_BONE_ADJUSTMENTS.items():
         pose_bone = rig_object.pose.bones.get(bone_name)
         if not pose_bone:
             continue
@@ -891,8 +1180,6 @@ def adjust_bone_hierarchy_and_constraints_for_Unity(rig_object):
             constraint.target = rig_object
             constraint.subtarget = target_bone
 
-    bpy.ops.object.mode_set(mode='OBJECT')
-
 #endregion
 
 #################################################
@@ -909,179 +1196,367 @@ def setup_rig_constraint_drivers(rig_object):
         bool: True if drivers were added successfully
     """
     if rig_object.type != 'ARMATURE':
-        print("Object is not an armature. Cannot set up constraint drivers.")
+        logger.warning("Object is not an armature. Cannot set up constraint drivers.")
         return False
         
     # Add the custom property for global influence control if it doesn't exist
-    if 'constraint_influence' not in rig_object:
-        rig_object['constraint_influence'] = 1.0
-        # Add property metadata for UI
-        try:
-            ui_data = rig_object.id_properties_ui('constraint_influence')
-            ui_data.update(min=0.0, max=1.0, soft_min=0.0, soft_max=1.0, 
-                           description="Global influence of DEF bone constraints")
-        except (AttributeError, TypeError):
-            # Older Blender versions have different API
-            pass
+    constraint_driver_utils.ensure_constraint_influence_property(rig_object)
     
     # Add drivers to all constraints in DEF bone collection
     result = constraint_driver_utils.add_constraint_influence_drivers(rig_object)
     
-    print(f"Added constraint drivers to {len(result)} bones in {rig_object.name}")
+    logger.info("Added constraint drivers to %d bones in %s", len(result), rig_object.name)
     return bool(result)
 
+
+def setup_rig_constraint_influence_property(rig_object):
+    """
+    Set up driverless control of the DEF bone constraint influence.
+    The influence is stored in the Object property registered by the addon, whose
+    update callback writes it to all DEF constraints at once, so no drivers are
+    evaluated during playback.
+    Unlike drivers, the update callback does not run when the property is animated.
+    
+    Args:
+        rig_object: The Rigify rig object
+        
+    Returns:
+        bool: True if the rig has DEF bones to control
+    """
+    if rig_object.type != 'ARMATURE':
+        logger.warning("Object is not an armature. Cannot set up constraint influence.")
+        return False
+    
+    # プロパティの登録の有無に関わらず値を保存できるよう、IDプロパティとして直接設定する
+    rig_object[bone_constraint_utils.CONSTRAINT_INFLUENCE_PROPERTY] = 1.0
+    changed_count = bone_constraint_utils.set_def_constraint_influence(rig_object, 1.0)
+    
+    has_def_bones = bone_constraint_utils.get_def_pose_bones(rig_object) is not None
+    logger.info("Set up driverless constraint influence on %s (%d constraints updated)",
+                rig_object.name, changed_count)
+    return has_def_bones
+
 #endregion
 
+
 #################################################
-#region Debug
+#region メッシュのウェイト調整
 #################################################
-def debug_bone_name_mapping(original_bone_names, bone_name_mapping, vrm_object):
+def get_rig_mesh_objects(rig_object):
     """
-    bone_name_mappingの内容を詳細に検証するデバッグ関数
+    Rigifyリグの子メッシュオブジェクトを取得する関数
     
     Args:
-        original_bone_names: 標準化前のオリジナルボーン名の辞書
-        bone_name_mapping: 標準化後のボーン名からオリジナルボーン名へのマッピング辞書
-        vrm_object: VRMモデルのアーマチュアオブジェクト
+        rig_object: Rigifyリグオブジェクト
+        
+    Returns:
+        メッシュオブジェクトのリスト
     """
-    print("\n==== BONE NAME MAPPING DEBUG ====")
-    
-    # 1. オリジナルボーン名の一覧を表示
-    print("\n[Original Bone Names before standardization]")
-    for i, (bone_name, original_name) in enumerate(original_bone_names.items()):
-        print(f"{i}: {bone_name} -> {original_name}")
+    return [rig_child for rig_child in rig_object.children if rig_child.type == 'MESH']
+
+
+def make_mesh_data_single_user(mesh_object):
+    """
+    メッシュデータを他のオブジェクトと共有している場合に、単独のコピーに置き換える関数
+    ウェイトと頂点グループ名はメッシュデータにあるため、編集前に呼び出して共有先（元のVRMモデルなど）を変更しないようにする
     
-    # 2. 標準化後のアーマチュアのボーン一覧を表示
-    print("\n[Current Armature Bones after standardization]")
-    for i, bone in enumerate(vrm_object.data.bones):
-        print(f"{i}: {bone.name}")
+    Args:
+        mesh_object: メッシュオブジェクト
+        
+    Returns:
+        メッシュデータをコピーした場合はTrue
+    """
+    if mesh_object.data.users <= 1:
+        return False
+    mesh_object.data = mesh_object.data.copy()
+    conversion_profiler.count("mesh_data_copied")
+    return True
+
+
+def merge_orphan_vertex_weights(rig_object, vrm_object, mesh_objects=None):
+    """
+    リグに存在しないボーンの頂点グループのウェイトを、VRMモデルのボーン階層で最も近い
+    リグの変形ボーンの頂点グループに統合する関数
+    統合したウェイトを含む頂点は変形ボーンのウェイトの合計が1になるよう正規化し、統合元の頂点グループは削除する
+    統合先が見つからない頂点グループはそのまま残し、警告を出力する
+    ※restore_original_bone_namesの後に呼び出すこと（VRMモデルのボーン名と頂点グループ名を一致させるため）
     
-    # 3. 作成されたマッピングの内容を表示
-    print("\n[Generated Bone Name Mapping]")
-    if bone_name_mapping:
-        for i, (std_name, orig_name) in enumerate(bone_name_mapping.items()):
-            print(f"{i}: {std_name} -> {orig_name}")
-    else:
-        print("Warning: bone_name_mapping is empty or None!")
-    
-    # 4. VRM規定外ボーンの検出
-    print("\n[Custom/Non-Standard VRM Bones Check]")
-    custom_bone_keywords = ["bust", "breast", "chest", "tail", "hair", "skirt", "sleeve"]
-    
-    # オリジナルボーン名から探す
-    print("In original bones:")
-    found_custom_bones = []
-    for bone_name in original_bone_names.keys():
-        for keyword in custom_bone_keywords:
-            if keyword.lower() in bone_name.lower():
-                print(f"Found potential custom bone: {bone_name}")
-                found_custom_bones.append(bone_name)
-                break
+    Args:
+        rig_object: Rigifyリグオブジェクト
+        vrm_object: VRMモデルのアーマチュアオブジェクト（ボーン階層の参照元）
+        mesh_objects: 対象のメッシュオブジェクトのリスト（Noneの場合はリグの子メッシュ）
+        
+    Returns:
+        メッシュごとの統合結果のレポート
+    """
+    if mesh_objects is None:
+        mesh_objects = get_rig_mesh_objects(rig_object)
     
-    # 現在のアーマチュアから探す
-    print("\nIn current armature:")
-    for bone in vrm_object.data.bones:
-        for keyword in custom_bone_keywords:
-            if keyword.lower() in bone.name.lower() and bone.name not in found_custom_bones:
-                print(f"Found potential custom bone: {bone.name}")
-                break
+    rig_bone_names = {bone.name for bone in rig_object.data.bones}
+    deform_bone_names = {bone.name for bone in rig_object.data.bones if bone.use_deform}
+    # リグに存在しないボーンはVRMモデルの階層で祖先をたどる
+    parent_of = {bone.name: bone.parent.name if bone.parent else None for bone in vrm_object.data.bones}
     
-    # 5. マッピングに含まれているか確認
-    print("\n[Custom Bones in Mapping]")
-    for bone_name in found_custom_bones:
-        # 標準化後のボーン名を探す
-        standardized_name = None
-        for std_name, orig_name in bone_name_mapping.items():
-            if orig_name == bone_name:
-                standardized_name = std_name
-                break
+    report = {"meshes": []}
+    for mesh_object in mesh_objects:
+        vertex_groups = mesh_object.vertex_groups
+        orphan_names = [vg.name for vg in vertex_groups if vg.name in parent_of and vg.name not in rig_bone_names]
+        if not orphan_names:
+            continue
         
-        if standardized_name:
-            print(f"Custom bone '{bone_name}' is mapped as '{standardized_name}'")
-        else:
-            print(f"Warning: Custom bone '{bone_name}' is NOT in the mapping!")
+        ancestors = vertex_weight_utils.find_nearest_ancestors(orphan_names, parent_of, deform_bone_names)
+        unresolved = [name for name in orphan_names if ancestors[name] is None]
+        for name in unresolved:
+            logger.warning("vertex group '%s' of '%s' has no deforming ancestor in the rig", name, mesh_object.name)
+        merged = {name: ancestor for name, ancestor in ancestors.items() if ancestor is not None}
+        if not merged:
+            report["meshes"].append({"mesh": mesh_object.name, "merged": {}, "unresolved": unresolved,
+                                     "vertices_reweighted": 0})
+            continue
+        
+        # 統合先の頂点グループがなければ先に作成してからウェイトを読み込む
+        make_mesh_data_single_user(mesh_object)
+        vertex_groups = mesh_object.vertex_groups
+        for ancestor in set(merged.values()):
+            if ancestor not in vertex_groups:
+                vertex_groups.new(name=ancestor)
+        weights = vertex_weight_utils.read_vertex_weights(mesh_object)
+        group_targets = {vertex_groups[name].index: vertex_groups[ancestor].index for name, ancestor in merged.items()}
+        
+        # 統合したウェイトを含む頂点だけを正規化する
+        affected = np.zeros(weights.vertex_count, dtype=bool)
+        affected[weights.vertex_index[np.isin(weights.group_index, list(group_targets))]] = True
+        new_weights = vertex_weight_utils.merge_vertex_groups(weights, group_targets)
+        new_weights = vertex_weight_utils.normalize_vertex_weights(
+            new_weights, weights.group_mask(deform_bone_names), affected)
+        changed_vertices = vertex_weight_utils.write_vertex_weights(mesh_object, weights, new_weights)
+        
+        for name in merged:
+            vertex_groups.remove(vertex_groups[name])
+        conversion_profiler.count("orphan_groups_merged", len(merged))
+        
+        logger.info("Merged %d orphan vertex groups of %s into rig bones (%d vertices reweighted)",
+                    len(merged), mesh_object.name, changed_vertices)
+        report["meshes"].append({
+            "mesh": mesh_object.name,
+            "merged": merged,
+            "unresolved": unresolved,
+            "vertices_reweighted": changed_vertices,
+        })
     
-    print("\n==== END OF BONE NAME MAPPING DEBUG ====\n")
+    return report
 
 
-def debug_attach_unmapped_bones(rig_object, vrm_object, bone_name_mapping):
+def limit_vertex_weight_influences(rig_object, max_influences=4, min_weight=0.0, mesh_objects=None):
     """
-    非マッピングボーンのアタッチ処理をデバッグする関数
+    メッシュの各頂点の変形ボーンのウェイト数を制限し、小さいウェイトを削除する関数
+    Unityのスキニング（Quality設定のBlend Weights）と同じ結果をBlender上で確認でき、出力データも小さくなる
+    ウェイトを削除した頂点は正規化し、各頂点の最大のウェイトは必ず残す
     
     Args:
         rig_object: Rigifyリグオブジェクト
-        vrm_object: VRMモデルのアーマチュアオブジェクト
-        bone_name_mapping: 標準化されたボーン名からオリジナルボーン名へのマッピング辞書
+        max_influences: 1頂点あたりのウェイト数の上限（0の場合は制限しない）
+        min_weight: これより小さいウェイトを削除する
+        mesh_objects: 対象のメッシュオブジェクトのリスト（Noneの場合はリグの子メッシュ）
+        
+    Returns:
+        メッシュごとの処理前後のウェイト数（1頂点あたりの最大・平均）のレポート
     """
-    print("\n==== ATTACH UNMAPPED BONES DEBUG ====")
+    if mesh_objects is None:
+        mesh_objects = get_rig_mesh_objects(rig_object)
+    deform_bone_names = {bone.name for bone in rig_object.data.bones if bone.use_deform}
     
-    armature_rig = rig_object.data
-    armature_vrm = vrm_object.data
+    report = {"max_influences": max_influences, "min_weight": min_weight, "meshes": []}
+    for mesh_object in mesh_objects:
+        weights = vertex_weight_utils.read_vertex_weights(mesh_object)
+        group_mask = weights.group_mask(deform_bone_names)
+        new_weights = vertex_weight_utils.limit_vertex_influences(weights, max_influences, min_weight, group_mask)
+        changed_vertices = 0
+        if new_weights is not weights:
+            make_mesh_data_single_user(mesh_object)
+            changed_vertices = vertex_weight_utils.write_vertex_weights(mesh_object, weights, new_weights)
+        
+        before = vertex_weight_utils.influence_stats(weights, group_mask)
+        after = vertex_weight_utils.influence_stats(new_weights, group_mask)
+        conversion_profiler.count("weights_pruned", before["weights"] - after["weights"])
+        logger.info("Limited influences of %s: max %d -> %d, average %.2f -> %.2f",
+                    mesh_object.name, before["max"], after["max"], before["average"], after["average"])
+        report["meshes"].append({
+            "mesh": mesh_object.name,
+            "before": before,
+            "after": after,
+            "vertices_reweighted": changed_vertices,
+        })
+    
+    return report
+
+
+def strip_unweighted_deform_data(rig_object, remove_empty_groups=True, disable_unweighted_bones=False,
+                                 mesh_objects=None):
+    """
+    どのメッシュにもウェイトのない頂点グループと変形ボーンを整理する関数
+    ボーン×メッシュのウェイト合計の行列から、ウェイトのないボーンを判定する
+    UnityではSkinned Meshが参照するボーン数とフレームごとのボーン変換の数が減る
     
-    # 1. VRMの全ボーン一覧
-    print("\n[All VRM Bones]")
-    vrm_bone_names = [bone.name for bone in armature_vrm.bones]
-    for i, bone_name in enumerate(vrm_bone_names):
-        parent_name = armature_vrm.bones[bone_name].parent.name if armature_vrm.bones[bone_name].parent else "None"
-        print(f"{i}: {bone_name} (Parent: {parent_name})")
-    
-    # 2. 既にリグに含まれているボーン
-    print("\n[Bones Already in Rig]")
-    rig_bone_names = [bone.name for bone in armature_rig.bones]
-    for i, bone_name in enumerate(rig_bone_names):
-        print(f"{i}: {bone_name}")
-    
-    # 3. アタッチ候補となるボーン
-    print("\n[Potential Bones to Attach]")
-    for vrm_bone in armature_vrm.bones:
-        bone_already_in_rig = vrm_bone.name in rig_bone_names
-        vrm_bone_has_parent = bool(vrm_bone.parent)
+    Args:
+        rig_object: Rigifyリグオブジェクト
+        remove_empty_groups: ボーン名の頂点グループのうち、ウェイトのないものを削除する
+        disable_unweighted_bones: ウェイトがなく、変形する子孫ボーンもない変形ボーンを非変形にする
+        mesh_objects: 対象のメッシュオブジェクトのリスト（Noneの場合はリグの子メッシュ）
         
-        if bone_already_in_rig:
-            print(f"Skip - Already in rig: {vrm_bone.name}")
-            continue
-        if not vrm_bone_has_parent:
-            print(f"Skip - No parent: {vrm_bone.name}")
-            continue
-            
-        vrm_bone_parent_name = vrm_bone.parent.name
-        parent_exists_in_rig = vrm_bone_parent_name in rig_bone_names
+    Returns:
+        処理前後の変形ボーン数、メッシュごとのボーン数と削除した頂点グループのレポート
+    """
+    if mesh_objects is None:
+        mesh_objects = get_rig_mesh_objects(rig_object)
+    bones = rig_object.data.bones
+    bone_names = [bone.name for bone in bones]
+    rig_bone_names = set(bone_names)
+    deform_bone_names = {bone.name for bone in bones if bone.use_deform}
+    
+    mesh_weights = [vertex_weight_utils.read_vertex_weights(mesh_object) for mesh_object in mesh_objects]
+    weight_matrix = vertex_weight_utils.bone_weight_matrix(bone_names, mesh_weights)
+    weighted_bone_names = {bone_names[row] for row in np.flatnonzero(weight_matrix.sum(axis=1) > 0)}
+    
+    report = {"deform_bones_before": len(deform_bone_names), "meshes": [], "bones_disabled": []}
+    for column, (mesh_object, weights) in enumerate(zip(mesh_objects, mesh_weights)):
+        mesh_bone_names = [name for name in weights.group_names if name in deform_bone_names]
+        weighted = {bone_names[row] for row in np.flatnonzero(weight_matrix[:, column] > 0)}
+        removed_groups = []
+        if remove_empty_groups:
+            removed_groups = [name for name in weights.group_names if name in rig_bone_names and name not in weighted]
+            if removed_groups:
+                make_mesh_data_single_user(mesh_object)
+            vertex_groups = mesh_object.vertex_groups
+            for name in removed_groups:
+                vertex_groups.remove(vertex_groups[name])
+        report["meshes"].append({
+            "mesh": mesh_object.name,
+            "bones_before": len(mesh_bone_names),
+            "bones_after": sum(name in weighted for name in mesh_bone_names),
+            "vertex_groups_removed": removed_groups,
+        })
+        conversion_profiler.count("vertex_groups_removed", len(removed_groups))
+    
+    if disable_unweighted_bones:
+        # 子から順に判定し、変形する子孫ボーンが残っていないボーンだけを非変形にする
+        deforming = set(deform_bone_names)
+        for bone in sorted(bones, key=lambda b: len(b.parent_recursive), reverse=True):
+            if (bone.name in deforming and bone.name not in weighted_bone_names
+                    and not any(child.name in deforming for child in bone.children)):
+                bone.use_deform = False
+                deforming.discard(bone.name)
+                report["bones_disabled"].append(bone.name)
+        conversion_profiler.count("bones_disabled", len(report["bones_disabled"]))
+    
+    report["deform_bones_after"] = sum(bone.use_deform for bone in bones)
+    logger.info("Deform bones of %s: %d -> %d (%d vertex groups removed)",
+                rig_object.name, report["deform_bones_before"], report["deform_bones_after"],
+                sum(len(mesh["vertex_groups_removed"]) for mesh in report["meshes"]))
+    return report
+
+
+def split_mesh_by_bone_budget(mesh_object, max_bones, deform_bone_names):
+    """
+    1つのメッシュを、参照するボーン数がmax_bones以下のパーツに分割する関数
+    面が頂点を通して参照するボーンの組（シグネチャ）ごとに面をまとめ、シグネチャをパーツに詰める
+    パーツ0は元のオブジェクトのまま残し（VRM拡張情報などの参照を維持）、他のパーツはコピーしたオブジェクトになる
+    各パーツには自分の面と、参照するボーンの頂点グループだけを残す
+    
+    Args:
+        mesh_object: メッシュオブジェクト
+        max_bones: 1パーツあたりのボーン数の上限
+        deform_bone_names: 変形ボーン名の集合
         
-        if not parent_exists_in_rig:
-            print(f"Skip - Parent not in rig: {vrm_bone.name} (Parent: {vrm_bone_parent_name})")
-            continue
-            
-        # マッピングを適用するかどうかの決定
-        bone_name = vrm_bone.name
-        mapped_name = None
-        if bone_name_mapping and bone_name in bone_name_mapping:
-            mapped_name = bone_name_mapping[bone_name]
-            print(f"Will attach: {vrm_bone.name} -> {mapped_name} (Parent: {vrm_bone_parent_name})")
-        else:
-            print(f"Will attach: {vrm_bone.name} (No mapping) (Parent: {vrm_bone_parent_name})")
+    Returns:
+        メッシュのレポート（分割前のボーン数、パーツごとの面数とボーン数、上限を超える面の数）
+    """
+    weights = vertex_weight_utils.read_vertex_weights(mesh_object)
+    group_mask = weights.group_mask(deform_bone_names)
+    loop_start, loop_total, loop_vertex = vertex_weight_utils.read_face_vertices(mesh_object)
+    group_indices, signatures, face_signature = vertex_weight_utils.face_bone_signatures(
+        weights, loop_start, loop_total, loop_vertex, group_mask)
+    mesh_report = {"mesh": mesh_object.name, "bones": len(group_indices), "parts": []}
+    if len(group_indices) <= max_bones:
+        return mesh_report
     
-    # 4. 特定のカスタムボーン（Bustなど）を詳細に確認
-    print("\n[Custom Bones Detailed Check]")
-    custom_bone_keywords = ["bust", "breast", "chest", "tail", "hair", "skirt", "sleeve"]
+    face_counts = np.bincount(face_signature, minlength=len(signatures))
+    signature_part, over_budget = vertex_weight_utils.pack_signatures_first_fit(signatures, max_bones, face_counts)
+    face_part = signature_part[face_signature]
+    mesh_report["faces_over_budget"] = int(face_counts[over_budget].sum())
+    if over_budget:
+        logger.warning("%d faces of %s reference more than %d bones and are kept in their own parts",
+                       mesh_report["faces_over_budget"], mesh_object.name, max_bones)
     
-    for keyword in custom_bone_keywords:
-        for vrm_bone in armature_vrm.bones:
-            if keyword.lower() in vrm_bone.name.lower():
-                bone_already_in_rig = vrm_bone.name in rig_bone_names
-                vrm_bone_has_parent = bool(vrm_bone.parent)
-                parent_name = vrm_bone.parent.name if vrm_bone_has_parent else "None"
-                parent_exists_in_rig = parent_name in rig_bone_names if vrm_bone_has_parent else False
-                
-                print(f"Custom bone: {vrm_bone.name}")
-                print(f"  - Already in rig: {bone_already_in_rig}")
-                print(f"  - Has parent: {vrm_bone_has_parent} ({parent_name})")
-                print(f"  - Parent in rig: {parent_exists_in_rig}")
-                
-                if bone_name_mapping and vrm_bone.name in bone_name_mapping:
-                    print(f"  - Mapped to: {bone_name_mapping[vrm_bone.name]}")
-                else:
-                    print(f"  - Not in mapping")
-                    
-    print("\n==== END OF ATTACH UNMAPPED BONES DEBUG ====\n")
+    # 他のオブジェクトとメッシュデータを共有している場合は、元のメッシュを変更しないよう単独のデータにする
+    make_mesh_data_single_user(mesh_object)
+    
+    # 面を削除する前に、元のオブジェクトからパーツ1以降のオブジェクトを作成する
+    part_objects = [mesh_object]
+    for part in range(1, int(face_part.max()) + 1):
+        part_object = mesh_object.copy()
+        part_object.data = mesh_object.data.copy()
+        part_name = f"{mesh_object.name}.part{part}"
+        part_object.name = part_name
+        # 同名のオブジェクトがあると別の名前（.001など）が付くため、実際の名前を読み直して使う
+        if part_object.name != part_name:
+            logger.warning("mesh part '%s' already exists, the part is named '%s'", part_name, part_object.name)
+        for collection in mesh_object.users_collection:
+            collection.objects.link(part_object)
+        part_objects.append(part_object)
+    
+    for part, part_object in enumerate(part_objects):
+        # パーツに含まれない面を削除（その面だけが使う辺と頂点も削除される）
+        bm = bmesh.new()
+        bm.from_mesh(part_object.data)
+        bm.faces.ensure_lookup_table()
+        bmesh.ops.delete(bm, geom=[bm.faces[i] for i in np.flatnonzero(face_part != part).tolist()], context='FACES')
+        bm.to_mesh(part_object.data)
+        bm.free()
+        
+        # パーツが参照しないボーンの頂点グループを削除
+        part_signatures = np.unique(face_signature[face_part == part])
+        used_groups = set(group_indices[np.any(signatures[part_signatures], axis=0)].tolist())
+        vertex_groups = part_object.vertex_groups
+        for name in [name for i, name in enumerate(weights.group_names) if group_mask[i] and i not in used_groups]:
+            vertex_groups.remove(vertex_groups[name])
+        
+        mesh_report["parts"].append({
+            "mesh": part_object.name,
+            "faces": int(np.count_nonzero(face_part == part)),
+            "bones": len(used_groups),
+        })
+    
+    conversion_profiler.count("mesh_parts_created", len(part_objects) - 1)
+    logger.info("Split %s (%d bones) into %d parts of at most %d bones",
+                mesh_object.name, len(group_indices), len(part_objects), max_bones)
+    return mesh_report
 
 
+def split_meshes_by_bone_budget(rig_object, max_bones, mesh_objects=None):
+    """
+    参照するボーン数が上限を超えるメッシュを、上限以下のパーツに分割する関数
+    
+    Args:
+        rig_object: Rigifyリグオブジェクト
+        max_bones: 1メッシュあたりのボーン数の上限
+        mesh_objects: 対象のメッシュオブジェクトのリスト（Noneの場合はリグの子メッシュ）
+        
+    Returns:
+        メッシュごとの分割結果のレポート
+        mesh_partsには分割したメッシュのオブジェクト名から追加パーツのオブジェクト名リストへのマッピングが入る
+        （copy_vrm_extension_from_armatureで表情と一人称設定をパーツにも適用するために使う）
+    """
+    if mesh_objects is None:
+        mesh_objects = get_rig_mesh_objects(rig_object)
+    deform_bone_names = {bone.name for bone in rig_object.data.bones if bone.use_deform}
+    
+    report = {"max_bones": max_bones, "meshes": [], "mesh_parts": {}}
+    for mesh_object in mesh_objects:
+        mesh_report = split_mesh_by_bone_budget(mesh_object, max_bones, deform_bone_names)
+        report["meshes"].append(mesh_report)
+        if len(mesh_report["parts"]) > 1:
+            report["mesh_parts"][mesh_object.name] = [part["mesh"] for part in mesh_report["parts"][1:]]
+    return report
+
+#endregion